@@ -0,0 +1,105 @@
+"""
+基于内容哈希的增量提取缓存
+
+每个源文件一个缓存条目，键由以下部分组成：
+- 文件内容哈希
+- 可见文件集合的指纹（每个可见文件的实体摘要，头文件变化或实体ID变化都会使其失效）
+- 该文件的宏展开条目
+- 全局函数索引与 extern 函数集合的摘要：CALLS 解析中 extern 函数和调用者的回退不按可见性过滤，
+  会用到可见集合之外的函数，因此任一文件的函数实体（ID、文件、是否声明）或 extern 集合变化都会使缓存失效
+只有内容或可见头文件发生变化的文件才会重新提取。
+"""
+import os
+import json
+import pickle
+import hashlib
+
+# 提取逻辑变化时递增，使所有旧缓存失效
+CACHE_VERSION = 4
+
+
+def _digest(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8', errors='ignore')
+        h.update(part)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def build_entity_digests(file_to_entities):
+    """文件路径 -> 该文件实体（ID、类型、名称、作用域、是否声明）的摘要，每次运行只计算一次"""
+    digests = {}
+    for path, entities in file_to_entities.items():
+        rows = sorted(
+            (str(e.get('id')), e.get('type', ''), str(e.get('name', '')), str(e.get('scope', '')), str(e.get('is_declaration', '')))
+            for e in entities
+        )
+        digests[path] = _digest(json.dumps(rows, ensure_ascii=False))
+    return digests
+
+
+def build_function_index_digest(function_id_map, entity_file_map, all_entities, extern_functions):
+    """全局函数索引（名称 -> 候选ID、所在文件、是否声明，保持候选顺序）与 extern 集合的摘要，每次运行只计算一次"""
+    declaration_ids = {
+        e.get('id') for e in all_entities or ()
+        if e.get('type') == 'FUNCTION' and e.get('is_declaration', False)
+    }
+    rows = []
+    for name in sorted(function_id_map or {}, key=str):
+        ids = function_id_map[name]
+        if not isinstance(ids, (list, tuple)):
+            ids = [ids] if ids else []
+        rows.append((str(name), [(str(i), entity_file_map.get(i, ''), i in declaration_ids) for i in ids]))
+    return _digest(
+        json.dumps(rows, ensure_ascii=False, default=str),
+        json.dumps(sorted(map(str, extern_functions or ())), ensure_ascii=False)
+    )
+
+
+class ExtractionCache:
+    """按源文件存放的磁盘缓存，多进程下每个文件独立读写，互不冲突"""
+
+    def __init__(self, cache_dir, salt=''):
+        self.cache_dir = cache_dir
+        self.salt = f"{CACHE_VERSION}:{salt}"
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, code_bytes, visible_files, entity_digests, macro_entries, function_index_digest=''):
+        """计算单个文件的缓存键（function_index_digest 见 build_function_index_digest）"""
+        visible_digest = _digest(*(
+            f"{path}={entity_digests.get(os.path.abspath(path), '')}" for path in sorted(visible_files)
+        ))
+        macro_digest = _digest(json.dumps(macro_entries or [], sort_keys=True, ensure_ascii=False, default=str))
+        return _digest(self.salt, hashlib.sha1(code_bytes).hexdigest(), visible_digest, macro_digest, function_index_digest)
+
+    def _entry_path(self, source_path):
+        name = hashlib.sha1(os.path.abspath(source_path).encode('utf-8', errors='ignore')).hexdigest()
+        return os.path.join(self.cache_dir, name[:2], name + '.pkl')
+
+    def load(self, source_path, key):
+        """命中返回缓存的提取结果，否则返回 None"""
+        path = self._entry_path(source_path)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        if entry.get('key') != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['result']
+
+    def store(self, source_path, key, result):
+        """原子写入：先写临时文件再替换"""
+        path = self._entry_path(source_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'key': key, 'result': result}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
@@ -0,0 +1,311 @@
+"""
+列式二进制图输出
+
+entity.json / relation.json 中每条关系都是带重复字符串键（visibility_checked、resolution_type 等）的字典，
+下游加载需要重新解析数 GB 的 JSON。这里把实体和关系按列写成 NumPy .npy 数组：
+- 所有实体ID（以及关系中出现的其他端点）驻留为稠密的节点序号，node_id.npy 保存原始ID，
+  meta.json 中的 node_id_kind 记录原始ID的类型，解码时原样还原（见 NodeTable.array）
+- relation_head.npy / relation_tail.npy 为节点序号，relation_type.npy 为类型编码
+- 其他属性按值类型各存一列：布尔 -> int8，整数 -> int64，其余 -> 编码 + meta.json 中的取值表；缺失为 -1（整数列为 MISSING_INT）
+- 每个 .npy 都可以 np.load(mmap_mode='r') 零拷贝加载（.npz 无法内存映射，因此不打包）
+
+同一套整数编码也用于关系去重：(head, tail, type) 编码为定长整数后排序去重，类型统计直接来自这些数组
+
+依赖 numpy（可选依赖；未安装时去重退回集合实现，列式输出不可用）
+"""
+import os
+import json
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+COLUMNAR_VERSION = 2
+MISSING_INT = -(1 << 63)
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+META_FILE = 'meta.json'
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("列式输出需要 numpy：pip install numpy")
+
+
+def _value_kind(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    return 'code'
+
+
+def _code_dtype(size):
+    """能容纳 [-1, size) 的最小有符号整数类型"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if size <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _value_key(value):
+    return value if isinstance(value, str) else json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+class NodeTable:
+    """原始实体ID -> 稠密节点序号"""
+
+    def __init__(self):
+        self.ids = []
+        self.codes = {}
+
+    def code(self, entity_id):
+        code = self.codes.get(entity_id)
+        if code is None:
+            code = self.codes[entity_id] = len(self.ids)
+            self.ids.append(entity_id)
+        return code
+
+    def array(self):
+        """
+        原始ID数组及其类型（写入 meta.json 的 node_id_kind），返回 (ndarray, kind, JSON 编码掩码)
+        - 'int'：全部为规范的十进制数字字符串（str(int(i)) == i，不含前导零），存为 int64，解码为 str
+        - 'int_id'：全部为 Python int，存为 int64，解码为 int
+        - 'str'：全部为字符串，存为定长 Unicode 数组
+        - 'mixed'：其他情况，非字符串ID以 JSON 编码存入 Unicode 数组，掩码（node_id_json.npy）标记这些位置
+        """
+        ids = self.ids
+        if all(type(i) is str for i in ids):
+            if all(i.isascii() and i.isdigit() and str(int(i)) == i and int(i) <= _INT64_MAX for i in ids):
+                return np.array([int(i) for i in ids], dtype=np.int64), 'int', None
+            return np.array(ids, dtype=np.str_), 'str', None
+        if all(type(i) is int and _INT64_MIN <= i <= _INT64_MAX for i in ids):
+            return np.array(ids, dtype=np.int64), 'int_id', None
+        is_json = np.array([type(i) is not str for i in ids], dtype=np.bool_)
+        encoded = [i if type(i) is str else json.dumps(i) for i in ids]
+        return np.array(encoded, dtype=np.str_), 'mixed', is_json
+
+
+def encode_columns(rows, skip=()):
+    """
+    把字典行按键拆成列
+    返回 ({列名: ndarray}, {列名: {'kind': ..., 'values': 取值表}})
+    """
+    kinds = {}
+    for row in rows:
+        for key, value in row.items():
+            if key in skip or value is None:
+                continue
+            kinds.setdefault(key, set()).add(_value_kind(value))
+
+    arrays = {}
+    schema = {}
+    for key, kind_set in kinds.items():
+        values = [row.get(key) for row in rows]
+        kind = kind_set.pop() if len(kind_set) == 1 else 'code'
+        if kind == 'bool':
+            arrays[key] = np.array([-1 if v is None else int(v) for v in values], dtype=np.int8)
+            schema[key] = {'kind': 'bool'}
+        elif kind == 'int':
+            arrays[key] = np.array([MISSING_INT if v is None else v for v in values], dtype=np.int64)
+            schema[key] = {'kind': 'int'}
+        else:
+            table = {}
+            table_values = []
+            codes = []
+            for v in values:
+                if v is None:
+                    codes.append(-1)
+                    continue
+                value_key = _value_key(v)
+                code = table.get(value_key)
+                if code is None:
+                    code = table[value_key] = len(table_values)
+                    table_values.append(v)
+                codes.append(code)
+            arrays[key] = np.array(codes, dtype=_code_dtype(len(table_values)))
+            schema[key] = {'kind': 'code', 'values': table_values}
+    return arrays, schema
+
+
+def _index_dtype(size):
+    return np.int32 if size <= np.iinfo(np.int32).max else np.int64
+
+
+def _column_file(prefix, key):
+    return f"{prefix}_{key}.npy"
+
+
+def write_columnar(graph_dir, entities, relations):
+    """把实体和关系写为列式目录，返回 meta 字典"""
+    _require_numpy()
+    os.makedirs(graph_dir, exist_ok=True)
+
+    nodes = NodeTable()
+    entity_nodes = [nodes.code(e.get('id')) for e in entities]
+    heads = [nodes.code(r['head']) for r in relations]
+    tails = [nodes.code(r['tail']) for r in relations]
+    index_dtype = _index_dtype(len(nodes.ids))
+
+    node_ids, node_id_kind, node_id_json = nodes.array()
+    np.save(os.path.join(graph_dir, 'node_id.npy'), node_ids)
+    if node_id_json is not None:
+        np.save(os.path.join(graph_dir, 'node_id_json.npy'), node_id_json)
+    np.save(os.path.join(graph_dir, 'entity_node.npy'), np.array(entity_nodes, dtype=index_dtype))
+    np.save(os.path.join(graph_dir, 'relation_head.npy'), np.array(heads, dtype=index_dtype))
+    np.save(os.path.join(graph_dir, 'relation_tail.npy'), np.array(tails, dtype=index_dtype))
+    del node_ids, entity_nodes, heads, tails
+
+    meta = {
+        'version': COLUMNAR_VERSION,
+        'num_nodes': len(nodes.ids),
+        'num_entities': len(entities),
+        'num_relations': len(relations),
+        'node_id_kind': node_id_kind,
+        'missing_int': MISSING_INT,
+    }
+    for prefix, rows, skip in (('entity', entities, ('id',)), ('relation', relations, ('head', 'tail'))):
+        arrays, schema = encode_columns(rows, skip)
+        for key, array in arrays.items():
+            np.save(os.path.join(graph_dir, _column_file(prefix, key)), array)
+        meta[f'{prefix}_columns'] = schema
+
+    with open(os.path.join(graph_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return meta
+
+
+class ColumnarGraph:
+    """列式目录的只读视图，数组按需以内存映射方式加载"""
+
+    def __init__(self, graph_dir, mmap_mode='r'):
+        _require_numpy()
+        self.graph_dir = graph_dir
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(graph_dir, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._arrays = {}
+
+    def _load(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = np.load(os.path.join(self.graph_dir, name), mmap_mode=self.mmap_mode)
+        return array
+
+    @property
+    def node_id(self):
+        return self._load('node_id.npy')
+
+    @property
+    def head(self):
+        return self._load('relation_head.npy')
+
+    @property
+    def tail(self):
+        return self._load('relation_tail.npy')
+
+    @property
+    def entity_node(self):
+        return self._load('entity_node.npy')
+
+    def relation_column(self, key):
+        return self._load(_column_file('relation', key))
+
+    def entity_column(self, key):
+        return self._load(_column_file('entity', key))
+
+    def values(self, prefix, key):
+        """编码列的取值表"""
+        return self.meta[f'{prefix}_columns'][key].get('values')
+
+    def _decode_rows(self, prefix, count):
+        columns = []
+        for key, schema in self.meta[f'{prefix}_columns'].items():
+            columns.append((key, schema['kind'], schema.get('values'), self._load(_column_file(prefix, key))))
+        for i in range(count):
+            row = {}
+            for key, kind, values, array in columns:
+                value = int(array[i])
+                if kind == 'bool':
+                    if value >= 0:
+                        row[key] = bool(value)
+                elif kind == 'int':
+                    if value != MISSING_INT:
+                        row[key] = value
+                elif value >= 0:
+                    row[key] = values[value]
+            yield row
+
+    def _node_ids(self):
+        """原始ID列表，类型与写入时一致（见 NodeTable.array）"""
+        node_ids = self.node_id.tolist()
+        kind = self.meta['node_id_kind']
+        if kind == 'int':
+            return [str(i) for i in node_ids]
+        if kind == 'mixed':
+            is_json = self._load('node_id_json.npy').tolist()
+            return [json.loads(i) if encoded else i for i, encoded in zip(node_ids, is_json)]
+        return node_ids
+
+    def iter_entities(self):
+        """还原为实体字典（与 entity.json 中的条目一致）"""
+        node_ids = self._node_ids()
+        entity_node = self.entity_node
+        for i, row in enumerate(self._decode_rows('entity', self.meta['num_entities'])):
+            yield {'id': node_ids[entity_node[i]], **row}
+
+    def iter_relations(self):
+        """还原为关系字典（与 relation.json 中的条目一致）"""
+        node_ids = self._node_ids()
+        head, tail = self.head, self.tail
+        for i, row in enumerate(self._decode_rows('relation', self.meta['num_relations'])):
+            yield {'head': node_ids[head[i]], 'tail': node_ids[tail[i]], **row}
+
+
+def encode_relation_triples(relations):
+    """关系 -> (head 序号, tail 序号, 类型编码, 可见性检查标记) 四个定长整数数组 + 类型表"""
+    _require_numpy()
+    nodes = NodeTable()
+    type_codes = {}
+    count = len(relations)
+    heads = np.fromiter((nodes.code(r['head']) for r in relations), dtype=np.int64, count=count)
+    tails = np.fromiter((nodes.code(r['tail']) for r in relations), dtype=np.int64, count=count)
+    types = np.fromiter(
+        (type_codes.setdefault(r['type'], len(type_codes)) for r in relations), dtype=np.int32, count=count
+    )
+    checked = np.fromiter((bool(r.get('visibility_checked')) for r in relations), dtype=np.bool_, count=count)
+    return heads, tails, types, checked, list(type_codes)
+
+
+def unique_triple_indices(heads, tails, types):
+    """每个不同 (head, tail, type) 首次出现的下标，按原顺序排列"""
+    if len(heads) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort((types, tails, heads))     # lexsort 稳定：同组内先出现者排在前面
+    first = np.ones(len(order), dtype=np.bool_)
+    first[1:] = (
+        (heads[order[1:]] != heads[order[:-1]])
+        | (tails[order[1:]] != tails[order[:-1]])
+        | (types[order[1:]] != types[order[:-1]])
+    )
+    return np.sort(order[first])
+
+
+def deduplicate_relations_vectorized(relations):
+    """
+    按 (head, tail, type) 去重，保留首次出现的顺序
+    返回 (去重后的关系列表, {类型: 数量}, 可见性检查数)，统计直接来自去重用的数组
+    """
+    heads, tails, types, checked, type_names = encode_relation_triples(relations)
+    keep = unique_triple_indices(heads, tails, types)
+    del heads, tails
+    type_counts = np.bincount(types[keep], minlength=len(type_names))
+    relation_types = {name: int(type_counts[code]) for code, name in enumerate(type_names) if type_counts[code]}
+    visibility_checked = int(checked[keep].sum())
+    return [relations[i] for i in keep.tolist()], relation_types, visibility_checked
+
+
+def load_columnar(graph_dir, mmap_mode='r'):
+    return ColumnarGraph(graph_dir, mmap_mode)
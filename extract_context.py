@@ -0,0 +1,95 @@
+"""
+一次运行的全局提取上下文
+
+阶段 4-6 中各提取器原先各自从原始映射派生索引：
+- 函数声明标记（每个文件、每次宏展开子提取都遍历一遍 all_entities）
+- extern 函数集合（每个处理器 set(all_extern_functions) 一次）
+- 变量与参数的合并映射（每个文件 {**variable_id_map, **param_id_map} 一次）
+- 当前文件的可见文件ID集合（每个处理器、每次宏展开子提取各算一次）
+ExtractionContext 在每次运行开始时构建一次，之后只读；FileContext 是其中单个文件的派生数据，
+由同一文件的所有处理器和宏展开子提取共享。
+"""
+from extract_symbol_index import SymbolIndex, ResolutionCache
+
+
+class ExtractionContext:
+    """只读的运行级上下文，构建完成后禁止修改属性"""
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ExtractionContext 是只读的，不能设置 {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"ExtractionContext 是只读的，不能删除 {name}")
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    @classmethod
+    def build(
+        cls,
+        function_id_map,
+        variable_id_map,
+        param_id_map,
+        field_id_map,
+        struct_id_map,
+        entity_file_map,
+        file_visibility,
+        all_extern_functions,
+        macro_lookup_map,
+        all_entities,
+        var_param_entities,
+        field_entities,
+        file_to_entities,
+        **extra
+    ):
+        """
+        由原始映射构建上下文（每次运行一次）
+        extra 用于附加可选字段，如增量缓存 cache / entity_digests
+        """
+        var_param_map = {**variable_id_map, **param_id_map}
+        symbol_index = SymbolIndex.from_maps(
+            function_id_map, var_param_map, field_id_map, entity_file_map, all_entities, visibility=file_visibility
+        )
+        return cls(
+            symbol_index=symbol_index,
+            function_id_map=function_id_map,
+            var_param_map=var_param_map,
+            field_id_map=field_id_map,
+            struct_id_map=struct_id_map,
+            entity_file_map=entity_file_map,
+            file_visibility=file_visibility,
+            extern_functions=frozenset(all_extern_functions or ()),
+            macro_lookup_map=macro_lookup_map,
+            all_entities=all_entities,
+            var_param_entities=var_param_entities,
+            field_entities=field_entities,
+            file_to_entities=file_to_entities,
+            **extra
+        )
+
+    def file_context(self, current_file_path):
+        return FileContext(self.symbol_index, current_file_path, self.file_visibility)
+
+
+class FileContext:
+    """
+    单个文件的派生数据：文件ID、可见文件ID集合和名称解析缓存
+    同一文件的 CALLS / ASSIGNED_TO / MOUNTED_TO 处理器及其宏展开子提取共用一个实例
+    """
+
+    def __init__(self, symbol_index, current_file_path, file_visibility):
+        self.current_file_path = current_file_path
+        self.file_id = symbol_index.file_id(current_file_path)
+        self.visible_files = symbol_index.visible_files(current_file_path, file_visibility)
+        self.resolution_cache = ResolutionCache(current_file_path)
+
+
+def as_extern_set(extern_functions):
+    """extern 函数集合：上下文中已是 frozenset 时直接复用"""
+    if isinstance(extern_functions, (set, frozenset)):
+        return extern_functions
+    return frozenset(extern_functions or ())
@@ -3,12 +3,21 @@ from tree_sitter import Language, Parser
 import tree_sitter_c as tsc
 import json
 import os
+import multiprocessing
 from tqdm import tqdm
+from extract_visitor import Handler, run_handler
 
-id = 0
-entities = []
-relations = []
-temp = {}
+
+class FailMessages:
+    """
+    一次提取（通常是单个文件）的 FAIL_MESSAGE 结果，替代原来的模块级 entities / relations / temp
+    templates: 模板文本 -> 模板ID，同一实例内相同模板只建一个 FAIL_TEMPLATE 实体
+    """
+
+    def __init__(self):
+        self.entities = []
+        self.relations = []
+        self.templates = {}
 
 def write_json(data, savepath):
     with open(savepath, 'w', encoding="utf-8") as f:
@@ -40,46 +49,34 @@ def extract_template_regex(printf_str):
     # result = re.sub(r'([^a-zA-Z])\1+', r'\1', clean_template.replace('\\n', '').replace('\\t', '').replace('\n', '').replace('\t', '')).strip()
     return result
 
-def extract_print_template(root, source_path, id_counter, con_dir):
+# printf 类调用：函数名以 printf 结尾的调用，以及以这类调用（或以其开头的逗号表达式）开头的语句
+PRINTF_QUERY = """
+(call_expression function: (identifier) @fn (#match? @fn "printf$")) @node
+(expression_statement . (call_expression function: (identifier) @fn (#match? @fn "printf$"))) @node
+(expression_statement . (comma_expression left: (call_expression function: (identifier) @fn (#match? @fn "printf$")))) @node
+"""
+
+def make_fail_message_handler(code_bytes, source_path, id_counter, con_dir, messages):
+    """返回 FAIL_MESSAGE 处理器：匹配 printf 类调用，生成的模板/实例写入 messages（FailMessages）"""
+    entities = messages.entities
+    relations = messages.relations
+    temp = messages.templates
 
     def get_text(node):
         return code_bytes[node.start_byte:node.end_byte].decode("utf-8", errors="ignore")
 
-    def find_deep_identifier(node):
-        if node is None:
-            return None
-        if node.type == 'identifier':
-            return node
-        for child in node.children:
-            result = find_deep_identifier(child)
-            if result:
-                return result
-        return None
-
-    global temp, entities, relations
-    with open(source_path, 'rb') as f:
-        code_bytes = f.read()
-    for child in root.children:
-        child_text = get_text(child)
-
-    def traverse(node, current_scope):
-        node_text = get_text(node).strip()
-        if 'printf' not in node_text:
-            return
-        if node.type == 'function_definition':
-            func_decl = node.child_by_field_name('declarator')
-            func_node = find_deep_identifier(func_decl)
-            if func_node is None:
-                return
-            func_name = get_text(func_node)
-            func_body = node.child_by_field_name('body')
-            if func_body:
-                traverse(func_body, current_scope=func_name)
-            return
-
-        pattern = r'^\s*\w*printf\s*\('
-        if re.search(pattern, node_text) and node.type in ['call_expression', 'expression_statement']:
+    # 直接在原始字节上按节点的字节区间检查，只有命中的调用才解码文本
+    pattern = re.compile(rb'\s*\w*printf\s*\(')
+
+    def visit(node, current_scope):
+        current_scope = current_scope or source_path
+        start_byte, end_byte = node.start_byte, node.end_byte
+        if code_bytes.find(b'printf', start_byte, end_byte) < 0:
+            return True
+
+        if pattern.match(code_bytes, start_byte, end_byte):
             str_content = ""
+            call_node = None
             if node.type == 'call_expression':
                 call_node = node
             elif node.type == 'expression_statement':
@@ -89,6 +86,9 @@ def extract_print_template(root, source_path, id_counter, con_dir):
                     if sub_node.type in ['call_expression', 'comma_expression']:
                         call_node = sub_node
                         break
+            if call_node is None:
+                # 语句以 printf 调用开头但不是调用本身（如 printf(...) + 1;），交给其中的 call_expression 处理
+                return False
 
             for sub_node in call_node.children[1].children[1:]:
                 if sub_node.type in ['concatenated_string', 'string_literal']:
@@ -96,6 +96,7 @@ def extract_print_template(root, source_path, id_counter, con_dir):
                     break
             value = extract_template_regex(str_content)
             if value:
+                node_text = get_text(node).strip()
                 # 添加模板
                 start_line = node.start_point[0] + 1
                 end_line = node.end_point[0] + 1
@@ -130,39 +131,108 @@ def extract_print_template(root, source_path, id_counter, con_dir):
                 })
 
                 # 添加实例-scope关系
-                scope_id = con_dir[current_scope]
-                relations.append({
-                    "head": scope_id,
-                    "tail": en_id,
-                    "type": "HAS_MESSAGE"
-                })
-            return
-
-        for child in node.children:
-            traverse(child, current_scope)
-    traverse(root, current_scope=source_path)
-
-def extarct_mes(parser, c_files, id_counter, file2entity):
-
-    for source_path in tqdm(c_files, desc="🔍 提取print模板"):
-        contain_list = file2entity[source_path]
-        con_dir = {}
-        for value in contain_list:
-            if value.get('type') == 'FUNCTION':
-                con_dir[value['name']] = value['id']
-            elif value.get('type') == 'FILE':
-                con_dir[value['source_file']] = value['id']
-
-        abs_source_path = os.path.abspath(source_path)
-        
-        with open(abs_source_path, 'rb') as f:
+                scope_id = con_dir.get(current_scope)
+                if scope_id:
+                    relations.append({
+                        "head": scope_id,
+                        "tail": en_id,
+                        "type": "HAS_MESSAGE"
+                    })
+            return True
+        return False
+
+    # 实体与关系写入 messages，处理器本身不产出结果
+    return Handler('FAIL_MESSAGE', ('call_expression', 'expression_statement'), visit=visit, query=PRINTF_QUERY)
+
+def extract_print_template(root, source_path, id_counter, con_dir, code_bytes=None, messages=None):
+    """
+    提取单个文件的 FAIL_MESSAGE，返回 FailMessages
+    code_bytes 为解析时使用的源码字节；未传入时才重新读取文件
+    """
+    if code_bytes is None:
+        with open(source_path, 'rb') as f:
             code_bytes = f.read()
-        tree = parser.parse(code_bytes)
-        root = tree.root_node
-        extract_print_template(root, source_path, id_counter, con_dir)
-    
-    global temp, entities, relations
+    if messages is None:
+        messages = FailMessages()
+    run_handler(root, code_bytes, make_fail_message_handler(code_bytes, source_path, id_counter, con_dir, messages))
+    return messages
+
+def local_id_counter():
+    """文件内的临时ID（"f:<n>"），由 merge_fail_messages 统一编号"""
+    n = 0
+    while True:
+        n += 1
+        yield f"f:{n}"
+
+def merge_fail_messages(fail_entities, fail_relations, template_ids, id_counter):
+    """
+    把文件内临时 FAIL_TEMPLATE / FAIL_MESSAGE ID 映射为全局ID，同名模板合并
+    按文件顺序依次合并时结果是确定的，与串行提取时的编号一致
+    """
+    id_remap = {}
+    new_entities = []
+    for entity in fail_entities:
+        if entity['type'] == 'FAIL_TEMPLATE':
+            if entity['name'] not in template_ids:
+                template_ids[entity['name']] = str(next(id_counter))
+                new_entities.append({**entity, 'id': template_ids[entity['name']]})
+            id_remap[entity['id']] = template_ids[entity['name']]
+        else:
+            id_remap[entity['id']] = str(next(id_counter))
+            new_entities.append({**entity, 'id': id_remap[entity['id']]})
+    new_relations = [
+        {**rel, 'head': id_remap.get(rel['head'], rel['head']), 'tail': id_remap.get(rel['tail'], rel['tail'])}
+        for rel in fail_relations
+    ]
+    return new_entities, new_relations
+
+def build_contain_dir(contain_list):
+    """文件内函数名/文件路径 -> 实体ID"""
+    con_dir = {}
+    for value in contain_list:
+        if value.get('type') == 'FUNCTION':
+            con_dir[value['name']] = value['id']
+        elif value.get('type') == 'FILE':
+            con_dir[value['source_file']] = value['id']
+    return con_dir
+
+_WORKER_PARSER = None
+
+def _init_message_worker():
+    global _WORKER_PARSER
+    _WORKER_PARSER = get_parser()
+
+def extract_file_messages(parser, source_path, con_dir):
+    """单个文件的 FAIL_MESSAGE（临时ID），返回 (entities, relations)"""
+    with open(os.path.abspath(source_path), 'rb') as f:
+        code_bytes = f.read()
+    tree = parser.parse(code_bytes)
+    messages = extract_print_template(tree.root_node, source_path, local_id_counter(), con_dir, code_bytes)
+    return messages.entities, messages.relations
+
+def _message_worker(task):
+    source_path, con_dir = task
+    return extract_file_messages(_WORKER_PARSER, source_path, con_dir)
+
+def extarct_mes(parser, c_files, id_counter, file2entity, num_workers=1, chunksize=16):
+    """
+    逐文件提取 FAIL_MESSAGE，再按文件顺序合并：FAIL_TEMPLATE 按模板文本跨文件合并，ID 由 id_counter 统一分配
+    num_workers > 1 时在进程池中提取，结果按提交顺序返回，编号与串行时一致；
+    合并出错时进程池随 with 退出被终止，不再等待队列中剩余的文件
+    """
+    tasks = ((source_path, build_contain_dir(file2entity[source_path])) for source_path in c_files)
+    if num_workers > 1:
+        with multiprocessing.Pool(processes=num_workers, initializer=_init_message_worker) as pool:
+            return _merge_file_messages(pool.imap(_message_worker, tasks, chunksize=chunksize), len(c_files), id_counter)
+    results = (extract_file_messages(parser, source_path, con_dir) for source_path, con_dir in tasks)
+    return _merge_file_messages(results, len(c_files), id_counter)
+
+def _merge_file_messages(results, total, id_counter):
+    entities, relations = [], []
+    template_ids = {}
+    for file_entities, file_relations in tqdm(results, total=total, desc="🔍 提取print模板"):
+        if file_entities:
+            file_entities, file_relations = merge_fail_messages(file_entities, file_relations, template_ids, id_counter)
+            entities.extend(file_entities)
+            relations.extend(file_relations)
     return entities, relations
-
-
-
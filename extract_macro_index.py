@@ -0,0 +1,196 @@
+"""
+宏展开条目的区间索引
+
+find_macro_expansion 需要找出「被节点范围完全包含」的宏条目。原实现对每个节点线性扫描整个文件的宏列表，
+并且对每次命中调用两次 skip_non_variable_start。这里在加载时：
+- 预先计算规范化后的被调用名（entry["callee"]），名字为空的条目不进入索引
+- 按起始位置排序，查询时用二分定位起点落在节点内的条目，再检查终点
+查询结果与原实现一致：返回原列表顺序中第一个满足条件的条目。
+"""
+import os
+import hashlib
+from bisect import bisect_left, bisect_right
+from array import array
+from collections import OrderedDict
+
+
+def skip_non_variable_start(input_string):
+    if not isinstance(input_string, str):
+        return ""
+
+    without_prefix = ''
+    for i, char in enumerate(input_string):
+        if char.isalpha() or char == '_':
+            without_prefix = input_string[i:]
+            break
+    new_str = without_prefix.split('(')[0]
+
+    for i in range(len(new_str)):
+        sin_index = len(new_str) - i - 1
+        sin_char = new_str[sin_index]
+        if sin_char.isalpha() or sin_char == '_':
+            without_suffix = new_str[:(sin_index+1)]
+            return without_suffix
+
+    return ""
+
+
+def _pack(line, col):
+    """(行, 列) 编码为可直接比较大小的整数"""
+    return (line << 24) | col
+
+
+class MacroIndex:
+    """单个文件的宏条目索引"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        keyed = []
+        for order, entry in enumerate(entries):
+            if "callee" not in entry:
+                entry["callee"] = skip_non_variable_start(entry["expanded"])
+            if not entry["callee"]:
+                continue
+            (s_line, s_col), (e_line, e_col) = entry["range"]
+            keyed.append((_pack(s_line, s_col), _pack(e_line, e_col), order))
+        keyed.sort()
+        self.starts = array('q', (k[0] for k in keyed))
+        self.ends = array('q', (k[1] for k in keyed))
+        self.orders = array('q', (k[2] for k in keyed))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def find_contained(self, node_start, node_end):
+        """返回被 [node_start, node_end] 完全包含的第一个条目（按原列表顺序），没有则返回 None"""
+        start = _pack(*node_start)
+        end = _pack(*node_end)
+        lo = bisect_left(self.starts, start)
+        hi = bisect_right(self.starts, end, lo)
+        ends = self.ends
+        orders = self.orders
+        best = None
+        for k in range(lo, hi):
+            if ends[k] <= end and (best is None or orders[k] < best):
+                best = orders[k]
+        return self.entries[best] if best is not None else None
+
+
+def find_macro_entry(macro_lookup_map, file_path, node):
+    """
+    查找节点内的宏展开条目
+    macro_lookup_map 的值可以是 MacroIndex，也可以是旧格式的条目列表（线性扫描）
+    """
+    entries = macro_lookup_map.get(file_path)
+    if not entries:
+        return None
+
+    node_start = (node.start_point[0] + 1, node.start_point[1] + 1)
+    node_end = (node.end_point[0] + 1, node.end_point[1] + 1)
+
+    if isinstance(entries, MacroIndex):
+        return entries.find_contained(node_start, node_end)
+
+    for entry in entries:
+        (s_line, s_col), (e_line, e_col) = entry["range"]
+        if node_start <= (s_line, s_col) and (e_line, e_col) <= node_end:
+            if skip_non_variable_start(entry["expanded"]):
+                return entry
+    return None
+
+
+def macro_entry_callee(entry):
+    """条目的规范化被调用名（索引中已预计算）"""
+    callee = entry.get("callee")
+    if callee is None:
+        callee = skip_non_variable_start(entry["expanded"])
+    return callee
+
+
+def build_macro_index(macro_lookup_map):
+    """{文件: [条目, ...]} -> {文件: MacroIndex}"""
+    return {file: MacroIndex(entries) for file, entries in macro_lookup_map.items()}
+
+
+class _CachedExpansion:
+    __slots__ = ('tree', 'variants')
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.variants = []      # [(解析记录, 关系列表, 记录时的文件), ...]，最近使用的在前
+
+
+class MacroRelationCache:
+    """
+    宏展开子提取结果的有界 LRU 缓存，在整个进程内（跨文件）共享
+    键：(提取类型, 展开文本哈希)，与文件无关。每个条目保存：
+    - 展开文本的语法树（与解析上下文无关，任何文件遇到同一展开都不再解析）
+    - 若干个提取结果变体，每个变体附带提取时的解析记录（ResolutionCache.tracing 记录的 {键: 结果}）
+    查询时在当前文件的 ResolutionCache 上重放解析记录：每个键的解析结果都一致时，同一语法树上的提取结果
+    必然相同，直接复用（如 list_for_each_entry 的展开体在可见集合相近的文件之间）；
+    都不一致时只在缓存的语法树上重新提取，并把新结果作为新的变体加入
+    """
+
+    def __init__(self, maxsize=4096, max_variants=4):
+        self.maxsize = maxsize
+        self.max_variants = max_variants
+        self.table = OrderedDict()
+        self.hits = 0               # 复用提取结果（其中 cross_file_hits 次来自其他文件记录的变体）
+        self.cross_file_hits = 0
+        self.tree_hits = 0          # 只复用语法树
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kind, text):
+        if isinstance(text, str):
+            text = text.encode('utf-8', errors='ignore')
+        return (kind, hashlib.sha1(text).digest())
+
+    def get(self, key, replay, source_path=None):
+        """
+        replay(trace) 判断当前文件的解析结果是否与记录一致
+        返回 (关系列表, 语法树)：未命中时关系列表为 None，展开从未出现过时语法树也为 None
+        """
+        entry = self.table.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, None
+        self.table.move_to_end(key)
+        variants = entry.variants
+        for i, (trace, relations, recorded_path) in enumerate(variants):
+            if replay(trace):
+                if i:
+                    variants.insert(0, variants.pop(i))
+                self.hits += 1
+                if recorded_path != source_path:
+                    self.cross_file_hits += 1
+                return list(relations), entry.tree
+        self.tree_hits += 1
+        return None, entry.tree
+
+    def put(self, key, tree, trace, relations, source_path=None):
+        entry = self.table.get(key)
+        if entry is None:
+            entry = self.table[key] = _CachedExpansion(tree)
+        entry.variants.insert(0, (trace, list(relations), source_path))
+        del entry.variants[self.max_variants:]
+        self.table.move_to_end(key)
+        while len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.tree_hits + self.misses
+        return {
+            'hits': self.hits,
+            'cross_file_hits': self.cross_file_hits,
+            'tree_hits': self.tree_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+# 进程内共享的缓存实例，大小可通过环境变量 MACRO_CACHE_SIZE 调整
+macro_relation_cache = MacroRelationCache(int(os.getenv('MACRO_CACHE_SIZE', '4096')))
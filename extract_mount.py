@@ -1,149 +1,250 @@
+"""
+MOUNTED_TO 关系提取：回调注册
+
+由注册表驱动，而不是解码每个 call_expression 的全文查找 `DELAYED_WORK`：
+- REGISTRATIONS：注册宏/函数名 -> (挂载点参数位置, 回调参数位置元组)，如 INIT_WORK(&dev->work, fn)、
+  timer_setup(&dev->timer, fn, flags)、request_irq(irq, handler, ...)
+- CALLBACK_STRUCTS：以指定初始化器挂载回调的结构体类型，如
+  struct file_operations fops = { .open = my_open }，挂载点为字段 open
+按被调用名预筛：查询模式下由 tree-sitter 查询的 #match? 谓词在 C 层筛选，遍历模式下只比较被调用名的字节
+"""
 import os
+from extract_visitor import Handler, RelationSink, find_first, run_handler
+from extract_symbol_index import SymbolIndex
+from extract_context import FileContext
 
-def extract_mount_to_relations(
-    root_node,
+REGISTRATIONS = {
+    # 工作队列
+    'INIT_WORK': (0, (1,)),
+    'INIT_WORK_ONSTACK': (0, (1,)),
+    'INIT_DELAYED_WORK': (0, (1,)),
+    'INIT_DELAYED_WORK_ONSTACK': (0, (1,)),
+    'INIT_DEFERRABLE_WORK': (0, (1,)),
+    'INIT_RCU_WORK': (0, (1,)),
+    '__INIT_WORK': (0, (1,)),
+    '__INIT_DELAYED_WORK': (0, (1,)),
+    'kthread_init_work': (0, (1,)),
+    'kthread_init_delayed_work': (0, (1,)),
+    'init_irq_work': (0, (1,)),
+    # 定时器
+    'timer_setup': (0, (1,)),
+    'timer_setup_on_stack': (0, (1,)),
+    'setup_timer': (0, (1,)),
+    'hrtimer_setup': (0, (1,)),
+    # tasklet
+    'tasklet_init': (0, (1,)),
+    'tasklet_setup': (0, (1,)),
+    # 中断
+    'request_irq': (0, (1,)),
+    'request_threaded_irq': (0, (1, 2)),
+    'request_any_context_irq': (0, (1,)),
+    'devm_request_irq': (1, (2,)),
+    'devm_request_threaded_irq': (1, (2, 3)),
+    # RCU 回调
+    'call_rcu': (0, (1,)),
+}
+
+CALLBACK_STRUCTS = frozenset({
+    'file_operations', 'proc_ops', 'seq_operations', 'inode_operations', 'super_operations',
+    'dentry_operations', 'address_space_operations', 'vm_operations_struct', 'file_system_type',
+    'block_device_operations', 'net_device_ops', 'ethtool_ops', 'header_ops', 'tty_operations',
+    'platform_driver', 'pci_driver', 'usb_driver', 'i2c_driver', 'spi_driver', 'device_driver',
+    'dev_pm_ops', 'irq_chip', 'notifier_block', 'clk_ops', 'drm_driver', 'snd_pcm_ops',
+    'kernel_param_ops', 'sysfs_ops', 'attribute_group',
+})
+
+
+def mount_query(registrations):
+    """注册调用（被调用名在注册表中）和指定初始化器中的 `.field = identifier`"""
+    patterns = ["(initializer_pair designator: (field_designator) value: (identifier)) @node"]
+    if registrations:
+        names = "|".join(sorted(registrations))
+        patterns.append(f'(call_expression function: (identifier) @fn (#match? @fn "^({names})$")) @node')
+    return "\n".join(patterns)
+
+
+def _unwrap_argument(node):
+    """去掉取地址、括号和类型转换：&dev->work -> dev->work，(work_func_t)fn -> fn"""
+    while node is not None:
+        if node.type == 'pointer_expression':
+            node = node.child_by_field_name('argument')
+        elif node.type == 'parenthesized_expression':
+            node = node.named_children[0] if node.named_children else None
+        elif node.type == 'cast_expression':
+            node = node.child_by_field_name('value')
+        else:
+            return node
+    return None
+
+
+def make_mount_to_handler(
     code_bytes,
-    function_id_map,
-    variable_id_map,
-    field_id_map,
+    symbol_index,
     current_file_path,
     file_visibility,
-    entity_file_map,
     extern_functions=None,
     macro_lookup_map=None,
     file_path=None,
-    flag=False
+    flag=False,
+    file_context=None,
+    registrations=None,
+    callback_structs=None
 ):
     """
-    基于文件可见性的赋值关系提取
-    支持多值映射的变量查找，正确处理同名全局变量消歧
-    新增：支持结构体初始化器中的字段赋值
+    基于文件可见性的回调挂载关系提取
+    返回 MOUNTED_TO 处理器，由 VisitorEngine 在单次遍历中分发 call_expression / initializer_pair 节点
+    registrations / callback_structs 不传时使用模块级默认表
     """
+    if file_context is None:
+        file_context = FileContext(symbol_index, current_file_path, file_visibility)
+    if registrations is None:
+        registrations = REGISTRATIONS
+    if callback_structs is None:
+        callback_structs = CALLBACK_STRUCTS
+    current_file_id = file_context.file_id
+    visible_files = file_context.visible_files
+    resolution_cache = file_context.resolution_cache
+    registration_bytes = {name.encode(): (name, entry) for name, entry in registrations.items()}
+    declaration_structs = {}    # 声明节点 ID -> 结构体类型名（同一初始化器中的各字段只查一次）
+
     def get_text(node):
         return code_bytes[node.start_byte:node.end_byte].decode("utf-8", errors="ignore")
 
-    def resolve_name_with_visibility(name, current_scope, visible_files):
-        """基于可见性解析名称到实体ID，支持多值映射"""
-
-        candidates = []
-        
-        # 1. 检查局部变量
-        local_var_key = (name, current_scope)
-        if local_var_key in variable_id_map:
-            var_id_or_list = variable_id_map[local_var_key]
-            var_ids = var_id_or_list if isinstance(var_id_or_list, list) else [var_id_or_list]
-            
-            for var_id in var_ids:
-                var_file = entity_file_map.get(var_id)
-                if var_file and var_file in visible_files:
-                    priority = 0
-                    candidates.append((var_id, "local_variable", priority, var_file))
-        
-        # 2. 检查全局变量
-        global_var_key = (name, 'global')
-        if global_var_key in variable_id_map:
-            var_id_or_list = variable_id_map[global_var_key]
-            var_ids = var_id_or_list if isinstance(var_id_or_list, list) else [var_id_or_list]
-            
-            for var_id in var_ids:
-                var_file = entity_file_map.get(var_id)
-                if var_file and var_file in visible_files:
-                    priority = 0 if var_file == current_file_path else 10
-                    candidates.append((var_id, "global_variable", priority, var_file))
-        
-        # 3. 检查函数
-        if name in function_id_map:
-            func_ids = function_id_map[name]
-            if not isinstance(func_ids, list):
-                func_ids = [func_ids]
-            
-            for func_id in func_ids:
-                func_file = entity_file_map.get(func_id)
-                if func_file and func_file in visible_files:
-                    priority = 0 if func_file == current_file_path else 1
-                    candidates.append((func_id, "function", priority, func_file))
-        
-        # 4. 检查字段
-        if name in field_id_map:
-            field_ids = field_id_map[name]
-            if not isinstance(field_ids, list):
-                field_ids = [field_ids]
-                
-            for field_id in field_ids:
-                field_file = entity_file_map.get(field_id)
-                if field_file and field_file in visible_files:
-                    priority = 0 if field_file == current_file_path else 1
-                    candidates.append((field_id, "field", priority, field_file))
-        
-        if candidates:
-            candidates.sort(key=lambda x: x[2])
-            return candidates[0][0]
-        
-        return None
-
-    def find_identifier(node):
-        if node is None or node.type == 'pointer_expression':
+    mount_relations = RelationSink()
+
+    def resolve_target(node, current_scope):
+        """挂载点：成员访问取字段，普通变量取变量，其他表达式取其中第一个字段"""
+        node = _unwrap_argument(node)
+        if node is None:
             return None
+        if node.type == 'field_expression':
+            field_node = node.child_by_field_name('field')
+            return resolution_cache.resolve_field(symbol_index, get_text(field_node).strip(), visible_files)
         if node.type == 'identifier':
-            return node
-        for child in node.children:
-            result = find_identifier(child)
-            if result:
-                return result
-        return None
+            return resolution_cache.resolve_name(symbol_index, get_text(node).strip(), current_scope, visible_files, current_file_id)
+        field_node = find_first(node, ('field_identifier',))
+        if field_node is None:
+            return None
+        return resolution_cache.resolve_field(symbol_index, get_text(field_node).strip(), visible_files)
+
+    def resolve_callback(node, current_scope):
+        node = _unwrap_argument(node)
+        if node is None or node.type != 'identifier':
+            return None
+        return resolution_cache.resolve_name(symbol_index, get_text(node).strip(), current_scope, visible_files, current_file_id)
+
+    def add_relation(target_id, func_id, current_scope, registrar):
+        relation = {
+            "head": target_id,
+            "tail": func_id,
+            "type": "MOUNTED_TO",
+            "scope": current_scope,
+            "registrar": registrar,
+            "visibility_checked": True
+        }
+        mount_relations.add(relation)
+
+    def visit_call(node, current_scope):
+        function_node = node.child_by_field_name('function')
+        if function_node is None or function_node.type != 'identifier':
+            return False
+        hit = registration_bytes.get(code_bytes[function_node.start_byte:function_node.end_byte])
+        if hit is None:
+            return False
+        name, (target_pos, callback_positions) = hit
+        arg_node = node.child_by_field_name('arguments')
+        if arg_node is None:
+            return False
+        args = arg_node.named_children
+        if target_pos >= len(args):
+            return False
 
-    def find_field_identifier(node):
+        target_id = resolve_target(args[target_pos], current_scope)
+        if not target_id:
+            return False
+        found = False
+        for pos in callback_positions:
+            if pos < len(args):
+                func_id = resolve_callback(args[pos], current_scope)
+                if func_id:
+                    add_relation(target_id, func_id, current_scope, name)
+                    found = True
+        return found
+
+    def enclosing_struct(node):
+        """初始化器所属声明的结构体类型名（嵌套初始化器取最外层声明）"""
+        while node is not None and node.type != 'declaration':
+            if node.type in ('function_definition', 'compound_statement', 'translation_unit'):
+                return None
+            node = node.parent
         if node is None:
             return None
-        if node.type == 'field_identifier':
-            return node
-        for child in node.children:
-            result = find_field_identifier(child)
-            if result:
-                return result
-        return None
-
-    mount_relations = []
-
-    def traverse(node, current_scope='global'):
-        # 进入函数定义
-        if node.type == 'function_definition':
-            declarator = node.child_by_field_name('declarator')
-            func_node = find_identifier(declarator)
-            if func_node:
-                current_scope = get_text(func_node).strip()
-
-        if node.type == 'call_expression' and 'DELAYED_WORK' in get_text(node):
-            arg_node = None
-            for child in node.children:
-                if child.type == 'argument_list':
-                    arg_node = child
-                    break
-            field_node = find_field_identifier(node)
-            func_node = find_identifier(arg_node)
-
-            field_name = get_text(field_node).strip()
-            visible_files = file_visibility.get(current_file_path, {current_file_path})
-            field_id = resolve_name_with_visibility(field_name, current_scope, visible_files)
-
-            func_name = get_text(func_node).strip()
-            func_id = resolve_name_with_visibility(func_name, current_scope, visible_files)
-
-            if field_id and func_id:
-                relation = {
-                    "head": field_id,
-                    "tail": func_id,
-                    "type": "MOUNTED_TO",
-                    "scope": current_scope,
-                    "visibility_checked": True
-                }
-                
-                if relation not in mount_relations:
-                    mount_relations.append(relation)
-                return
-        # 递归遍历
-        for child in node.children:
-            traverse(child, current_scope)
-
-    traverse(root_node)
-    return mount_relations
\ No newline at end of file
+        struct_name = declaration_structs.get(node.id)
+        if struct_name is None:
+            type_node = node.child_by_field_name('type')
+            name_node = type_node.child_by_field_name('name') if type_node is not None and type_node.type == 'struct_specifier' else None
+            struct_name = declaration_structs[node.id] = get_text(name_node).strip() if name_node is not None else ''
+        return struct_name
+
+    def visit_initializer(node, current_scope):
+        value_node = node.child_by_field_name('value')
+        if value_node is None or value_node.type != 'identifier':
+            return False
+        designator = node.child_by_field_name('designator')
+        if designator is None or designator.type != 'field_designator':
+            return False
+        struct_name = enclosing_struct(node.parent)
+        if struct_name not in callback_structs:
+            return False
+
+        field_node = designator.named_children[0] if designator.named_children else None
+        if field_node is None:
+            return False
+        field_id = resolution_cache.resolve_field(symbol_index, get_text(field_node).strip(), visible_files)
+        func_id = resolve_callback(value_node, current_scope)
+        if field_id and func_id:
+            add_relation(field_id, func_id, current_scope, struct_name)
+            return True
+        return False
+
+    def visit(node, current_scope):
+        current_scope = current_scope or 'global'
+        if node.type == 'call_expression':
+            return visit_call(node, current_scope)
+        return visit_initializer(node, current_scope)
+
+    return Handler(
+        "MOUNTED_TO", ('call_expression', 'initializer_pair'), visit=visit, results=mount_relations,
+        query=mount_query(registrations)
+    )
+
+
+def extract_mount_to_relations(
+    root_node,
+    code_bytes,
+    function_id_map,
+    variable_id_map,
+    field_id_map,
+    current_file_path,
+    file_visibility,
+    entity_file_map,
+    extern_functions=None,
+    macro_lookup_map=None,
+    file_path=None,
+    flag=False,
+    symbol_index=None,
+    registrations=None,
+    callback_structs=None
+):
+    """
+    单独提取一个文件的 MOUNTED_TO 关系
+    未传入 symbol_index 时由名称映射临时构建（批量处理时应在外部构建一次并复用）
+    """
+    if symbol_index is None:
+        symbol_index = SymbolIndex.from_maps(function_id_map, variable_id_map, field_id_map, entity_file_map)
+    handler = make_mount_to_handler(
+        code_bytes, symbol_index, current_file_path, file_visibility,
+        extern_functions, macro_lookup_map, file_path, flag,
+        registrations=registrations, callback_structs=callback_structs
+    )
+    return run_handler(root_node, code_bytes, handler)
@@ -1,10 +1,40 @@
+"""
+ALIAS 关系提取
 
+- 按字节预检：整个文件或某个顶层子节点中不含别名标记（strong_alias / weak_alias / __attribute__）时不解码、不做正则匹配
+- 正则在模块加载时编译一次
+- 文件内的函数（con_dir）解析不到的别名两端先记为待解析别名（PENDING_ALIAS），
+  由主进程在所有文件提取完成后对照全局函数符号索引一次性批量解析（resolve_pending_aliases），
+  从而捕获 glibc 中跨文件的别名（如 weak_alias (__libc_open, open) 中在头文件声明的 open）
+"""
 import re
+from collections import defaultdict
+
+from extract_visitor import Handler, run_handler
+from extract_symbol_index import FUNCTION
+
+PENDING_ALIAS = 'ALIAS_PENDING'
+
+_GLIBC_ALIAS = re.compile(
+    r'\b(?P<type>strong_alias|weak_alias)\s*\(\s*(?P<src>[^,()]+?)\s*,\s*(?P<dst>[^()]+?)\s*\)'
+)
+_LINUX_ALIAS = re.compile(
+    r'\b(?P<src>[A-Za-z_]\w*)'                  # 函数/符号名（src）
+    r'\s*\([^;{)]*\)\s*'                        # 括号内参数（简单匹配，不深入解析参数）
+    r'__attribute__\s*\(\(\s*(?P<attr>.*?)\)\)\s*;', # attribute 的整个内容，直到分号
+    re.DOTALL
+)
+_ATTR_ALIAS = re.compile(r'alias\s*\(\s*["\'](?P<dst>[A-Za-z_]\w*)["\']\s*\)')
+_WEAK = re.compile(r'\bweak\b')
+
+
+def _flatten(s):
+    return s.replace("\n", ' ').replace('\t', ' ')
+
+
 def glibc_alias(s):
-    s = s.replace("\n", ' ').replace('\t', ' ')
-    pattern = r'\b(?P<type>strong_alias|weak_alias)\s*\(\s*(?P<src>[^,()]+?)\s*,\s*(?P<dst>[^()]+?)\s*\)'
     matches = []
-    for m in re.finditer(pattern, s, flags=re.MULTILINE):
+    for m in _GLIBC_ALIAS.finditer(_flatten(s)):
         matches.append({
             "type": m.group("type").split('_')[0],
             "src": m.group("src").strip(),
@@ -15,28 +45,20 @@ def glibc_alias(s):
 
 def linux_alias(text):
     # 先定位函数/符号声明 + 随后的 __attribute__((...)) 整块
-    # 使用 DOTALL 以允许换行，MULTILINE 以正确处理多行文件
-    text = text.replace("\n", ' ').replace('\t', ' ')
-    pattern = re.compile(
-        r'\b(?P<src>[A-Za-z_]\w*)'                  # 函数/符号名（src）
-        r'\s*\([^;{)]*\)\s*'                        # 括号内参数（简单匹配，不深入解析参数）
-        r'__attribute__\s*\(\(\s*(?P<attr>.*?)\)\)\s*;', # attribute 的整个内容，直到分号
-        re.DOTALL | re.MULTILINE
-    )
     results = []
-    for m in pattern.finditer(text):
+    for m in _LINUX_ALIAS.finditer(_flatten(text)):
         src = m.group('src').strip()
         attr = m.group('attr').strip()
 
         # 在 attribute 内容里寻找 alias("...") 或 alias('...')
-        a = re.search(r'alias\s*\(\s*["\'](?P<dst>[A-Za-z_]\w*)["\']\s*\)', attr)
+        a = _ATTR_ALIAS.search(attr)
         if not a:
             continue  # 没有 alias(...) 的情况忽略
 
         dst = a.group('dst')
 
         # 判断是否包含 weak 标志（不区分顺序，只要在 attribute 内容中出现 weak 即视为弱别名）
-        kind = 'weak' if re.search(r'\bweak\b', attr) else 'strong'
+        kind = 'weak' if _WEAK.search(attr) else 'strong'
 
         results.append({"type": kind, "src": src, "dst": dst})
 
@@ -46,43 +68,166 @@ template = {
     'glibc': glibc_alias,
     'linux': linux_alias
 }
+# 各平台别名声明中必然出现的字节串，子节点中一个都没有时跳过
+markers = {
+    'glibc': (b'strong_alias', b'weak_alias'),
+    'linux': (b'__attribute__',),
+}
+
+
+def _has_marker(code_bytes, marker_list, start=0, end=None):
+    if end is None:
+        end = len(code_bytes)
+    return any(code_bytes.find(marker, start, end) != -1 for marker in marker_list)
+
+
+def make_alias_handler(
+    code_bytes,
+    contain_list,
+    abs_path
+):
+    """
+    返回 ALIAS 文件级处理器：在同一棵树的顶层子节点上匹配别名声明
+    两端都在当前文件内的直接产出 ALIAS；否则产出 PENDING_ALIAS（见 split_pending_aliases）
+    """
+    def on_file(root):
+        relations = []
+        platform = None
+        for pl in template.keys():
+            if pl in abs_path:
+                platform = pl
+                break
+        if not platform:
+            return []
+        extract_func = template[platform]
+        marker_list = markers[platform]
+        if not _has_marker(code_bytes, marker_list):
+            return []
+
+        con_dir = {entity['name']: entity['id'] for entity in contain_list if entity['type'] == 'FUNCTION'}
+        for child in root.children:
+            if not _has_marker(code_bytes, marker_list, child.start_byte, child.end_byte):
+                continue
+            child_text = code_bytes[child.start_byte:child.end_byte].decode("utf-8", errors="ignore")
+            alias_list = extract_func(child_text)
+
+            for apair in alias_list:
+                kind = apair['type']
+                src_name = apair['src']
+                dst_name = apair['dst']
+
+                src_id = con_dir.get(src_name)
+                dst_id = con_dir.get(dst_name)
+
+                if src_id and dst_id:
+                    rela = {
+                        'head': src_id,
+                        'tail': dst_id,
+                        'type': 'ALIAS',
+                        'kind': kind
+                    }
+                else:
+                    rela = {
+                        'head': src_id or src_name,
+                        'tail': dst_id or dst_name,
+                        'type': PENDING_ALIAS,
+                        'kind': kind,
+                        'head_resolved': bool(src_id),
+                        'tail_resolved': bool(dst_id),
+                        'source_file': abs_path
+                    }
+                relations.append(rela)
+        return relations
+
+    return Handler('ALIAS', on_file=on_file)
+
+
 def extract_alias_relations(
     root,
     code_bytes,
     contain_list,
     abs_path
 ):
-    def get_text(node):
-        return code_bytes[node.start_byte:node.end_byte].decode("utf-8", errors="ignore")
-    
+    """单独提取一个文件的 ALIAS 关系：只返回文件内即可解析的别名，跨文件的别名被丢弃"""
+    resolved, _ = extract_alias_relations_with_pending(root, code_bytes, contain_list, abs_path)
+    return resolved
+
+
+def extract_alias_relations_with_pending(
+    root,
+    code_bytes,
+    contain_list,
+    abs_path
+):
+    """返回 (ALIAS 关系, 待解析别名)；待解析别名收集后交给 resolve_pending_aliases"""
+    return split_pending_aliases(run_handler(root, code_bytes, make_alias_handler(code_bytes, contain_list, abs_path)))
+
+
+def split_pending_aliases(relations):
+    """从单个文件的关系中分离待解析别名，返回 (其余关系, 待解析别名)"""
+    if not any(rel.get('type') == PENDING_ALIAS for rel in relations):
+        return relations, []
+    resolved, pending = [], []
+    for rel in relations:
+        (pending if rel.get('type') == PENDING_ALIAS else resolved).append(rel)
+    return resolved, pending
+
+
+def resolve_pending_aliases(pending, symbol_index, file_visibility):
+    """
+    对照全局函数符号索引批量解析待解析别名，返回 ALIAS 关系列表
+    候选优先级：当前文件 > 可见文件中的定义 > 可见文件中的声明；
+    没有可见候选时，只有全局唯一的同名函数才会被采用（不标记 visibility_checked）
+    """
+    by_file = defaultdict(list)
+    for rel in pending:
+        by_file[rel['source_file']].append(rel)
+
+    cand_file = symbol_index.cand_file
+    cand_decl = symbol_index.cand_decl
     relations = []
-    extract_func = None
-    for pl in template.keys():
-        if pl in abs_path:
-            extract_func = template.get(pl)
-            break
-    if not extract_func:
-        return []
-    
-    con_dir = {entity['name']: entity['id'] for entity in contain_list if entity['type'] == 'FUNCTION'}
-    for child in root.children:
-        child_text = get_text(child)
-        alias_list = extract_func(child_text)
-        
-        for apair in alias_list:
-            kind = apair['type']
-            src_name = apair['src']
-            dst_name = apair['dst']
-
-            src_id = con_dir.get(src_name)
-            dst_id = con_dir.get(dst_name)
-
-            if src_id and dst_id:
-                rela = {
-                    'head': src_id,
-                    'tail': dst_id,
-                    'type': 'ALIAS',
-                    'kind': kind
-                }
-                relations.append(rela)
+    for source_file, file_pending in by_file.items():
+        current_file_id = symbol_index.file_id(source_file)
+        visible_ids = symbol_index.visible_files(source_file, file_visibility)
+        resolved_names = {}
+
+        def resolve(name):
+            if name in resolved_names:
+                return resolved_names[name]
+            best = None
+            best_priority = None
+            cands = symbol_index.candidates(FUNCTION, name)
+            for cand in cands:
+                file_id = cand_file[cand]
+                if file_id == current_file_id:
+                    priority = 0
+                elif file_id in visible_ids:
+                    priority = 2 if cand_decl[cand] else 1
+                else:
+                    continue
+                if best_priority is None or priority < best_priority:
+                    best, best_priority = cand, priority
+            if best is not None:
+                result = (symbol_index.entity(best), True)
+            elif len(cands) == 1:
+                result = (symbol_index.entity(cands[0]), False)
+            else:
+                result = (None, False)
+            resolved_names[name] = result
+            return result
+
+        for rel in file_pending:
+            head, head_checked = (rel['head'], True) if rel['head_resolved'] else resolve(rel['head'])
+            tail, tail_checked = (rel['tail'], True) if rel['tail_resolved'] else resolve(rel['tail'])
+            if head is None or tail is None:
+                continue
+            rela = {
+                'head': head,
+                'tail': tail,
+                'type': 'ALIAS',
+                'kind': rel['kind']
+            }
+            if head_checked and tail_checked:
+                rela['visibility_checked'] = True
+            relations.append(rela)
     return relations
@@ -1,5 +1,9 @@
 import os
-from extract_relation_assignedto import extract_assigned_to_relations
+from extract_relation_assignedto import make_assigned_to_handler
+from extract_macro_index import skip_non_variable_start, find_macro_entry, macro_entry_callee, macro_relation_cache
+from extract_context import FileContext, as_extern_set
+from extract_visitor import Handler, RelationSink, VisitorEngine, find_first, run_handler
+from extract_symbol_index import SymbolIndex
 # 环境变量控制调试输出
 DEBUG_MODE = os.getenv('DEBUG_MODE', '0') == '1'
 
@@ -18,94 +22,55 @@ def debug_print(*args, **kwargs):
     if DEBUG_MODE:
         print(*args, **kwargs)
 
-def skip_non_variable_start(input_string):
-    if not isinstance(input_string, str):
-        return ""
-
-    without_prefix = ''  
-    for i, char in enumerate(input_string):
-        if char.isalpha() or char == '_':
-            without_prefix = input_string[i:]
-            break
-    new_str = without_prefix.split('(')[0]
-    
-    for i in range(len(new_str)):
-        sin_index = len(new_str) - i - 1
-        sin_char = new_str[sin_index]
-        if sin_char.isalpha() or sin_char == '_':
-            without_suffix = new_str[:(sin_index+1)]
-            return without_suffix
-
-    return ""
-
-def extract_calls_relations(
-    root_node,
+def make_calls_handler(
     code_bytes,
-    function_id_map,
-    variable_id_map,
-    field_id_map,
+    symbol_index,
     current_file_path,
     file_visibility,
-    entity_file_map,
     extern_functions=None,
     macro_lookup_map=None,
     file_path=None,
-    all_entities=None,
-    flag=False
+    flag=False,
+    file_context=None
 ):
     """
     基于文件可见性的函数调用关系提取
     性能优化版本：预计算映射表，避免重复搜索
+    返回 CALLS 处理器，由 VisitorEngine 在单次遍历中分发 call_expression 节点
     """
+
+    # 🔧 性能优化1：候选的文件ID与声明标记都在 symbol_index 中，解析函数见 extract_symbol_index
+
+    # 🔧 性能优化2：文件ID、可见文件ID集合、解析缓存由同一文件的所有处理器共享
+    if file_context is None:
+        file_context = FileContext(symbol_index, current_file_path, file_visibility)
+    current_file_id = file_context.file_id
+    current_visible_files = file_context.visible_files
     
-    # 🔧 性能优化1：预计算函数声明映射表
-    function_declaration_map = {}
-    if all_entities:
-        for entity in all_entities:
-            if entity.get("type") == "FUNCTION":
-                func_id = entity.get("id")
-                if func_id:
-                    function_declaration_map[func_id] = entity.get("is_declaration", False)
-    
-    # 🔧 性能优化2：预计算可见文件集合
-    current_visible_files = file_visibility.get(current_file_path, {current_file_path})
-    
-    # 🔧 性能优化3：预计算extern函数集合
-    extern_functions_set = set(extern_functions) if extern_functions else set()
-    
+    # 🔧 性能优化3：extern函数集合在上下文中只构建一次
+    extern_functions_set = as_extern_set(extern_functions)
+
+    # 🔧 性能优化4：文件内共享的解析缓存，同名调用只解析一次
+    resolution_cache = file_context.resolution_cache
+
+    # 🔧 性能优化5：宏展开的语法树与子提取结果按展开文本跨文件缓存，按当前文件的解析结果校验后复用
+    def replay(trace):
+        return resolution_cache.replay(trace, symbol_index, current_visible_files, current_file_id, extern_functions_set)
+
     def get_text(node):
         return code_bytes[node.start_byte:node.end_byte].decode("utf-8", errors="ignore")
 
-    def find_identifier(node):
-        if node is None:
-            return None
-        if node.type == "identifier":
-            return node
-        for child in node.children:
-            result = find_identifier(child)
-            if result:
-                return result
-        return None
-
     def find_macro_expansion(node):
         if not flag:
             return None, None, None, None
         if not macro_lookup_map or not file_path:
             return None, None, None, None
 
-        node_start = (node.start_point[0] + 1, node.start_point[1] + 1)
-        node_end = (node.end_point[0] + 1, node.end_point[1] + 1)
-
-        for entry in macro_lookup_map.get(file_path, []):
-            (s_line, s_col), (e_line, e_col) = entry["range"]
-            macro_start = (s_line, s_col)
-            macro_end = (e_line, e_col)
-
-            if node_start <= macro_start and macro_end <= node_end:
-                if skip_non_variable_start(entry["expanded"]):
-                    return skip_non_variable_start(entry["expanded"]), entry["original"], entry["range"], entry
-
-        return None, None, None, None
+        # 区间索引查询，被调用名已在加载时规范化
+        entry = find_macro_entry(macro_lookup_map, file_path, node)
+        if entry is None:
+            return None, None, None, None
+        return macro_entry_callee(entry), entry["original"], entry["range"], entry
     
     def extract_macro_rela(node, entry):
         if not flag:
@@ -118,160 +83,99 @@ def extract_calls_relations(
             raise RuntimeError("Parser is not initialized")
 
         macro_expand = entry["extracted_lines"].encode()
-        sub_node = parser.parse(macro_expand).root_node
-        cal_rela = extract_calls_relations(sub_node, macro_expand, function_id_map, variable_id_map, field_id_map, current_file_path, file_visibility, entity_file_map, extern_functions, macro_lookup_map, file_path, all_entities)
-        assi_rela = extract_assigned_to_relations(sub_node, macro_expand, function_id_map, variable_id_map, field_id_map, current_file_path, file_visibility, entity_file_map, extern_functions, macro_lookup_map, file_path)
-        return cal_rela + assi_rela
+        # 相同展开文本：当前文件的解析结果与某个缓存变体的记录一致时直接复用，否则只复用语法树
+        cache_key = macro_relation_cache.make_key('calls', macro_expand)
+        cached, tree = macro_relation_cache.get(cache_key, replay, current_file_path)
+        if cached is not None:
+            return cached
+        if tree is None:
+            tree = parser.parse(macro_expand)
+
+        # 同一次遍历中提取宏展开内的 CALLS 与 ASSIGNED_TO，记录期间的全部名称解析
+        engine = VisitorEngine(macro_expand)
+        engine.register(make_calls_handler(macro_expand, symbol_index, current_file_path, file_visibility, extern_functions_set, macro_lookup_map, file_path, file_context=file_context))
+        engine.register(make_assigned_to_handler(macro_expand, symbol_index, current_file_path, file_visibility, extern_functions_set, macro_lookup_map, file_path, file_context=file_context))
+        with resolution_cache.tracing() as trace:
+            engine.run(tree.root_node)
+        relations = engine.collect()
+        macro_relation_cache.put(cache_key, tree, trace, relations, current_file_path)
+        return relations
+
+    relations = RelationSink()
+
+    def visit(node, current_function):
+        # 检查调用表达式
+        if not current_function:
+            return False
+        callee_node = node.child_by_field_name("function")
 
-    def is_function_declaration_fast(func_id):
-        """快速查找函数是否为声明（O(1)时间复杂度）"""
-        return function_declaration_map.get(func_id, False)
+        # 获取调用者ID
+        caller_id = resolution_cache.resolve_caller(symbol_index, current_function, current_file_id)
 
-    def resolve_callee_with_visibility(callee_name, current_function):
-        """
-        优化版本：减少重复计算，提高查找效率
-        """
-        
-        candidates = []
-        
-        # 1. 查找函数定义 - 优化的多值映射处理
-        func_ids = function_id_map.get(callee_name, [])
-        if not isinstance(func_ids, list):
-            func_ids = [func_ids] if func_ids else []
-        
-        for func_id in func_ids:
-            func_file = entity_file_map.get(func_id)
-            if func_file and func_file in current_visible_files:
-                # 优先级计算：当前文件(0) > 其他文件(10) + 声明惩罚(100)
-                base_priority = 0 if func_file == current_file_path else 10
-                decl_penalty = 100 if is_function_declaration_fast(func_id) else 0
-                final_priority = base_priority + decl_penalty
-                
-                candidates.append((func_id, "function", final_priority, func_file))
-        
-        # 2. 检查 extern 函数声明 - 优化查找
-        if callee_name in extern_functions_set:
-            best_extern_id = None
-            best_extern_priority = float('inf')
-            
-            for func_id in func_ids:
-                func_file = entity_file_map.get(func_id)
-                if func_file:  # extern函数不需要严格的可见性检查
-                    decl_penalty = 100 if is_function_declaration_fast(func_id) else 0
-                    if decl_penalty < best_extern_priority:
-                        best_extern_id = func_id
-                        best_extern_priority = decl_penalty
-            
-            if best_extern_id:
-                return best_extern_id, "extern_function"
-        
-        # 3. 查找局部函数指针变量
-        local_var_key = (callee_name, current_function)
-        if local_var_key in variable_id_map:
-            var_id_or_list = variable_id_map[local_var_key]
-            var_ids = var_id_or_list if isinstance(var_id_or_list, list) else [var_id_or_list]
-            
-            for var_id in var_ids:
-                var_file = entity_file_map.get(var_id)
-                if var_file and var_file in current_visible_files:
-                    return var_id, "local_func_ptr"
-        
-        # 4. 查找全局函数指针变量
-        global_var_key = (callee_name, 'global')
-        if global_var_key in variable_id_map:
-            var_id_or_list = variable_id_map[global_var_key]
-            var_ids = var_id_or_list if isinstance(var_id_or_list, list) else [var_id_or_list]
-            
-            for var_id in var_ids:
-                var_file = entity_file_map.get(var_id)
-                if var_file and var_file in current_visible_files:
-                    priority = 200 if var_file == current_file_path else 210
-                    candidates.append((var_id, "global_func_ptr", priority, var_file))
-        
-        # 5. 查找字段函数指针
-        field_ids = field_id_map.get(callee_name, [])
-        if not isinstance(field_ids, list):
-            field_ids = [field_ids] if field_ids else []
-            
-        for field_id in field_ids:
-            field_file = entity_file_map.get(field_id)
-            if field_file and field_file in current_visible_files:
-                return field_id, "field_func_ptr"
-        
-        # 选择最佳候选（按优先级排序）
-        if candidates:
-            candidates.sort(key=lambda x: x[2])
-            return candidates[0][0], candidates[0][1]
-        
-        return None, None
+        # 找不到调用者时不再深入该子树
+        if not caller_id:
+            return True
 
-    relations = []
+        callee_name = None
 
-    def traverse(node, current_function=None):
-        nonlocal relations
+        # 优先尝试匹配宏展开
+        expanded, original_macro, macro_range, entry = find_macro_expansion(node)
 
-        if node.type == "function_definition":
-            declarator = node.child_by_field_name("declarator")
-            id_node = find_identifier(declarator)
+        if expanded:
+            callee_name = expanded
+            macro_rela = extract_macro_rela(node, entry)
+            if macro_rela:
+                relations.extend(macro_rela)
+        else:
+            id_node = find_first(callee_node, ('identifier',))
             if id_node:
-                current_function = get_text(id_node)
-
-        # 检查调用表达式
-        if node.type == "call_expression" and current_function:
-            callee_node = node.child_by_field_name("function")
-            
-            # 获取调用者ID - 优化的多值映射处理
-            caller_ids = function_id_map.get(current_function, [])
-            if not isinstance(caller_ids, list):
-                caller_ids = [caller_ids] if caller_ids else []
-            
-            # 选择当前文件中的函数作为调用者
-            caller_id = None
-            for cid in caller_ids:
-                caller_file = entity_file_map.get(cid)
-                if caller_file == current_file_path:
-                    caller_id = cid
-                    break
-            
-            if not caller_id and caller_ids:
-                caller_id = caller_ids[0]
-                
-            if not caller_id:
-                return
-
-            callee_name = None
+                callee_name = get_text(id_node)
 
-            # 优先尝试匹配宏展开
-            expanded, original_macro, macro_range, entry = find_macro_expansion(node)
+        if callee_name:
+            resolved_id, resolved_type = resolution_cache.resolve_callee(
+                symbol_index, callee_name, current_function, current_visible_files, current_file_id, extern_functions_set
+            )
 
-            if expanded:
-                callee_name = expanded
-                macro_rela = extract_macro_rela(node, entry)
-                if macro_rela:
-                    relations.extend(macro_rela)
-            else:
-                id_node = find_identifier(callee_node)
-                if id_node:
-                    callee_name = get_text(id_node)
+            if resolved_id:
+                relation = {
+                    "head": caller_id,
+                    "tail": resolved_id,
+                    "type": "CALLS",
+                    "resolution_type": resolved_type,
+                    "visibility_checked": True
+                }
 
-            if callee_name:
-                resolved_id, resolved_type = resolve_callee_with_visibility(callee_name, current_function)
+                # 避免重复添加
+                relations.add(relation)
+        return False
 
-                if resolved_id:
-                    relation = {
-                        "head": caller_id,
-                        "tail": resolved_id,
-                        "type": "CALLS",
-                        "resolution_type": resolved_type,
-                        "visibility_checked": True
-                    }
-                    
-                    # 避免重复添加
-                    if relation not in relations:
-                        relations.append(relation)
+    return Handler("CALLS", ("call_expression",), visit=visit, results=relations)
 
-        for child in node.children:
-            traverse(child, current_function)
 
-    traverse(root_node)
-    return relations
\ No newline at end of file
+def extract_calls_relations(
+    root_node,
+    code_bytes,
+    function_id_map,
+    variable_id_map,
+    field_id_map,
+    current_file_path,
+    file_visibility,
+    entity_file_map,
+    extern_functions=None,
+    macro_lookup_map=None,
+    file_path=None,
+    all_entities=None,
+    flag=False,
+    symbol_index=None
+):
+    """
+    单独提取一个文件的 CALLS 关系
+    未传入 symbol_index 时由名称映射临时构建（批量处理时应在外部构建一次并复用）
+    """
+    if symbol_index is None:
+        symbol_index = SymbolIndex.from_maps(function_id_map, variable_id_map, field_id_map, entity_file_map, all_entities)
+    handler = make_calls_handler(
+        code_bytes, symbol_index, current_file_path, file_visibility,
+        extern_functions, macro_lookup_map, file_path, flag
+    )
+    return run_handler(root_node, code_bytes, handler)
@@ -0,0 +1,329 @@
+"""
+紧凑的符号索引
+
+把 function_id_map / variable_id_map(含参数) / field_id_map 这类「单值或列表」的名称映射
+统一成基于数组的索引：
+- 文件路径、实体ID都被驻留为整数ID
+- 每个键（函数名、(变量名, 作用域)、字段名）对应候选数组中的一段连续区间
+- 每个候选保存实体ID、所在文件ID和是否为声明
+所有提取器通过同一套查找接口访问，不再需要 isinstance(..., list) 归一化和 entity_file_map 查找。
+"""
+import sys
+from array import array
+from contextlib import contextmanager
+
+from extract_visibility import FileVisibility
+
+FUNCTION = 'function'
+VARIABLE = 'variable'
+FIELD = 'field'
+
+_EMPTY = range(0)
+
+
+def _as_list(value):
+    if isinstance(value, list):
+        return value
+    return [value] if value else []
+
+
+class SymbolIndex:
+    def __init__(self):
+        self.files = []            # 文件ID -> 文件路径
+        self.file_ids = {}         # 文件路径 -> 文件ID
+        self.entity_ids = []       # 实体序号 -> 原始实体ID
+        self.keys = {FUNCTION: {}, VARIABLE: {}, FIELD: {}}   # 命名空间 -> {键: 键序号}
+        self.starts = array('q', [0])   # 键序号 k 的候选区间为 [starts[k], starts[k+1])
+        self.cand_entity = array('q')   # 候选 -> 实体序号
+        self.cand_file = array('q')     # 候选 -> 文件ID（-1 表示未知文件）
+        self.cand_decl = bytearray()    # 候选 -> 是否为声明
+
+    # ---------- 构建 ----------
+    def intern_file(self, path):
+        file_id = self.file_ids.get(path)
+        if file_id is None:
+            file_id = len(self.files)
+            self.file_ids[path] = file_id
+            self.files.append(path)
+        return file_id
+
+    def _add(self, namespace, key, ids, entity_file_map, declaration_ids, entity_seq):
+        if isinstance(key, str):
+            key = sys.intern(key)
+        elif isinstance(key, tuple):
+            key = tuple(sys.intern(k) if isinstance(k, str) else k for k in key)
+        for entity_id in ids:
+            seq = entity_seq.get(entity_id)
+            if seq is None:
+                seq = entity_seq[entity_id] = len(self.entity_ids)
+                self.entity_ids.append(entity_id)
+            entity_file = entity_file_map.get(entity_id)
+            self.cand_entity.append(seq)
+            self.cand_file.append(self.intern_file(entity_file) if entity_file else -1)
+            self.cand_decl.append(1 if entity_id in declaration_ids else 0)
+        self.keys[namespace][key] = len(self.starts) - 1
+        self.starts.append(len(self.cand_entity))
+
+    @classmethod
+    def from_maps(cls, function_id_map, variable_id_map, field_id_map, entity_file_map, all_entities=None, visibility=None):
+        """
+        由原有的名称映射构建索引
+        variable_id_map 传入变量与参数合并后的映射（参数覆盖同名变量）
+        all_entities 用于获取函数的 is_declaration 标记
+        visibility 为 FileVisibility 时沿用其文件ID，使两者的文件ID一致
+        """
+        index = cls()
+        if isinstance(visibility, FileVisibility):
+            index.files = list(visibility.files)
+            index.file_ids = dict(visibility.file_ids)
+        declaration_ids = set()
+        for entity in all_entities or ():
+            if entity.get("type") == "FUNCTION" and entity.get("is_declaration", False):
+                declaration_ids.add(entity.get("id"))
+
+        entity_seq = {}
+        for namespace, mapping in ((FUNCTION, function_id_map), (VARIABLE, variable_id_map), (FIELD, field_id_map)):
+            for key, value in (mapping or {}).items():
+                index._add(namespace, key, _as_list(value), entity_file_map, declaration_ids, entity_seq)
+        return index
+
+    # ---------- 查找 ----------
+    def file_id(self, path):
+        return self.file_ids.get(path, -1)
+
+    def candidates(self, namespace, key):
+        """返回键对应的候选区间（range），不存在时为空区间"""
+        k = self.keys[namespace].get(key)
+        if k is None:
+            return _EMPTY
+        return range(self.starts[k], self.starts[k + 1])
+
+    def contains(self, namespace, key):
+        return key in self.keys[namespace]
+
+    def entity(self, cand):
+        return self.entity_ids[self.cand_entity[cand]]
+
+    def visible_files(self, current_file_path, file_visibility):
+        """
+        当前文件可见的文件ID集合（由位图展开，或由旧格式的路径集合转换）
+        没有可见性记录时与旧格式的默认值 {current_file_path} 一致，只包含当前文件在本索引中的ID
+        """
+        if isinstance(file_visibility, FileVisibility):
+            visible = file_visibility.visible_ids(current_file_path)
+            if visible is not None:
+                return visible
+            file_id = self.file_id(current_file_path)
+            return frozenset([file_id]) if file_id >= 0 else frozenset()
+        file_ids = self.file_ids
+        visible = file_visibility.get(current_file_path, {current_file_path})
+        return frozenset(file_ids[path] for path in visible if path in file_ids)
+
+
+def resolve_name_with_visibility(index, name, current_scope, visible_ids, current_file_id):
+    """基于可见性解析名称到实体ID：局部变量 > 当前文件 > 其他可见文件"""
+    cand_file = index.cand_file
+    best = None
+    best_priority = None
+
+    # 1. 局部变量 2. 全局变量 3. 函数 4. 字段；同优先级取先出现者
+    for namespace, key, same_file_priority, other_priority in (
+        (VARIABLE, (name, current_scope), 0, 0),
+        (VARIABLE, (name, 'global'), 0, 10),
+        (FUNCTION, name, 0, 1),
+        (FIELD, name, 0, 1),
+    ):
+        for cand in index.candidates(namespace, key):
+            file_id = cand_file[cand]
+            if file_id in visible_ids:
+                priority = same_file_priority if file_id == current_file_id else other_priority
+                if best_priority is None or priority < best_priority:
+                    best, best_priority = cand, priority
+                    if priority == 0:
+                        return index.entity(best)
+
+    return index.entity(best) if best is not None else None
+
+
+def resolve_field_with_visibility(index, field_name, visible_ids):
+    """解析字段访问：取第一个可见的同名字段"""
+    cand_file = index.cand_file
+    for cand in index.candidates(FIELD, field_name):
+        if cand_file[cand] in visible_ids:
+            return index.entity(cand)
+    return None
+
+
+def resolve_field_in_file(index, field_name, visible_ids, current_file_id):
+    """解析初始化器中的字段：优先当前文件中的同名字段，其次第一个可见的"""
+    cand_file = index.cand_file
+    for cand in index.candidates(FIELD, field_name):
+        if cand_file[cand] == current_file_id:
+            return index.entity(cand)
+    return resolve_field_with_visibility(index, field_name, visible_ids)
+
+
+def resolve_caller(index, function_name, current_file_id):
+    """调用者：优先选择当前文件中的同名函数，否则取第一个候选"""
+    cands = index.candidates(FUNCTION, function_name)
+    cand_file = index.cand_file
+    for cand in cands:
+        if cand_file[cand] == current_file_id:
+            return index.entity(cand)
+    if cands:
+        return index.entity(cands[0])
+    return None
+
+
+def resolve_callee_with_visibility(index, callee_name, current_function, visible_ids, current_file_id, extern_functions):
+    """
+    被调用者解析，返回 (实体ID, 解析类型)，解析不到时返回 (None, None)
+    优先级：extern 函数（不要求可见） > 局部函数指针 > 字段函数指针 > 其余候选按优先级取最小
+    其余候选：当前文件的函数(0) < 其他可见文件的函数(10)，声明再加 100；全局函数指针为 200 / 210
+    """
+    cand_file = index.cand_file
+    cand_decl = index.cand_decl
+    candidates = []
+
+    # 1. 查找函数定义
+    func_cands = index.candidates(FUNCTION, callee_name)
+    for cand in func_cands:
+        func_file = cand_file[cand]
+        if func_file in visible_ids:
+            # 优先级计算：当前文件(0) > 其他文件(10) + 声明惩罚(100)
+            base_priority = 0 if func_file == current_file_id else 10
+            decl_penalty = 100 if cand_decl[cand] else 0
+            candidates.append((cand, "function", base_priority + decl_penalty))
+
+    # 2. 检查 extern 函数声明 - extern函数不需要严格的可见性检查
+    if callee_name in extern_functions:
+        best_extern = None
+        best_extern_priority = float('inf')
+        for cand in func_cands:
+            if cand_file[cand] >= 0:
+                decl_penalty = 100 if cand_decl[cand] else 0
+                if decl_penalty < best_extern_priority:
+                    best_extern = cand
+                    best_extern_priority = decl_penalty
+        if best_extern is not None:
+            return index.entity(best_extern), "extern_function"
+
+    # 3. 查找局部函数指针变量
+    for cand in index.candidates(VARIABLE, (callee_name, current_function)):
+        if cand_file[cand] in visible_ids:
+            return index.entity(cand), "local_func_ptr"
+
+    # 4. 查找全局函数指针变量
+    for cand in index.candidates(VARIABLE, (callee_name, 'global')):
+        var_file = cand_file[cand]
+        if var_file in visible_ids:
+            priority = 200 if var_file == current_file_id else 210
+            candidates.append((cand, "global_func_ptr", priority))
+
+    # 5. 查找字段函数指针
+    for cand in index.candidates(FIELD, callee_name):
+        if cand_file[cand] in visible_ids:
+            return index.entity(cand), "field_func_ptr"
+
+    # 选择最佳候选（按优先级排序）
+    if candidates:
+        candidates.sort(key=lambda x: x[2])
+        return index.entity(candidates[0][0]), candidates[0][1]
+    return None, None
+
+
+class ResolutionCache:
+    """
+    单个翻译单元内的名称解析缓存，由同一文件的所有提取器共享
+    键为 (解析类型, 名称, 作用域)，文件隐含在缓存实例中：切换文件时调用 reset 或新建实例
+    所有与当前文件有关的查找都经过这里，因此 tracing() 记录下的 {键: 结果} 完整描述了一次提取对当前文件的依赖：
+    另一个文件对这些键给出相同结果时（replay），同一语法树上的提取结果也相同
+    """
+
+    def __init__(self, current_file_path=None):
+        self.current_file_path = current_file_path
+        self.table = {}
+        self.hits = 0
+        self.misses = 0
+        self.traces = []    # 正在记录的 {键: 结果}（嵌套记录时外层也包含内层的查找）
+
+    def reset(self, current_file_path):
+        if current_file_path != self.current_file_path:
+            self.current_file_path = current_file_path
+            self.table.clear()
+
+    def memo(self, key, compute, *args):
+        """命中直接返回；未命中调用 compute(*args) 并记录结果（包括 None）"""
+        table = self.table
+        if key in table:
+            self.hits += 1
+            value = table[key]
+        else:
+            self.misses += 1
+            value = table[key] = compute(*args)
+        for trace in self.traces:
+            trace.setdefault(key, value)
+        return value
+
+    def resolve_name(self, index, name, current_scope, visible_ids, current_file_id):
+        return self.memo(
+            ('name', name, current_scope), resolve_name_with_visibility,
+            index, name, current_scope, visible_ids, current_file_id
+        )
+
+    def resolve_field(self, index, field_name, visible_ids):
+        return self.memo(('field', field_name, None), resolve_field_with_visibility, index, field_name, visible_ids)
+
+    def resolve_field_in_file(self, index, field_name, visible_ids, current_file_id):
+        return self.memo(
+            ('field_in_file', field_name, None), resolve_field_in_file, index, field_name, visible_ids, current_file_id
+        )
+
+    def resolve_caller(self, index, function_name, current_file_id):
+        return self.memo(('caller', function_name, None), resolve_caller, index, function_name, current_file_id)
+
+    def resolve_callee(self, index, callee_name, current_function, visible_ids, current_file_id, extern_functions):
+        return self.memo(
+            ('callee', callee_name, current_function), resolve_callee_with_visibility,
+            index, callee_name, current_function, visible_ids, current_file_id, extern_functions
+        )
+
+    def lookup(self, key, index, visible_ids, current_file_id, extern_functions):
+        """按键重新解析（结果同样进入缓存）"""
+        kind, name, scope = key
+        if kind == 'name':
+            return self.resolve_name(index, name, scope, visible_ids, current_file_id)
+        if kind == 'field':
+            return self.resolve_field(index, name, visible_ids)
+        if kind == 'field_in_file':
+            return self.resolve_field_in_file(index, name, visible_ids, current_file_id)
+        if kind == 'caller':
+            return self.resolve_caller(index, name, current_file_id)
+        if kind == 'callee':
+            return self.resolve_callee(index, name, scope, visible_ids, current_file_id, extern_functions)
+        raise KeyError(key)
+
+    @contextmanager
+    def tracing(self):
+        """记录 with 块中的全部查找，产出 {键: 结果}"""
+        trace = {}
+        self.traces.append(trace)
+        try:
+            yield trace
+        finally:
+            self.traces.pop()
+
+    def replay(self, trace, index, visible_ids, current_file_id, extern_functions):
+        """当前文件对 trace 中每个键的解析结果是否都与记录一致"""
+        for key, value in trace.items():
+            if self.lookup(key, index, visible_ids, current_file_id, extern_functions) != value:
+                return False
+        return True
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
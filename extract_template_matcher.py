@@ -0,0 +1,523 @@
+"""
+日志行 -> FAIL_TEMPLATE 匹配
+
+FAIL_TEMPLATE 的名称由 extract_template_regex 生成：格式化占位符替换为 `xxx `，引号、反斜杠、换行和制表符替换为空格并合并空格。
+把生产环境的内核 / glibc 日志行映射回打印它的模板、源码位置和所在函数（HAS_MESSAGE 的 scope）：
+- 日志行做与模板相同的规范化；成批匹配时整块文本一起规范化（几次 C 层的 translate / replace），不逐行处理
+- 模板按 `xxx` 切分成字面片段，每个模板选一个「完整词」（不与占位符相邻的词）中最罕见的作为索引词；
+  日志行与全部完整词的交集决定了哪些模板的完整词检查能通过，按这个集合缓存合并好的候选（按得分降序），
+  同一模板打印出的行只在首次出现时合并候选，之后逐个用预编译的正则（片段按顺序出现）校验，第一个通过的即为最优
+- 没有完整词的模板（如 `xxx: xxx`、`xxx=xxx`）以最长的字面片段为键，建成片段字典树，编译为一个正则自动机：
+  在日志行的每个位置取最长的命中片段，再加上它的所有同为键的前缀，即得到行中出现的全部片段；
+  片段模板得分都不高，只在它们可能超过当前最优时检查，可能超过的模板不多时直接逐个做子串检查
+- 模板正则在行内任意位置查找，但首尾的字面片段必须落在词边界上（行首/空格之后、行尾/空格之前），
+  与词索引的假设一致：日志行带有时间戳、`[ 1.23]`、模块名等前缀时结果不变
+- 多个模板都能匹配时取字面字符最多的（最具体的）模板
+
+python extract_template_matcher.py --bench [--workers N]            合成日志语料上的吞吐量基准
+python extract_template_matcher.py --entities entity.json --relations relation.json --log kern.log
+
+吞吐量范围：纯 Python 单进程每行至少要做一次 split、一次集合交集和一次正则校验。--bench 的合成语料
+（5000 个模板、20 万行，每个模板约 40 行，候选缓存的冷启动占比高）在单核测试机上约 9 万行/秒；
+每秒数十万行需要 --workers 多进程并行，单进程不以此为目标
+"""
+import re
+import sys
+import json
+import time
+import random
+import multiprocessing
+from collections import defaultdict, Counter
+
+from extract_fail_message import extract_template_regex
+
+PLACEHOLDER = 'xxx'
+
+# 与 extract_template_regex 一致：引号、反斜杠、空白都视为空格
+_NORMALIZE_TABLE = str.maketrans({'"': ' ', '\\': ' ', '\t': ' ', '\n': ' ', '\r': ' '})
+# 常见的日志行前缀：内核时间戳 "[   12.345678] "
+DEFAULT_LINE_PREFIX = re.compile(r'^\s*\[\s*\d+\.\d+\]\s*')
+
+
+def normalize_line(line, prefix=DEFAULT_LINE_PREFIX):
+    if prefix is not None and line.lstrip()[:1] == '[':
+        line = prefix.sub('', line, count=1)
+    return ' '.join(line.translate(_NORMALIZE_TABLE).split())
+
+
+# normalize_line 的整块版本：先把换行以外的空白统一为空格（\s 与 str.isspace 一致），
+# 行首尾与连续空格、行前缀都用 C 层的 replace / 带字面前缀的正则处理；引号和反斜杠在去掉行前缀之后再换成空格
+_LINE_SPACES = '\t\x0b\x0c\r\x1c\x1d\x1e\x1f\x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000'
+_CHUNK_SPACE_TABLE = str.maketrans(_LINE_SPACES, ' ' * len(_LINE_SPACES))
+_CHUNK_QUOTE_TABLE = str.maketrans({'"': ' ', '\\': ' '})
+_CHUNK_LINE_PREFIX = re.compile(r'\n\[ ?\d+\.\d+\] ?')
+_CHUNK_SPACE_RUN = re.compile('  +')
+
+
+def _collapse_chunk_spaces(text):
+    """text 以换行开头：合并连续空格，去掉每行首尾的空格（最后一行的行尾除外）"""
+    if '  ' in text:
+        text = _CHUNK_SPACE_RUN.sub(' ', text)
+    return text.replace('\n ', '\n').replace(' \n', '\n')
+
+
+def normalize_chunk(lines, prefix=DEFAULT_LINE_PREFIX):
+    """
+    一批日志行的 normalize_line，结果与逐行规范化一致
+    整块文本只做几次 translate / replace；自定义前缀或行内含换行时退回逐行规范化
+    """
+    if prefix is not None and prefix is not DEFAULT_LINE_PREFIX:
+        return [normalize_line(line, prefix) for line in lines]
+    # 行尾空白（含换行符）在规范化时本就会去掉；开头补一个换行，每行都以换行起始
+    text = _collapse_chunk_spaces('\n' + '\n'.join(map(str.rstrip, lines)).translate(_CHUNK_SPACE_TABLE))
+    if prefix is not None and '\n[' in text:
+        text = _CHUNK_LINE_PREFIX.sub('\n', text)
+    if '"' in text or '\\' in text:
+        text = _collapse_chunk_spaces(text.translate(_CHUNK_QUOTE_TABLE))
+    normalized = text[1:].split('\n')
+    if len(normalized) != len(lines):
+        return [normalize_line(line, prefix) for line in lines]
+    normalized[-1] = normalized[-1].rstrip(' ')
+    return normalized
+
+
+def _trie_pattern(words):
+    """
+    一组字面串 -> 字典树形式的正则（公共前缀合并，分支按首字符区分）
+    可选的后缀为贪婪匹配，因此在每个位置上匹配到的是以该位置开头的最长的串
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        terminal = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if terminal:
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+def template_fragments(template):
+    """模板 -> 字面片段列表（片段之间为占位符）"""
+    return template.split(PLACEHOLDER)
+
+
+def template_pattern(fragments):
+    """
+    片段按顺序出现即匹配；占位符可匹配任意文本
+    extract_template_regex 在每个占位符后补了一个空格，实际输出中该空格不一定存在，因此可选
+    """
+    parts = []
+    last = len(fragments) - 1
+    for i, fragment in enumerate(fragments):
+        if i > 0:
+            if fragment.startswith(' '):
+                fragment = fragment[1:]
+                optional_space = ' ?'
+            else:
+                optional_space = ''
+            # 开头的占位符对 search 没有约束，省略以避免在每个起点上回溯
+            if parts:
+                parts.append('.*?' + optional_space)
+        if fragment:
+            parts.append(re.escape(fragment))
+            if i == 0:
+                # 首个字面片段从词首开始；断言放在字面串之后，正则以字面串开头，可用快速的子串查找定位起点
+                parts.append(f'(?<![^ ]{re.escape(fragment)})')
+            if i == last:
+                parts.append('(?![^ ])')      # 最后一个字面片段在词尾结束
+    return re.compile(''.join(parts))
+
+
+def template_anchor(fragments):
+    """最长的字面片段（去掉首尾空格后一定原样出现在匹配行中），用于正则校验前的子串预检"""
+    return max((fragment.strip(' ') for fragment in fragments), key=len)
+
+
+def complete_tokens(fragments):
+    """
+    不与占位符相邻的完整词：日志行按空格切分后一定原样出现（模板正则的首尾片段在词边界上）
+    占位符之后的第一个词可能与占位符的值连在一起（补出的空格不存在），不算完整词
+    """
+    tokens = []
+    last = len(fragments) - 1
+    for i, fragment in enumerate(fragments):
+        if i > 0 and fragment.startswith(' '):
+            fragment = fragment[1:]     # 占位符后补出的空格
+        pieces = fragment.split(' ')
+        if i > 0:
+            pieces = pieces[1:]
+        if i < last and pieces and not fragment.endswith(' '):
+            pieces = pieces[:-1]
+        tokens.extend(p for p in pieces if p)
+    return tokens
+
+
+class TemplateMatcher:
+    """
+    编译全部模板的匹配索引
+    templates: [(模板ID, 模板文本)]
+    sites: 模板ID -> [{instance, scope, source_file, start_line}]（由 FAIL_MESSAGE / HAS_MESSAGE 得到）
+    """
+    # 能超过当前最优的片段模板不多于此数时逐个做子串检查，否则运行片段自动机
+    FRAGMENT_SCAN_LIMIT = 64
+
+    def __init__(self, templates, sites=None, line_prefix=DEFAULT_LINE_PREFIX, cache_size=1 << 16):
+        self.line_prefix = line_prefix
+        self.sites = sites or {}
+        self.ids = []
+        self.texts = []
+        self.patterns = []
+        self.anchors = []
+        self.scores = []
+        self.required = []                      # 模板序号 -> 完整词集合
+        self.token_index = defaultdict(list)    # 完整词 -> [模板序号]
+        self.fragment_index = defaultdict(list) # 没有完整词的模板：最长字面片段 -> 候选（含以该片段的前缀为键的模板）
+        self.fragment_automaton = None          # fragment_index 键的字典树正则，findall 得到每个位置上最长的键
+        self.fragment_entries = []              # 全部片段模板的候选
+        self.fragment_above = [0]               # 得分 s -> 得分高于 s 的片段模板数
+        self.cache_size = cache_size
+        self._candidate_cache = {}              # 行中出现的完整词集合 -> 候选
+        # 以上「候选」均为 [(得分, 锚点, 正则, 模板序号)]，按得分降序
+
+        for template_id, text in templates:
+            fragments = template_fragments(text)
+            literal = ''.join(fragments)
+            if not literal.strip():
+                continue    # 全是占位符的模板可以匹配任何行，不参与匹配
+            self.ids.append(template_id)
+            self.texts.append(text)
+            self.patterns.append(template_pattern(fragments))
+            self.anchors.append(template_anchor(fragments))
+            self.scores.append(len(literal.replace(' ', '')))
+            self.required.append(frozenset(complete_tokens(fragments)))
+        # 全部完整词：行与它的交集决定了哪些模板的完整词检查能通过
+        self.vocabulary = frozenset().union(*self.required)
+        # 校验所需的全部数据与按得分降序的名次，合并候选时直接取用
+        self._entries = [(score, anchor, pattern.search, t)
+                         for t, (score, anchor, pattern) in enumerate(zip(self.scores, self.anchors, self.patterns))]
+        order = sorted(range(len(self.scores)), key=lambda t: (-self.scores[t], t))
+        self._rank = [0] * len(order)
+        for rank, t in enumerate(order):
+            self._rank[t] = rank
+
+        # 每个模板只用最罕见的完整词建索引
+        frequency = Counter(token for tokens in self.required for token in tokens)
+        for t, tokens in enumerate(self.required):
+            if tokens:
+                token = min(tokens, key=lambda tok: (frequency[tok], -len(tok), tok))
+                self.token_index[token].append(t)
+                continue
+            # 没有完整词时以锚点（最长的字面片段，匹配行中一定原样出现）为键
+            self.fragment_index[self.anchors[t]].append(t)
+            self.fragment_entries.append(self._entries[t])
+        self.fragment_entries.sort(key=lambda entry: self._rank[entry[3]])
+        if self.fragment_entries:
+            scores = [entry[0] for entry in self.fragment_entries]
+            self.fragment_above = [sum(1 for score in scores if score > s) for s in range(scores[0] + 1)]
+        # 自动机在每个位置只报告最长的键，同一位置上作为它前缀的其他键一并计入
+        fragments = list(self.fragment_index)
+        closure = {}
+        for fragment in fragments:
+            hits = [t for end in range(1, len(fragment) + 1) for t in self.fragment_index.get(fragment[:end], ())]
+            closure[fragment] = [self._entries[t] for t in sorted(hits, key=self._rank.__getitem__)]
+        self.fragment_index = closure
+        if fragments:
+            self.fragment_automaton = re.compile(f"(?=({_trie_pattern(fragments)}))")
+
+    @classmethod
+    def from_graph(cls, entities, relations, **kwargs):
+        """由提取结果（entity / relation 列表）构建：FAIL_TEMPLATE + HAS_INSTANCE + HAS_MESSAGE"""
+        templates = []
+        messages = {}
+        for entity in entities:
+            entity_type = entity.get('type')
+            if entity_type == 'FAIL_TEMPLATE':
+                templates.append((entity['id'], entity['name']))
+            elif entity_type == 'FAIL_MESSAGE':
+                messages[entity['id']] = entity
+
+        instance_template = {}
+        instance_scopes = defaultdict(list)
+        for rel in relations:
+            rel_type = rel.get('type')
+            if rel_type == 'HAS_INSTANCE':
+                instance_template[rel['tail']] = rel['head']
+            elif rel_type == 'HAS_MESSAGE':
+                instance_scopes[rel['tail']].append(rel['head'])
+
+        sites = defaultdict(list)
+        for instance_id, template_id in instance_template.items():
+            message = messages.get(instance_id, {})
+            sites[template_id].append({
+                'instance': instance_id,
+                'scopes': instance_scopes.get(instance_id, []),
+                'source_file': message.get('source_file'),
+                'start_line': message.get('start_line'),
+            })
+        return cls(templates, dict(sites), **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def match_normalized(self, normalized):
+        """规范化后的行 -> 模板序号（没有匹配时为 None）；多个模板能匹配时取得分最高的"""
+        return self.match_normalized_chunk([normalized])[0]
+
+    def _candidates(self, key):
+        """
+        行中出现的完整词集合 -> 完整词检查能通过的候选，按得分降序
+        同一模板打印出的行（只有占位符的值不同）得到同一个集合，候选只合并、过滤一次
+        """
+        cache = self._candidate_cache
+        if len(cache) >= self.cache_size:
+            cache.clear()
+        required = self.required
+        token_index_get = self.token_index.get
+        hits = {t for token in key for t in token_index_get(token, ()) if required[t] <= key}
+        candidates = cache[key] = [self._entries[t] for t in sorted(hits, key=self._rank.__getitem__)]
+        return candidates
+
+    def match_normalized_chunk(self, normalized_lines):
+        """
+        规范化后的一批行 -> [模板序号或 None]
+        词索引的候选按得分降序，第一个通过正则校验的即为最优；
+        片段模板得分都不高，只有当前最优低于其中一些模板的得分时才检查：
+        这样的模板不多时逐个做子串检查，多时运行片段自动机，只校验片段出现在行中的模板
+        """
+        vocabulary_in = self.vocabulary.intersection
+        cache_get = self._candidate_cache.get
+        fragment_index = self.fragment_index
+        fragment_entries = self.fragment_entries
+        fragment_above = self.fragment_above
+        fragment_score = len(fragment_above) - 1
+        scan_limit = self.FRAGMENT_SCAN_LIMIT
+        find_fragments = self.fragment_automaton.findall if self.fragment_automaton is not None else None
+        results = []
+        for normalized in normalized_lines:
+            best, best_score = None, 0
+            key = vocabulary_in(normalized.split(' '))
+            candidates = cache_get(key)
+            if candidates is None:
+                candidates = self._candidates(key)
+            for score, anchor, search, t in candidates:
+                if anchor in normalized and search(normalized):
+                    best, best_score = t, score
+                    break
+
+            if best_score < fragment_score:
+                if fragment_above[best_score] <= scan_limit:
+                    for score, anchor, search, t in fragment_entries:
+                        if score <= best_score:
+                            break
+                        if anchor in normalized and search(normalized):
+                            best, best_score = t, score
+                            break
+                else:
+                    # 自动机找到的片段都原样出现在行中，其前缀（closure 中其他模板的锚点）亦然，无需再做子串预检
+                    for fragment in set(find_fragments(normalized)):
+                        for score, anchor, search, t in fragment_index[fragment]:
+                            if score <= best_score:
+                                break
+                            if search(normalized):
+                                best, best_score = t, score
+                                break
+            results.append(best)
+        return results
+
+    def match(self, line):
+        """日志行 -> 模板ID（没有匹配时为 None）"""
+        t = self.match_normalized(normalize_line(line, self.line_prefix))
+        return self.ids[t] if t is not None else None
+
+    def match_chunk(self, lines):
+        """一批日志行 -> [模板序号或 None]"""
+        return self.match_normalized_chunk(normalize_chunk(lines, self.line_prefix))
+
+    def match_lines(self, lines, num_workers=1, chunksize=4096):
+        """
+        逐行匹配，产出 (行号, 模板ID)；未匹配的行不产出
+        num_workers > 1 时按块在进程池中匹配（每个进程各自构建一次索引），结果按行序返回
+        """
+        ids = self.ids
+        chunks = _chunked(lines, chunksize)
+        if num_workers > 1:
+            pool = multiprocessing.Pool(
+                processes=num_workers, initializer=_init_match_worker,
+                initargs=(list(zip(self.ids, self.texts)), self.line_prefix)
+            )
+            results = pool.imap(_match_worker, chunks)
+        else:
+            pool = None
+            results = map(self.match_chunk, chunks)
+
+        line_no = 0
+        try:
+            for chunk_result in results:
+                for t in chunk_result:
+                    line_no += 1
+                    if t is not None:
+                        yield line_no, ids[t]
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def locate(self, template_id):
+        """模板ID -> 打印该模板的源码位置与 HAS_MESSAGE 作用域"""
+        return self.sites.get(template_id, [])
+
+
+def _chunked(lines, size):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+_WORKER_MATCHER = None
+
+def _init_match_worker(templates, line_prefix):
+    global _WORKER_MATCHER
+    _WORKER_MATCHER = TemplateMatcher(templates, line_prefix=line_prefix)
+
+def _match_worker(lines):
+    return _WORKER_MATCHER.match_chunk(lines)
+
+
+# ========== 合成日志语料基准 ==========
+_COMMON_WORDS = (
+    "failed allocate device driver buffer timeout invalid state queue request "
+    "reset link memory region mapping interrupt channel firmware version error "
+    "unable register module clock power resume suspend probe config address "
+    "port slot bus controller entry table cache page block inode mount"
+).split()
+_SPECS = ['%d', '%s', '%x', '%lu', '%p', '%08x']
+
+
+def _synthetic_vocabulary(rng, size=3000):
+    """常用词 + 子系统/符号风格的随机词（如 mlx5_core、ext4_fill_super），接近真实日志的词分布"""
+    syllables = ['ext', 'mlx', 'nvme', 'usb', 'pci', 'eth', 'snd', 'drm', 'i2c', 'spi', 'tcp', 'xfs', 'btrfs',
+                 'core', 'fill', 'super', 'init', 'irq', 'dma', 'ring', 'tx', 'rx', 'hw', 'fw', 'ctrl', 'phy']
+    words = set(_COMMON_WORDS)
+    while len(words) < size:
+        word = '_'.join(rng.choice(syllables) + (str(rng.randint(0, 9)) if rng.random() < 0.3 else '')
+                        for _ in range(rng.randint(1, 3)))
+        words.add(word)
+    return sorted(words)
+
+
+def _synthetic_format(rng, vocabulary):
+    parts = []
+    for _ in range(rng.randint(3, 9)):
+        if rng.random() < 0.3:
+            spec = rng.choice(_SPECS)
+            parts.append(rng.choice([spec, f"={spec}", f"({spec})", f"{spec}:"]))
+        else:
+            # 常用词与长尾词混合
+            parts.append(rng.choice(_COMMON_WORDS) if rng.random() < 0.5 else rng.choice(vocabulary))
+    return '"' + ' '.join(parts) + '\\n"'
+
+
+def _render(fmt, rng):
+    def value(match):
+        spec = match.group(0)
+        if spec.endswith('s'):
+            return rng.choice(_COMMON_WORDS) + str(rng.randint(0, 99))
+        if spec.endswith('p'):
+            return hex(rng.getrandbits(48))
+        return str(rng.randint(0, 1 << 16))
+    text = re.sub(r'%[-+ #0]*\d*\.?\d*[a-zA-Z]+', value, fmt.strip('"').replace('\\n', ''))
+    return f"[{rng.randint(0, 99999):5d}.{rng.randint(0, 999999):06d}] {text}"
+
+
+def bench(num_templates=5000, num_lines=200000, noise=0.1, seed=0, num_workers=1):
+    rng = random.Random(seed)
+    formats = {}
+    vocabulary = _synthetic_vocabulary(rng)
+    while len(formats) < num_templates:
+        fmt = _synthetic_format(rng, vocabulary)
+        template = extract_template_regex(fmt)
+        if template and template not in formats:
+            formats[template] = fmt
+    templates = [(str(i), template) for i, template in enumerate(formats)]
+    fmt_of = {str(i): fmt for i, fmt in enumerate(formats.values())}
+
+    lines, expected = [], []
+    for _ in range(num_lines):
+        if rng.random() < noise:
+            # 噪声行只包含模板中不会出现的词，任何匹配都是误报
+            lines.append(' '.join(f"zz{rng.getrandbits(32):x}" for _ in range(6)))
+            expected.append(None)
+        else:
+            template_id = rng.choice(templates)[0]
+            lines.append(_render(fmt_of[template_id], rng))
+            expected.append(template_id)
+
+    start = time.perf_counter()
+    matcher = TemplateMatcher(templates)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [None] * num_lines
+    for line_no, template_id in matcher.match_lines(lines, num_workers):
+        results[line_no - 1] = template_id
+    match_time = time.perf_counter() - start
+
+    # 合成模板之间可能互相覆盖，匹配到的模板与期望模板文本相同或同样能匹配该行都算正确
+    position = {template_id: t for t, template_id in enumerate(matcher.ids)}
+    correct = sum(
+        1 for line, got, want in zip(lines, results, expected)
+        if got == want or (got is not None and want is not None and matcher.patterns[position[want]].search(normalize_line(line)))
+    )
+    print(f"模板 {len(matcher)} 个（词索引 {sum(len(v) for v in matcher.token_index.values())}，"
+          f"片段自动机 {sum(1 for required in matcher.required if not required)}），构建 {build_time:.2f}s")
+    print(f"日志 {num_lines} 行，匹配 {match_time:.2f}s，{num_lines / match_time:,.0f} 行/秒，正确率 {correct / num_lines * 100:.2f}%")
+    return num_lines / match_time
+
+
+def _load_json_or_jsonl(path):
+    if path.endswith(('.jsonl', '.jsonl.gz', '.jsonl.xz')):
+        from extract_writer import read_jsonl
+        return list(read_jsonl(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="把日志行映射到 FAIL_TEMPLATE 及其源码位置")
+    parser.add_argument("--bench", action="store_true", help="在合成日志语料上测试吞吐量")
+    parser.add_argument("--templates", type=int, default=5000, help="基准：模板数")
+    parser.add_argument("--lines", type=int, default=200000, help="基准：日志行数")
+    parser.add_argument("--entities", type=str, help="entity.json / entity.jsonl 路径")
+    parser.add_argument("--relations", type=str, help="relation.json / relation.jsonl 路径")
+    parser.add_argument("--log", type=str, help="日志文件路径（不指定则读标准输入）")
+    parser.add_argument("--workers", type=int, default=1, help="匹配进程数")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.templates, args.lines, num_workers=args.workers)
+        sys.exit(0)
+
+    if not args.entities or not args.relations:
+        parser.error("需要 --entities 和 --relations（或使用 --bench）")
+    matcher = TemplateMatcher.from_graph(_load_json_or_jsonl(args.entities), _load_json_or_jsonl(args.relations))
+    print(f"✅ 已加载 {len(matcher)} 个模板", file=sys.stderr)
+    log = open(args.log, 'r', encoding='utf-8', errors='ignore') if args.log else sys.stdin
+    with log:
+        for line_no, template_id in matcher.match_lines(log, args.workers):
+            print(json.dumps({'line': line_no, 'template': template_id, 'sites': matcher.locate(template_id)}, ensure_ascii=False))
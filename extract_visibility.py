@@ -0,0 +1,172 @@
+"""
+基于位图的文件可见性表
+
+原先的 file_visibility 为 {文件路径: 可见文件路径集合}，内核上有数万个集合、每个集合数千个长路径字符串。
+这里把文件路径映射为稠密的整数文件ID，每个文件的可见集合存为 zlib 压缩的位图：
+- 文件ID按被包含的次数从高到低分配，常用头文件集中在低位，位图短且易压缩
+- 相同的可见集合只存一份
+- 兼容原 dict 接口：get(path, default) 返回支持 `in` / 迭代的可见集合视图
+"""
+import zlib
+import pickle
+from array import array
+
+
+def _bits_to_ids(bitmap):
+    """位图 -> 置位的文件ID列表"""
+    ids = []
+    for byte_index, byte in enumerate(bitmap):
+        if byte:
+            base = byte_index << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    ids.append(base + bit)
+    return ids
+
+
+class VisibleFiles:
+    """单个文件的可见集合视图，既可以用文件ID判断，也可以用文件路径判断"""
+
+    __slots__ = ('bitmap', 'visibility')
+
+    def __init__(self, bitmap, visibility):
+        self.bitmap = bitmap
+        self.visibility = visibility
+
+    def __contains__(self, item):
+        if isinstance(item, str):
+            item = self.visibility.file_ids.get(item, -1)
+        if item is None or item < 0:
+            return False
+        byte_index = item >> 3
+        return byte_index < len(self.bitmap) and bool(self.bitmap[byte_index] >> (item & 7) & 1)
+
+    def ids(self):
+        return _bits_to_ids(self.bitmap)
+
+    def __iter__(self):
+        files = self.visibility.files
+        return (files[i] for i in _bits_to_ids(self.bitmap))
+
+    def __len__(self):
+        return sum(bin(byte).count('1') for byte in self.bitmap)
+
+
+class FileVisibility:
+    def __init__(self):
+        self.files = []                 # 文件ID -> 文件路径
+        self.file_ids = {}              # 文件路径 -> 文件ID
+        self.blobs = []                 # 压缩位图（去重后）
+        self.file_blob = array('q')     # 文件ID -> 位图下标（-1 表示没有可见性记录）
+        self._decoded_file = -1         # is_visible 最近解压的文件ID及其可见集合
+        self._decoded = None
+
+    @classmethod
+    def from_sets(cls, file_visibility):
+        """由旧格式 {路径: 可见路径集合} 构建"""
+        visibility = cls()
+
+        # 按被可见的次数降序分配文件ID
+        counts = {}
+        for path, visible in file_visibility.items():
+            counts[path] = counts.get(path, 0)
+            for visible_path in visible:
+                counts[visible_path] = counts.get(visible_path, 0) + 1
+        for path in sorted(counts, key=lambda p: (-counts[p], p)):
+            visibility.file_ids[path] = len(visibility.files)
+            visibility.files.append(path)
+
+        visibility.file_blob = array('q', [-1]) * len(visibility.files)
+        blob_ids = {}
+        for path, visible in file_visibility.items():
+            ids = [visibility.file_ids[p] for p in visible]
+            bitmap = bytearray((max(ids) >> 3) + 1 if ids else 0)
+            for file_id in ids:
+                bitmap[file_id >> 3] |= 1 << (file_id & 7)
+            blob = zlib.compress(bytes(bitmap))
+            blob_id = blob_ids.get(blob)
+            if blob_id is None:
+                blob_id = blob_ids[blob] = len(visibility.blobs)
+                visibility.blobs.append(blob)
+            visibility.file_blob[visibility.file_ids[path]] = blob_id
+        return visibility
+
+    def file_id(self, path):
+        return self.file_ids.get(path, -1)
+
+    def bitmap(self, file_id):
+        """文件的可见位图（解压后），没有记录时返回 None"""
+        if file_id < 0 or file_id >= len(self.file_blob):
+            return None
+        blob_id = self.file_blob[file_id]
+        if blob_id < 0:
+            return None
+        return zlib.decompress(self.blobs[blob_id])
+
+    def is_visible(self, file_id, entity_file_id):
+        """
+        entity_file_id 所在文件对 file_id 是否可见；没有可见性记录时只有自身可见
+        最近一次查询的文件的可见集合解压后保留，连续查询同一文件时不再解压位图
+        """
+        if entity_file_id < 0:
+            return False
+        if file_id != self._decoded_file:
+            bitmap = self.bitmap(file_id)
+            self._decoded = frozenset(_bits_to_ids(bitmap)) if bitmap is not None else None
+            self._decoded_file = file_id
+        if self._decoded is None:
+            return file_id == entity_file_id
+        return entity_file_id in self._decoded
+
+    def visible_ids(self, path):
+        """文件可见的文件ID集合；没有可见性记录时返回 None，由调用方按自身的文件ID回退"""
+        bitmap = self.bitmap(self.file_id(path))
+        if bitmap is None:
+            return None
+        return frozenset(_bits_to_ids(bitmap))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_decoded_file'] = -1
+        state['_decoded'] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault('_decoded_file', -1)
+        state.setdefault('_decoded', None)
+        self.__dict__.update(state)
+
+    # ---------- 兼容 dict 接口 ----------
+    def get(self, path, default=None):
+        bitmap = self.bitmap(self.file_id(path))
+        if bitmap is None:
+            return default
+        return VisibleFiles(bitmap, self)
+
+    def __contains__(self, path):
+        return self.bitmap(self.file_id(path)) is not None
+
+    def __len__(self):
+        return sum(1 for blob_id in self.file_blob if blob_id >= 0)
+
+
+def load_file_visibility(value):
+    """name2id.pkl 中的 file_visibility 可能是旧格式 dict，也可能已经是 FileVisibility"""
+    if isinstance(value, FileVisibility):
+        return value
+    return FileVisibility.from_sets(value)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="把 name2id.pkl 中的 file_visibility 转换为位图格式")
+    parser.add_argument("input", type=str, help="原 name2id.pkl 路径")
+    parser.add_argument("output", type=str, help="输出 pkl 路径")
+    args = parser.parse_args()
+
+    with open(args.input, 'rb') as f:
+        data = pickle.load(f)
+    data['file_visibility'] = load_file_visibility(data['file_visibility'])
+    with open(args.output, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"✅ 已转换：{len(data['file_visibility'])} 个文件，{len(data['file_visibility'].blobs)} 个不同的可见集合")
@@ -0,0 +1,297 @@
+"""
+单次解析、单次遍历的关系提取引擎
+
+每个文件只解析一次，遍历一次语法树，按节点类型把节点分发给已注册的处理器。
+新增一种关系只需要注册一个处理器，而不需要再做一次完整的解析和遍历。
+默认由编译好的 tree-sitter 查询（Language.query + captures）在 C 层定位候选节点，Python 只处理命中的节点；
+关闭查询时退回基于 TreeCursor 的迭代遍历。两种方式都不使用 Python 递归，深层嵌套的表达式不会触发递归深度限制。
+"""
+import re
+from collections import Counter
+
+from tree_sitter import Language
+import tree_sitter_c as tsc
+
+C_LANGUAGE = Language(tsc.language())
+
+# 编译后的查询按查询源码缓存，每个进程每种处理器组合只编译一次
+_QUERY_CACHE = {}
+
+# 起止位置相同的嵌套节点按容器层级排序，保证与前序遍历一致（父节点先于子节点）
+_CONTAINER_RANK = {
+    'function_definition': 0,
+    'declaration': 1,
+    'expression_statement': 1,
+    'init_declarator': 2,
+}
+
+# walk 的 enter 回调返回 SKIP 表示不进入该节点的子树
+SKIP = object()
+
+
+def walk(node, enter):
+    """
+    以 TreeCursor 前序遍历 node 的子树（含 node 自身）
+    enter(cur) 返回 None 继续深入，返回 SKIP 跳过 cur 的子树，返回其他值则立即结束遍历并返回该值
+    """
+    if node is None:
+        return None
+    cursor = node.walk()
+    while True:
+        result = enter(cursor.node)
+        if result is None:
+            if cursor.goto_first_child():
+                continue
+        elif result is not SKIP:
+            return result
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return None
+
+
+def find_first(node, node_types, prune_types=()):
+    """前序遍历中第一个类型属于 node_types 的节点；prune_types 类型的子树整体跳过"""
+    def enter(cur):
+        node_type = cur.type
+        if node_type in node_types:
+            return cur
+        if node_type in prune_types:
+            return SKIP
+        return None
+    return walk(node, enter)
+
+
+def find_function_name(node, code_bytes):
+    """从 function_definition 的 declarator 中取出函数名"""
+    cur = find_first(node.child_by_field_name('declarator'), ('identifier',))
+    if cur is None:
+        return None
+    return code_bytes[cur.start_byte:cur.end_byte].decode("utf-8", errors="ignore").strip()
+
+
+class RelationSink:
+    """
+    关系收集器：替代 `if relation not in relations` 的列表线性扫描
+    - 以关系字典的全部键值作为哈希键去重（与字典相等判断一致），单文件提取为线性复杂度
+    - 按关系类型计数；multiplicity=True 时额外记录每条关系被提取到的次数
+    按首次加入的顺序迭代，可直接当作关系列表使用
+    """
+
+    def __init__(self, relations=(), multiplicity=False):
+        self.relations = []
+        self.seen = set()
+        self.type_counts = Counter()
+        self.multiplicity = Counter() if multiplicity else None
+        self.duplicates = 0
+        self.extend(relations)
+
+    @staticmethod
+    def key(relation):
+        return frozenset(relation.items())
+
+    def add(self, relation):
+        """加入一条关系，已存在时返回 False"""
+        key = frozenset(relation.items())
+        if self.multiplicity is not None:
+            self.multiplicity[key] += 1
+        if key in self.seen:
+            self.duplicates += 1
+            return False
+        self.seen.add(key)
+        self.relations.append(relation)
+        self.type_counts[relation.get("type")] += 1
+        return True
+
+    def extend(self, relations):
+        for relation in relations:
+            self.add(relation)
+
+    def count(self, relation):
+        """关系被提取到的次数（需要 multiplicity=True）"""
+        if self.multiplicity is None:
+            return 1 if self.key(relation) in self.seen else 0
+        return self.multiplicity[self.key(relation)]
+
+    def __contains__(self, relation):
+        return self.key(relation) in self.seen
+
+    def __iter__(self):
+        return iter(self.relations)
+
+    def __len__(self):
+        return len(self.relations)
+
+    def __bool__(self):
+        return bool(self.relations)
+
+
+class Handler:
+    """
+    关系处理器
+    - node_types: 关心的节点类型；visit(node, scope) 返回 True 表示跳过该节点的子树（只对本处理器生效）
+    - query: 可选的 tree-sitter 查询模式，用 @node 标记分发给 visit 的节点，用于在 C 层进一步缩小候选；
+      必须覆盖 visit 会产生结果或返回 True 的所有节点。不提供时按 node_types 生成
+    - on_file: 文件级处理器，每个文件调用一次 on_file(root_node)，返回关系列表
+    提取结果统一放在 results 中（列表或 RelationSink）
+    """
+
+    def __init__(self, name, node_types=(), visit=None, on_file=None, results=None, query=None):
+        self.name = name
+        self.node_types = frozenset(node_types)
+        self.visit = visit
+        self.on_file = on_file
+        self.results = results if results is not None else []
+        self.query = query
+
+    def query_source(self):
+        if self.query:
+            return self.query
+        return " ".join(f"({node_type}) @node" for node_type in sorted(self.node_types))
+
+
+def compile_query(source):
+    query = _QUERY_CACHE.get(source)
+    if query is None:
+        query = _QUERY_CACHE[source] = C_LANGUAGE.query(source)
+    return query
+
+
+class VisitorEngine:
+    """对一棵语法树做一次前序遍历，并把节点分发给所有处理器"""
+
+    def __init__(self, code_bytes, use_query=True):
+        self.code_bytes = code_bytes
+        self.handlers = []
+        self.use_query = use_query
+
+    def register(self, handler):
+        self.handlers.append(handler)
+        return handler
+
+    def run(self, root_node):
+        # 文件级处理器：复用同一棵树
+        for handler in self.handlers:
+            if handler.on_file is not None:
+                handler.results.extend(handler.on_file(root_node) or [])
+
+        if self.use_query:
+            return self._run_query(root_node)
+        return self._run_cursor(root_node)
+
+    def _run_query(self, root_node):
+        """
+        所有处理器的模式合并为一个查询，由 captures 一次取出全部候选节点；
+        候选按前序（起点升序、终点降序）排列后依次分发，作用域与子树跳过按字节区间维护
+        """
+        patterns = ["(function_definition) @scope"]
+        visits = {}
+        for i, handler in enumerate(self.handlers):
+            if handler.visit is None:
+                continue
+            visits[f"h{i}"] = (i, handler.visit)
+            patterns.append(re.sub(r'@node\b', f'@h{i}', handler.query_source()))
+        if not visits:
+            return self.handlers
+
+        items = []
+        seen = set()
+        for name, nodes in compile_query("\n".join(patterns)).captures(root_node).items():
+            if name == 'scope':
+                i = -1
+            elif name in visits:
+                i = visits[name][0]
+            else:
+                continue
+            for node in nodes:
+                key = (i, node.id)
+                if key in seen:
+                    continue
+                seen.add(key)
+                items.append((node.start_byte, -node.end_byte, _CONTAINER_RANK.get(node.type, 3), i, node))
+        items.sort(key=lambda item: item[:4])
+
+        handler_visits = {i: visit for i, visit in visits.values()}
+        code_bytes = self.code_bytes
+        skip_end = {i: -1 for i in handler_visits}
+        functions = []      # 外层函数栈：(结束字节, 函数名)
+        for start, _, _, i, node in items:
+            while functions and functions[-1][0] <= start:
+                functions.pop()
+            if i < 0:
+                func_name = find_function_name(node, code_bytes)
+                if func_name:
+                    functions.append((node.end_byte, func_name))
+                continue
+            if start < skip_end[i]:
+                continue
+            scope = functions[-1][1] if functions else None
+            if handler_visits[i](node, scope):
+                skip_end[i] = max(skip_end[i], node.end_byte)
+        return self.handlers
+
+    def _run_cursor(self, root_node):
+        # 节点类型 -> [(处理器下标, visit)]
+        dispatch = {}
+        for i, handler in enumerate(self.handlers):
+            if handler.visit is None:
+                continue
+            for node_type in handler.node_types:
+                dispatch.setdefault(node_type, []).append((i, handler.visit))
+        if not dispatch:
+            return self.handlers
+
+        # 所有节点处理器都跳过某棵子树时，不再进入该子树
+        full_mask = 0
+        for i, handler in enumerate(self.handlers):
+            if handler.visit is not None:
+                full_mask |= 1 << i
+
+        # TreeCursor 迭代遍历；scope / mask 为父节点传给子节点的状态（当前函数、已跳过的处理器），
+        # 进入子节点时压栈，回到父节点时出栈
+        code_bytes = self.code_bytes
+        cursor = root_node.walk()
+        scope, mask = None, 0
+        frames = []
+        while True:
+            node = cursor.node
+            node_type = node.type
+            node_scope, node_mask = scope, mask
+
+            if node_type == 'function_definition':
+                func_name = find_function_name(node, code_bytes)
+                if func_name:
+                    node_scope = func_name
+
+            targets = dispatch.get(node_type)
+            if targets:
+                for i, visit in targets:
+                    bit = 1 << i
+                    if node_mask & bit:
+                        continue
+                    if visit(node, node_scope):
+                        node_mask |= bit
+
+            if node_mask != full_mask and cursor.goto_first_child():
+                frames.append((scope, mask))
+                scope, mask = node_scope, node_mask
+                continue
+
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return self.handlers
+                scope, mask = frames.pop()
+
+    def collect(self):
+        """按注册顺序合并所有处理器的结果"""
+        relations = []
+        for handler in self.handlers:
+            relations.extend(handler.results)
+        return relations
+
+
+def run_handler(root_node, code_bytes, handler):
+    """只用一个处理器遍历整棵树（供各提取函数的独立调用入口使用）"""
+    engine = VisitorEngine(code_bytes)
+    engine.register(handler)
+    engine.run(root_node)
+    return list(handler.results)
@@ -0,0 +1,110 @@
+"""
+流式 JSON Lines 输出
+
+提取过程中逐条写出实体和关系，而不是在内存中累积完整列表后再 json.dump(indent=2)：
+- 每行一个 JSON 对象，可选 gzip / xz 压缩（标准库）
+- 关系在写出时按 (head, tail, type) 精确去重，只保留键元组而不是关系字典本身；
+  去重集合随不同关系数线性增长，是写出端唯一不随输出规模保持平坦的内存（dedup=False 时关闭，改由下游去重）
+- 写出时同步统计关系类型与可见性检查覆盖
+"""
+import os
+import gzip
+import lzma
+import json
+from collections import Counter
+
+COMPRESSION_SUFFIX = {
+    None: '',
+    'none': '',
+    'gzip': '.gz',
+    'xz': '.xz',
+}
+
+
+def output_path(base_path, compression=None):
+    """entity.jsonl + 压缩方式 -> 实际输出路径"""
+    return base_path + COMPRESSION_SUFFIX[compression]
+
+
+def open_text(path, mode='wt', compression=None):
+    if compression == 'gzip':
+        return gzip.open(path, mode, encoding='utf-8', compresslevel=6)
+    if compression == 'xz':
+        return lzma.open(path, mode, encoding='utf-8', preset=3 if 'w' in mode else None)
+    return open(path, mode.replace('t', ''), encoding='utf-8')
+
+
+def relation_key(rel):
+    """去重键，与 deduplicate_relations 一致"""
+    return (rel['head'], rel['tail'], rel['type'])
+
+
+class JsonlWriter:
+    """逐行写出 JSON 对象"""
+
+    def __init__(self, path, compression=None):
+        self.path = output_path(path, compression)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.handle = open_text(self.path, 'wt', compression)
+        self.count = 0
+
+    def write(self, obj):
+        self.handle.write(json.dumps(obj, ensure_ascii=False, separators=(',', ':')))
+        self.handle.write('\n')
+        self.count += 1
+        return True
+
+    def write_many(self, objs):
+        for obj in objs:
+            self.write(obj)
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RelationJsonlWriter(JsonlWriter):
+    """
+    关系写出：在线去重 + 类型统计
+    seen 为每条不同关系保存一个 (head, tail, type) 键，内存为 O(不同关系数)；
+    dedup=False 时不去重、内存平坦，重复关系需由下游（如 sort -u）去除
+    """
+
+    def __init__(self, path, compression=None, dedup=True):
+        super().__init__(path, compression)
+        self.seen = set() if dedup else None
+        self.duplicates = 0
+        self.type_counts = Counter()
+        self.visibility_checked = 0
+
+    def write(self, rel):
+        if self.seen is not None:
+            key = relation_key(rel)
+            if key in self.seen:
+                self.duplicates += 1
+                return False
+            self.seen.add(key)
+        self.type_counts[rel['type']] += 1
+        if rel.get('visibility_checked'):
+            self.visibility_checked += 1
+        return super().write(rel)
+
+
+def read_jsonl(path, compression=None):
+    """逐行读取 JSON Lines 文件（压缩方式可由后缀推断）"""
+    if compression is None:
+        for name, suffix in COMPRESSION_SUFFIX.items():
+            if suffix and path.endswith(suffix):
+                compression = name
+    with open_text(path, 'rt', compression) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
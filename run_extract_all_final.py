@@ -8,6 +8,7 @@ from tree_sitter import Language, Parser
 import tree_sitter_c as tsc
 import sys
 import gc
+# 本仓库内的关系提取器均已改为 TreeCursor 迭代遍历；实体提取与 RETURNS / TYPE_OF 模块仍为递归实现，保留该上限
 sys.setrecursionlimit(100000)
 # === 实体提取模块 ===
 from extract_entity_file import extract_file_entity
@@ -15,19 +16,32 @@ from extract_entity_variable import extract_variable_entities, extract_function_
 from extract_entity_function import extract_function_entities
 from extract_entity_struct import extract_struct_entities
 from extract_entity_field import extract_field_entities
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing
 import pickle
 # === 关系提取模块 ===
-from extract_relation_calls import extract_calls_relations
-from extract_relation_assignedto import extract_assigned_to_relations
+from extract_relation_calls import extract_calls_relations, make_calls_handler
+from extract_relation_assignedto import extract_assigned_to_relations, make_assigned_to_handler
 from extract_relation_contains import build_file_level_contains
 from extract_relation_has_members import extract_has_member_relations
 from extract_relation_has_parameters import extract_has_parameter_relations
 from extract_relation_has_variables import extract_has_variable_relations
 from extract_relation_returns import extract_returns_relations
 from extract_relation_typeof import extract_typeof_relations
-from extract_fail_message import extarct_mes
-from extract_relation_alias import extract_alias_relations
+from extract_fail_message import (
+    make_fail_message_handler, build_contain_dir, FailMessages, local_id_counter, merge_fail_messages
+)
+from extract_relation_alias import (
+    extract_alias_relations, make_alias_handler, split_pending_aliases, resolve_pending_aliases
+)
+from extract_mount import make_mount_to_handler
+from extract_visitor import Handler, VisitorEngine
+from extract_cache import ExtractionCache, build_entity_digests, build_function_index_digest
+from extract_context import ExtractionContext
+from extract_visibility import load_file_visibility
+from extract_macro_index import build_macro_index, macro_relation_cache
+from extract_writer import JsonlWriter, RelationJsonlWriter
+import extract_columnar
+from extract_columnar import write_columnar, deduplicate_relations_vectorized
 # === 包含关系提取模块 ===
 from extract_relation_includes import extract_include_relations, build_transitive_includes, extract_extern_declarations
 
@@ -54,9 +68,10 @@ def get_c_files(directory):
                 yield os.path.join(root, file)
 
 def load_macro_lookup_map(json_path):
+    """读取宏展开信息，并为每个文件构建按位置排序的区间索引（MacroIndex）"""
     if not os.path.exists(json_path):
         print(f"Warning: Macro file not found: {json_path}")
-        return defaultdict(list)
+        return {}
         
     with open(json_path, 'r') as f:
         macro_json = json.load(f)
@@ -74,7 +89,7 @@ def load_macro_lookup_map(json_path):
             "original": entry["name"],
             'extracted_lines': entry['extracted_lines']
         })
-    return macro_lookup_map
+    return build_macro_index(macro_lookup_map)
 
 def build_entity_file_mapping(all_entities):
     """构建实体ID到文件路径的映射"""
@@ -104,138 +119,194 @@ def build_file_to_entities_mapping(all_entities):
     
     return file_to_entities
 
-# ========== 优化1：减少数据传递，使用全局变量（适用于多进程） ==========
-_GLOBAL_SHARED_DATA = None
+def deduplicate_relations(relations):
+    """去重关系列表"""
+    seen = set()
+    unique_relations = []
+    
+    for rel in relations:
+        rel_key = (rel['head'], rel['tail'], rel['type'])
+        if rel_key not in seen:
+            seen.add(rel_key)
+            unique_relations.append(rel)
+    
+    return unique_relations
 
-def init_worker(shared_data_path):
-    """进程初始化函数：从磁盘加载共享数据"""
-    global _GLOBAL_SHARED_DATA
-    with open(shared_data_path, 'rb') as f:
-        _GLOBAL_SHARED_DATA = pickle.load(f)
+def build_file_engine(code_bytes, source_path, context, messages, file_context):
+    """
+    为单个文件注册所有关系处理器：
+    CALLS / ASSIGNED_TO / MOUNTED_TO / FAIL_MESSAGE 在同一次遍历中分发，
+    RETURNS / TYPE_OF / ALIAS 作为文件级处理器复用同一棵树
+    CALLS / ASSIGNED_TO / MOUNTED_TO 共享同一个 FileContext（可见文件集合与名称解析缓存）
+    """
+    engine = VisitorEngine(code_bytes)
+    symbol_index = context.symbol_index
+    engine.register(make_calls_handler(
+        code_bytes, symbol_index, source_path, context.file_visibility,
+        context.extern_functions, context.macro_lookup_map, source_path, flag=True,
+        file_context=file_context
+    ))
+    engine.register(make_assigned_to_handler(
+        code_bytes, symbol_index, source_path, context.file_visibility,
+        context.extern_functions, context.macro_lookup_map, source_path,
+        file_context=file_context
+    ))
+    engine.register(make_mount_to_handler(
+        code_bytes, symbol_index, source_path, context.file_visibility,
+        file_context=file_context
+    ))
+    # RETURNS 提取模块仍使用原始名称映射
+    engine.register(Handler('RETURNS', on_file=lambda root: extract_returns_relations(
+        root, code_bytes, context.function_id_map, context.var_param_map, context.field_id_map,
+        source_path, context.file_visibility, context.entity_file_map
+    )))
+    engine.register(Handler('TYPE_OF', on_file=lambda root: extract_typeof_relations(
+        root, code_bytes, context.var_param_entities, context.field_entities, context.struct_id_map,
+        source_path, context.file_visibility, context.entity_file_map
+    )))
+
+    contain_list = context.file_to_entities.get(os.path.abspath(source_path), [])
+    engine.register(make_alias_handler(code_bytes, contain_list, os.path.abspath(source_path)))
+    engine.register(make_fail_message_handler(
+        code_bytes, source_path, local_id_counter(), build_contain_dir(contain_list), messages
+    ))
+    return engine
+
+def extract_file_relations(parser, source_path, context, code_bytes, file_context):
+    """
+    解析一次文件，单次遍历提取全部关系
+    FAIL_MESSAGE 使用文件内的临时ID（"f:<n>"），由主进程 merge_fail_messages 统一编号
+    返回 (relations, fail_entities, fail_relations)
+    """
+    messages = FailMessages()
 
+    tree = parser.parse(code_bytes)
+    engine = build_file_engine(code_bytes, source_path, context, messages, file_context)
+    engine.run(tree.root_node)
+    rels = engine.collect()
+    del tree
+    return rels, messages.entities, messages.relations
 
-# ========== 优化2：轻量级工作函数（只传文件路径） ==========
-def process_calls_worker(source_path):
-    """阶段4：CALLS关系提取（轻量级版本）"""
-    parser = get_parser()
-    abs_source_path = os.path.abspath(source_path)
-    
-    try:
-        with open(abs_source_path, 'rb') as f:
-            code_bytes = f.read()
-        tree = parser.parse(code_bytes)
-        root = tree.root_node
-        
-        shared = _GLOBAL_SHARED_DATA
-        rels = extract_calls_relations(
-            root, code_bytes, 
-            shared['function_id_map'], 
-            shared['var_param_map'],
-            shared['field_id_map'],
-            source_path, 
-            shared['file_visibility'], 
-            shared['entity_file_map'], 
-            shared['all_extern_functions'], 
-            shared['macro_lookup_map'], 
-            source_path, 
-            shared['all_entities'],
-            flag=True
+def process_source_file(parser, source_path, context):
+    """
+    带增量缓存的单文件提取
+    返回 (source_path, relations, fail_entities, fail_relations, cache_hit, stats)
+    stats 为本文件的名称解析缓存与宏展开缓存的命中/未命中计数（宏展开缓存另计跨文件命中与只复用语法树的次数）
+    """
+    with open(os.path.abspath(source_path), 'rb') as f:
+        code_bytes = f.read()
+
+    cache = context.get('cache')
+    key = None
+    if cache is not None:
+        key = cache.fingerprint(
+            code_bytes,
+            context.file_visibility.get(source_path, {source_path}),
+            context.entity_digests,
+            list(context.macro_lookup_map.get(source_path, [])),
+            context.function_index_digest
         )
-        gc.collect()
-        del tree, root
-        return rels
-    except Exception as e:
-        print(f"Error in {source_path}: {e}")
-        return []
+        cached = cache.load(source_path, key)
+        if cached is not None:
+            return (source_path, *cached, True, {})
+
+    # 每个文件一个新的 FileContext，解析缓存即按文件失效
+    file_context = context.file_context(source_path)
+    resolution_cache = file_context.resolution_cache
+    macro_before = macro_relation_cache.stats()
+    result = extract_file_relations(parser, source_path, context, code_bytes, file_context)
+    if cache is not None:
+        cache.store(source_path, key, result)
+    stats = {
+        'resolve_hits': resolution_cache.hits,
+        'resolve_misses': resolution_cache.misses,
+    }
+    macro_after = macro_relation_cache.stats()
+    for key in ('hits', 'cross_file_hits', 'tree_hits', 'misses'):
+        stats[f'macro_{key}'] = macro_after[key] - macro_before[key]
+    return (source_path, *result, False, stats)
 
-def process_assigned_worker(source_path):
-    """阶段5：ASSIGNED_TO关系提取"""
-    parser = get_parser()
-    abs_source_path = os.path.abspath(source_path)
-    
+# ========== 多进程模式：符号表只加载一次，子进程只接收文件路径 ==========
+_GLOBAL_SHARED_DATA = None
+_WORKER_PARSER = None
+
+def init_worker(shared_data_path=None):
+    """
+    进程初始化函数（每个子进程只调用一次）
+    fork 模式下共享数据已通过写时复制继承，无需加载；
+    spawn 模式下（如 Windows）从磁盘快照加载一次
+    """
+    global _GLOBAL_SHARED_DATA, _WORKER_PARSER
+    if _GLOBAL_SHARED_DATA is None and shared_data_path:
+        with open(shared_data_path, 'rb') as f:
+            _GLOBAL_SHARED_DATA = pickle.load(f)
+    _WORKER_PARSER = get_parser()
+
+def process_file_worker(source_path):
+    """子进程任务：单文件提取全部关系（见 process_source_file）"""
     try:
-        with open(abs_source_path, 'rb') as f:
-            code_bytes = f.read()
-        tree = parser.parse(code_bytes)
-        root = tree.root_node
-        
-        shared = _GLOBAL_SHARED_DATA
-        rels = extract_assigned_to_relations(
-            root, code_bytes,
-            shared['function_id_map'],
-            shared['var_param_map'],
-            shared['field_id_map'],
-            source_path,
-            shared['file_visibility'],
-            shared['entity_file_map'],
-            shared['all_extern_functions'],
-            shared['macro_lookup_map'],
-            source_path,
-            flag=True
-        )
-        
-        del tree, root
-        return rels
+        return process_source_file(_WORKER_PARSER, source_path, _GLOBAL_SHARED_DATA)
     except Exception as e:
         print(f"Error in {source_path}: {e}")
-        return []
+        return source_path, [], [], [], False, {}
 
-def init_worker(var_ent, par_ent, fld_ent, str_map, file_vis, ent_map):
+def parallel_extract(c_files, shared_data, output_dir, num_workers=8, chunksize=16):
     """
-    在每个子进程启动时初始化全局变量
-    这个函数会在每个工作进程创建时被调用一次
+    多进程单次遍历提取（阶段 4-6），逐文件产出 process_source_file 的结果
+    - fork：共享数据在创建进程池前放入模块全局变量，子进程写时复制继承，不做逐任务序列化
+    - spawn：共享数据写一次快照，每个子进程在初始化时加载一次
+    结果按提交顺序流式返回主进程（保证 FAIL_MESSAGE 编号确定）
     """
-    global variable_entities, param_entities, field_entities
-    global struct_id_map, file_visibility, entity_file_map
-    
-    variable_entities = var_ent
-    param_entities = par_ent
-    field_entities = fld_ent
-    struct_id_map = str_map
-    file_visibility = file_vis
-    entity_file_map = ent_map
-
-
-def parallel_extract_with_threads(c_files, shared_data, process_func, stage_name, num_workers=8):
-    """使用线程池并行处理（适合I/O密集型任务）"""
-    print(f"\n{'='*60}")
-    print(f"{stage_name} (使用 {num_workers} 个线程)")
-    
-    # 设置全局共享数据（线程间共享内存，无序列化开销）
     global _GLOBAL_SHARED_DATA
-    _GLOBAL_SHARED_DATA = shared_data
-    
-    all_rels = []
-    
-    with ThreadPoolExecutor(max_workers=num_workers) as executor:
-        # 提交所有任务
-        futures = {executor.submit(process_func, f): f for f in c_files}
-        
-        # 使用 tqdm 显示进度
-        with tqdm(total=len(c_files), desc=stage_name) as pbar:
-            for future in as_completed(futures):
-                rels = future.result()
-                all_rels.extend(rels)
-                pbar.update(1)
-    
-    print(f"✅ {stage_name} 完成，提取到 {len(all_rels)} 条关系")
-    return all_rels
+    print(f"阶段 4-6：多进程提取关系（{num_workers} 个进程）")
 
+    shared_data_path = None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('fork')
+        _GLOBAL_SHARED_DATA = shared_data
+        # 冻结当前对象，避免子进程 GC 触碰共享页面导致写时复制
+        gc.collect()
+        gc.freeze()
+    else:
+        ctx = multiprocessing.get_context('spawn')
+        shared_data_path = os.path.join(output_dir, 'shared_data.pkl')
+        with open(shared_data_path, 'wb') as f:
+            pickle.dump(shared_data, f, protocol=pickle.HIGHEST_PROTOCOL)
 
-def deduplicate_relations(relations):
-    """去重关系列表"""
-    seen = set()
-    unique_relations = []
-    
-    for rel in relations:
-        rel_key = (rel['head'], rel['tail'], rel['type'])
-        if rel_key not in seen:
-            seen.add(rel_key)
-            unique_relations.append(rel)
+    try:
+        with ctx.Pool(processes=num_workers, initializer=init_worker, initargs=(shared_data_path,)) as pool:
+            yield from pool.imap(process_file_worker, c_files, chunksize=chunksize)
+    finally:
+        if ctx.get_start_method() == 'fork':
+            gc.unfreeze()
+            _GLOBAL_SHARED_DATA = None
+        if shared_data_path and os.path.exists(shared_data_path):
+            os.remove(shared_data_path)
+
+def serial_extract(c_files, shared_data):
+    """串行单次遍历提取（阶段 4-6），逐文件产出 process_source_file 的结果"""
+    parser = get_parser()
+    for i, source_path in enumerate(c_files):
+        if i % 1000 == 0:
+            gc.collect()
+        yield process_source_file(parser, source_path, shared_data)
+
+def print_relation_stats(relation_types, visibility_checked, total):
+    """关系类型与可见性检查覆盖统计"""
+    print(f"\n关系类型统计：")
+    for k, v in relation_types.items():
+        print(f"  - {k}: {v}")
     
-    return unique_relations
+    if total:
+        print(f"\n可见性检查覆盖：{visibility_checked}/{total} ({visibility_checked/total*100:.1f}%)")
 
-def extract_all(source_dir, output_dir):
+def extract_all(source_dir, output_dir, num_workers=1, cache_dir=None, output_format='json', compression=None):
+    """
+    output_format:
+    - json：累积全部关系，最终去重后写 entity.json / relation.json
+    - jsonl：边提取边写 entity.jsonl / relation.jsonl（可选 gzip / xz 压缩），在线去重，内存不随仓库规模增长
+    - npy：去重后写列式目录 graph/（可内存映射的 .npy 数组 + meta.json 取值表），见 extract_columnar
+    """
     os.makedirs(output_dir, exist_ok=True)
     entity_path = os.path.join(output_dir, 'entity.json')
     relation_path = os.path.join(output_dir, 'relation.json')
@@ -302,146 +373,153 @@ def extract_all(source_dir, output_dir):
     field_entities = data_to_save['field_entities']
 
 
-    var_param_map = {**variable_id_map, **param_id_map}
-    
-    shared_data = {
-        'function_id_map': function_id_map,
-        'var_param_map': var_param_map,
-        'field_id_map': field_id_map,
-        'struct_id_map': struct_id_map,
-        'file_visibility': file_visibility,
-        'entity_file_map': entity_file_map,
-        'all_extern_functions': all_extern_functions,
-        'macro_lookup_map': macro_lookup_map,
-        'all_entities': all_entities,
-        'var_param_entities': variable_entities + param_entities,
-        'field_entities': field_entities
-    }
-    # === 阶段 4：函数调用关系（并行版） ===
-    print(f"\n" + "="*60)
-    print("阶段 4：提取 CALLS 关系（并行）...")
-    """
-    calls_rels = parallel_extract_with_threads(
-        c_files, shared_data, process_calls_worker,
-        "阶段 4：CALLS", 8
-    )
-    all_relations.extend(calls_rels)
-    """
-    for source_path in tqdm(c_files, desc="阶段 4：提取 CALLS"):
-        abs_source_path = os.path.abspath(source_path)
-
-        if len(all_relations) % 1000 == 0:
-            gc.collect()
-
-        with open(abs_source_path, 'rb') as f:
-            code_bytes = f.read()
-        tree = parser.parse(code_bytes)
-        root = tree.root_node
+    # 可见性转为位图格式（旧格式的路径集合在转换后释放）
+    file_visibility = load_file_visibility(file_visibility)
+    del data_to_save
+    print(f"✅ 可见性位图：{len(file_visibility)} 个文件，{len(file_visibility.blobs)} 个不同的可见集合")
 
-        rels = extract_calls_relations(
-            root, code_bytes, function_id_map, {**variable_id_map, **param_id_map}, field_id_map,
-            source_path, file_visibility, entity_file_map, all_extern_functions, macro_lookup_map, source_path, all_entities, flag=True
+    # 全局只读上下文：符号索引、变量/参数合并映射、extern 集合等只在这里构建一次
+    file_to_entities = build_file_to_entities_mapping(all_entities)
+    extra = {}
+    if cache_dir:
+        extra['cache'] = ExtractionCache(cache_dir)
+        extra['entity_digests'] = build_entity_digests(file_to_entities)
+        extra['function_index_digest'] = build_function_index_digest(
+            function_id_map, entity_file_map, all_entities, all_extern_functions
         )
-        all_relations.extend(rels)
-
-        del tree
-        del root
-
-    # === 阶段 5：赋值关系 ===
-    print(f"\n" + "="*60)
-    print("阶段 5：提取 ASSIGNED_TO 关系...")
-    
-    for source_path in tqdm(c_files, desc="阶段 5：提取 ASSIGNED_TO"):
-        abs_source_path = os.path.abspath(source_path)
-        
-        if len(all_relations) % 1000 == 0:
-            gc.collect()
-
-        with open(abs_source_path, 'rb') as f:
-            code_bytes = f.read()
-        tree = parser.parse(code_bytes)
-        root = tree.root_node
-
-        rels = extract_assigned_to_relations(
-            root, code_bytes, function_id_map, {**variable_id_map, **param_id_map}, field_id_map,
-            source_path, file_visibility, entity_file_map, all_extern_functions, macro_lookup_map, source_path
-        )
-        all_relations.extend(rels)
+    shared_data = ExtractionContext.build(
+        function_id_map, variable_id_map, param_id_map, field_id_map, struct_id_map,
+        entity_file_map, file_visibility, all_extern_functions, macro_lookup_map, all_entities,
+        var_param_entities=variable_entities + param_entities,
+        field_entities=field_entities,
+        file_to_entities=file_to_entities,
+        **extra
+    )
+    symbol_index = shared_data.symbol_index
+    print(f"✅ 符号索引构建完成：{len(symbol_index.cand_entity)} 个候选，{len(symbol_index.files)} 个文件")
+    # FAIL_MESSAGE 新实体的ID接在已有实体之后
+    max_entity_id = max((int(e['id']) for e in all_entities if str(e.get('id', '')).isdigit()), default=0)
+    fail_id_counter = id_generator(max_entity_id + 1)
 
-        del tree
-        del root
-    
-    # === 阶段 6：语义关系 ===
+    # === 阶段 4-6：单次解析 + 单次遍历提取全部关系 ===
     print(f"\n" + "="*60)
-    print("阶段 6：提取 RETURNS / TYPE_OF...")
-    
-    for source_path in tqdm(c_files, desc="阶段 6：提取 RETURNS / TYPE_OF"):
-        abs_source_path = os.path.abspath(source_path)
-
-        if len(all_relations) % 1000 == 0:
-            gc.collect()
-
-        with open(abs_source_path, 'rb') as f:
-            code_bytes = f.read()
-        tree = parser.parse(code_bytes)
-        root = tree.root_node
-        # RETURNS
-        rels = extract_returns_relations(
-            root, code_bytes, function_id_map, {**variable_id_map, **param_id_map}, field_id_map,
-            source_path, file_visibility, entity_file_map
-        )
-        all_relations.extend(rels)
+    print("阶段 4-6：提取 CALLS / ASSIGNED_TO / MOUNTED_TO / RETURNS / TYPE_OF / ALIAS / FAIL_MESSAGE...")
 
-        # TYPE_OF
-        rels = extract_typeof_relations(
-            root, code_bytes, variable_entities + param_entities, field_entities, struct_id_map,
-            source_path, file_visibility, entity_file_map
-        )
-        all_relations.extend(rels)
-
-        del tree
-        del root
+    streaming = output_format == 'jsonl'
+    entity_writer = relation_writer = None
+    try:
+        if streaming:
+            # 流式输出：已有实体先写出，之后的关系和 FAIL_MESSAGE 实体边提取边写
+            entity_writer = JsonlWriter(os.path.join(output_dir, 'entity.jsonl'), compression)
+            relation_writer = RelationJsonlWriter(os.path.join(output_dir, 'relation.jsonl'), compression)
+            entity_writer.write_many(all_entities)
+            emit_entities = entity_writer.write_many
+            emit_relations = relation_writer.write_many
+        else:
+            emit_entities = all_entities.extend
+            emit_relations = all_relations.extend
+
+        if num_workers > 1:
+            results = parallel_extract(c_files, shared_data, output_dir, num_workers)
+        else:
+            results = serial_extract(c_files, shared_data)
+
+        template_ids = {}
+        cache_hits = 0
+        stats = Counter()
+        pending_aliases = []
+        for source_path, rels, fail_entities, fail_relations, cache_hit, file_stats in tqdm(results, total=len(c_files), desc="阶段 4-6：提取关系"):
+            rels, file_pending = split_pending_aliases(rels)
+            pending_aliases.extend(file_pending)
+            emit_relations(rels)
+            cache_hits += cache_hit
+            stats.update(file_stats)
+            if fail_entities:
+                fail_entities, fail_relations = merge_fail_messages(
+                    fail_entities, fail_relations, template_ids, fail_id_counter
+                )
+                emit_entities(fail_entities)
+                emit_relations(fail_relations)
+
+        for label, key in (("名称解析缓存", "resolve"), ("宏展开提取缓存", "macro")):
+            hits = stats[f"{key}_hits"]
+            total = hits + stats[f"{key}_tree_hits"] + stats[f"{key}_misses"]
+            if total:
+                print(f"✅ {label}命中率：{hits}/{total} ({hits / total * 100:.1f}%)")
+        if stats["macro_hits"] or stats["macro_tree_hits"]:
+            print(f"   其中跨文件复用 {stats['macro_cross_file_hits']} 次，"
+                  f"另有 {stats['macro_tree_hits']} 次只复用语法树（解析结果与缓存不同）")
+        if cache_dir:
+            print(f"✅ 增量缓存命中 {cache_hits}/{len(c_files)} 个文件，重新提取 {len(c_files) - cache_hits} 个")
+
+        # 文件内解析不到的别名对照全局函数符号索引一次性解析
+        if pending_aliases:
+            alias_relations = resolve_pending_aliases(pending_aliases, symbol_index, shared_data.file_visibility)
+            emit_relations(alias_relations)
+            print(f"✅ 跨文件别名解析：{len(alias_relations)}/{len(pending_aliases)}")
+    finally:
+        # 异常中断时也要结束压缩流，避免留下截断的 gzip/xz 文件
+        for writer in (entity_writer, relation_writer):
+            if writer is not None:
+                writer.close()
 
     # 清理内存
     del file_trees
-    del file_to_entities
+    del shared_data
+
+    if streaming:
+        print(f"\n✅ 提取完成：实体 {entity_writer.count} 个，关系 {relation_writer.count} 条（在线去重移除 {relation_writer.duplicates} 个重复）")
+        print(f"   输出：{entity_writer.path}, {relation_writer.path}")
+        print_relation_stats(relation_writer.type_counts, relation_writer.visibility_checked, relation_writer.count)
+        return
 
     # === 最终去重和统计 ===
     print(f"\n" + "="*60)
     print("去重关系...")
     original_count = len(all_relations)
-    all_relations = deduplicate_relations(all_relations)
+    if extract_columnar.np is not None:
+        all_relations, relation_types, visibility_checked = deduplicate_relations_vectorized(all_relations)
+    else:
+        all_relations = deduplicate_relations(all_relations)
+        relation_types = Counter([r['type'] for r in all_relations])
+        visibility_checked = sum(1 for r in all_relations if r.get('visibility_checked'))
     deduplicated_count = len(all_relations)
     print(f"✅ 去重完成：{original_count} -> {deduplicated_count} (移除 {original_count - deduplicated_count} 个重复)")
 
-    # === 输出 JSON ===
-    with open(entity_path, 'w') as f:
-        json.dump(all_entities, f, indent=2)
-    with open(relation_path, 'w') as f:
-        json.dump(all_relations, f, indent=2)
+    if output_format == 'npy':
+        # === 输出列式数组 ===
+        graph_dir = os.path.join(output_dir, 'graph')
+        write_columnar(graph_dir, all_entities, all_relations)
+        print(f"✅ 列式输出：{graph_dir}")
+    else:
+        # === 输出 JSON ===
+        with open(entity_path, 'w') as f:
+            json.dump(all_entities, f, indent=2)
+        with open(relation_path, 'w') as f:
+            json.dump(all_relations, f, indent=2)
 
     print(f"\n✅ 提取完成：实体 {len(all_entities)} 个，关系 {len(all_relations)} 条。")
     
     # 关系统计
-    relation_types = Counter([r['type'] for r in all_relations])
-    print(f"\n关系类型统计：")
-    for k, v in relation_types.items():
-        print(f"  - {k}: {v}")
-    
-    # 可见性检查统计
-    visibility_checked = sum(1 for r in all_relations if r.get('visibility_checked'))
-    print(f"\n可见性检查覆盖：{visibility_checked}/{len(all_relations)} ({visibility_checked/len(all_relations)*100:.1f}%)")
+    print_relation_stats(relation_types, visibility_checked, len(all_relations))
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--source", type=str, default=r'E:\cpppro\clang_kg\linux', help="C 源码目录路径")
     parser.add_argument("--output", type=str, default=r'E:\cpppro\clang_kg\test\code_kg_with_tree-sitter\output\linux', help="输出目录路径")
+    parser.add_argument("--workers", type=int, default=1, help="阶段 4-6 的进程数（1 为串行）")
+    parser.add_argument("--cache-dir", type=str, default=None, help="增量提取缓存目录（不指定则不使用缓存）")
+    parser.add_argument("--format", type=str, default="json", choices=["json", "jsonl", "npy"], help="输出格式：json（一次性写出）、jsonl（流式写出）或 npy（列式数组）")
+    parser.add_argument("--compress", type=str, default=None, choices=["gzip", "xz"], help="jsonl 输出的压缩方式")
     args = parser.parse_args()
 
     tracemalloc.start()
     start_time = time.time()
-    extract_all(args.source, args.output)
+    extract_all(
+        args.source, args.output, num_workers=args.workers, cache_dir=args.cache_dir,
+        output_format=args.format, compression=args.compress
+    )
     current, peak = tracemalloc.get_traced_memory()
     end_time = time.time()
     print(f"\n总耗时：{end_time - start_time:.2f} 秒")
@@ -8,12 +8,15 @@ import os
 import re
 import subprocess
 import tempfile
+import hashlib
+import pickle
 from tqdm import tqdm
 from shutil import which
 import clang
 from clang.cindex import Index, CursorKind, TypeKind, CompilationDatabase, TranslationUnit
 from multiprocessing import Pool, cpu_count
 import functools
+from bisect import bisect_left, bisect_right
 
 temp_dir = '/home/lyk/work/test_pro/linux_temp'
 glibc_path = '/home/lyk/work/linux'
@@ -83,37 +86,40 @@ def find_available_filename(original_path):
         
         counter += 1
 
-def post_prei(pre_i):
-    with open(pre_i, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-    st_flag = [',', ')', ']', ';']
-    new_lines = []
-    tmp_linum = int(lines[0].split('\n')[0].split('\t')[0].split(':')[1])
-    tmp_finame = lines[0].split('\n')[0].split('\t')[0].split(':')[0]
-    tmp_licon = lines[0].split('\n')[0].split('\t')[1]
-    for value in lines[1:]:
-        linum = int(value.split('\n')[0].split('\t')[0].split(':')[1])
-        finame = value.split('\n')[0].split('\t')[0].split(':')[0]
-        licon = value.split('\n')[0].split('\t')[1]
+ST_FLAG = (',', ')', ']', ';')
+
+def merge_annotated_lines(annotated_lines):
+    """
+    合并同一 (文件, 行号) 的连续 annotated 行（宏展开产生的多行），逐行产出合并后的 `file:line\tcontent`
+    以 , ) ] ; 开头的续行直接拼接，其余续行以空格拼接；与原 post_prei 一致，最后一组不产出
+    """
+    tmp_finame = tmp_linum = tmp_licon = None
+    for value in annotated_lines:
+        # 与原 post_prei 的解析方式一致：文件名、行号取冒号分隔的前两段，内容取第二个制表符字段
+        fields = value.split('\n')[0].split('\t')
+        location = fields[0].split(':')
+        finame, linum, licon = location[0], int(location[1]), fields[1]
+        if tmp_licon is None:
+            tmp_finame, tmp_linum, tmp_licon = finame, linum, licon
+            continue
 
         if finame == tmp_finame and linum == tmp_linum:
-            flag = 0
-            for vl in st_flag:
-                if licon.strip().startswith(vl):
-                    flag = 1
-                    break
-            if flag == 1:
-                tmp_licon += licon.strip()
+            stripped = licon.strip()
+            if stripped.startswith(ST_FLAG):
+                tmp_licon += stripped
             else:
-                tmp_licon += ' ' + licon.strip()
+                tmp_licon += ' ' + stripped
         else:
-            full_lines = f'{tmp_finame}:{tmp_linum}\t{tmp_licon}\n'
-            new_lines.append(full_lines)
+            yield f'{tmp_finame}:{tmp_linum}\t{tmp_licon}'
 
             tmp_linum = linum
             tmp_finame = finame
             tmp_licon = licon
 
+def post_prei(pre_i):
+    with open(pre_i, "r", encoding="utf-8") as f:
+        new_lines = [line + '\n' for line in merge_annotated_lines(f)]
+
     # 覆盖写回
     with open(pre_i, "w", encoding="utf-8") as f:
         f.writelines(new_lines)
@@ -188,48 +194,62 @@ def run_preprocess(cmd, run_path=glibc_path):
 
 linemarker_re = re.compile(r'^#\s*([0-9]+)\s+"([^"]+)"')
 
-def annotate_i(i_path, annotated_path):
+linemarker_flags_re = re.compile(r'^#\s+(\d+)\s+"([^"]+)"(?:\s+(.+))?')
+
+def annotate_lines(raw_lines):
+    """
+    预处理输出 -> 逐行产出 `file:line\tcontent`
+    linemarker（# 123 "file" flags）只更新当前位置，不输出；空行只推进行号
+    """
     current_file = None
     current_line = None
-    pattern = r'^(//.*|/\*.*\*/)$'
+    for raw_line in raw_lines:
+        line = raw_line.rstrip('\n')
+
+        # 匹配 preprocessor line marker:  # 123 "file" flags...
+        m = linemarker_flags_re.match(line)
+        if m:
+            current_line = int(m.group(1))
+            current_file = m.group(2)
+            continue  # 不输出这一行
+
+        if current_file and current_line is not None:
+            if len(line) == 0:
+                current_line += 1
+                continue
+            yield f"{current_file}:{current_line}\t{line}"
+            current_line += 1
+        else:
+            # 无法关联到源文件的行，可按需求决定是否输出
+            yield f"???:??\t{line}"
+
+def annotate_i(i_path, annotated_path):
     with open(i_path, 'r', encoding='utf-8', errors='ignore') as fin, \
          open(annotated_path, 'w', encoding='utf-8') as fout:
-        # annotate_stream(fin, fout)
-        lines = []
-        for raw_line in fin:
-            line = raw_line.rstrip('\n')
-
-            # 匹配 preprocessor line marker:  # 123 "file" flags...
-            m = re.match(r'^#\s+(\d+)\s+"([^"]+)"(?:\s+(.+))?', line)
-            if m:
-                current_line = int(m.group(1))
-                current_file = m.group(2)
-                flags = m.group(3) or ""
-                if flags:
-                    flags = flags.strip().split(" ")[0]
-                """
-                if os.path.isfile(current_file):
-                    with open(current_file, 'r', encoding='utf-8', errors='replace') as f:
-                        lines = f.read().splitlines()
-                    while current_line <= len(lines) and (lines[current_line-1].strip() == "" or lines[current_line-1].strip().startswith('#') or re.match(pattern,lines[current_line-1].strip())):
-                        current_line += 1
-                """
-                continue  # 不输出这一行
+        for line in annotate_lines(fin):
+            fout.write(line + '\n')
 
-            if current_file and current_line is not None:
-                if len(line) == 0:
-                    current_line += 1
-                    continue
-                fout.write(f"{current_file}:{current_line}\t{line}\n")
-                current_line += 1
-                """
-                if os.path.isfile(current_file):
-                    while current_line <= len(lines) and (lines[current_line-1].strip() == "" or lines[current_line-1].strip().startswith('#') or re.match(pattern,lines[current_line-1].strip())):
-                        current_line += 1
-                """
-            else:
-                # 无法关联到源文件的行，可按需求决定是否输出
-                fout.write(f"???:??\t{line}\n")
+def iter_preprocess(cmd, run_path=glibc_path):
+    """
+    以管道运行预处理命令（不带 -o），逐行产出 stdout；返回码非零时抛出 CalledProcessError
+    stderr 丢弃，避免与 stdout 同时读取时管道写满阻塞
+    """
+    proc = subprocess.Popen(
+        cmd,
+        cwd=run_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding='utf-8',
+        errors='ignore'
+    )
+    try:
+        yield from proc.stdout
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd)
 
 def get_tokens_from_source_line(st_line, en_line, start_col, end_col, mid_lines):
     """
@@ -322,6 +342,69 @@ def find_annotated_line_index(annotated_lines, src_file, start_line):
                 return indices
     return None
 
+class AnnotatedIndex:
+    """
+    annotated 输出（每行 `filename:lineno\tcontent`）的内存索引，每个 TU 只加载一次
+    查询结果与 find_annotated_line_index 一致：
+    - 文件名按 basename 比较（完整路径相等时 basename 必然相等），因此键为 (basename, lineno)
+    - 返回该键首次出现的行下标；紧随其后的同键行构成一段时返回下标列表
+    """
+
+    def __init__(self, annotated_lines):
+        self.contents = []
+        self.first = {}         # (basename, lineno) -> 首次出现的行下标
+        self.run_end = {}       # 首次出现的行下标 -> 同键连续段的结束下标（不含）
+        self.files = set()      # 出现过的文件名（主文件及其包含的全部头文件）
+        prev_key = None
+        prev_fname = None
+        run_start = None
+        for i, l in enumerate(annotated_lines):
+            key = None
+            content = ""
+            if '\t' in l:
+                left, content = l.split('\t', 1)
+                if ':' in left:
+                    fname, lineno_s = left.rsplit(':', 1)
+                    if fname != prev_fname:
+                        self.files.add(fname)
+                        prev_fname = fname
+                    try:
+                        key = (os.path.basename(fname), int(lineno_s))
+                    except ValueError:
+                        key = None
+            self.contents.append(content)
+            if key is not None and key == prev_key:
+                if run_start is not None:
+                    self.run_end[run_start] = i + 1
+            else:
+                run_start = None
+                if key is not None and key not in self.first:
+                    self.first[key] = run_start = i
+                    self.run_end[i] = i + 1
+            prev_key = key
+
+    @classmethod
+    def load(cls, annotated_path):
+        with open(annotated_path, 'r', encoding='utf-8') as f:
+            return cls(ln.rstrip('\n') for ln in f)
+
+    def __len__(self):
+        return len(self.contents)
+
+    def find(self, src_file, start_line):
+        """src_file:start_line 对应的行下标（或连续多行的下标列表），没有时返回 None"""
+        i = self.first.get((os.path.basename(src_file), start_line))
+        if i is None:
+            return None
+        end = self.run_end[i]
+        if end - i == 1:
+            return i
+        return list(range(i, end))
+
+    def content(self, i):
+        """去掉 filename:lineno\t 前缀后的行内容"""
+        return self.contents[i]
+
 def token_in_line(line_content, token):
     if token is None:
         return False
@@ -330,9 +413,9 @@ def token_in_line(line_content, token):
     else:
         return token in line_content
 
-def extract_expansion_from_annotated(annotated_path, src_file, full_content, st_num, en_num, token_before, token_after, start_col, end_col):
+def extract_expansion_from_annotated(annotated, src_file, full_content, st_num, en_num, token_before, token_after, start_col, end_col):
     """
-    在 annotated.i 中找到 src_file:start_line 所在行，
+    在 annotated.i 中找到 src_file:start_line 所在行（annotated 为 AnnotatedIndex，或 .anno 文件路径），
     在该行中从前往后找到 token_before 的第一个匹配（取其结束位置）；
     在该行中从后往前找到 token_after 的第一个匹配（取其开始位置）；
     两者之间就是宏展开内容（strip 后返回）。
@@ -369,21 +452,19 @@ def extract_expansion_from_annotated(annotated_path, src_file, full_content, st_
         m = matches[-1]
         return (m.start(), m.end())
 
-    with open(annotated_path, 'r', encoding='utf-8') as f:
-        annotated_lines = [ln.rstrip('\n') for ln in f]
+    if not isinstance(annotated, AnnotatedIndex):
+        annotated = AnnotatedIndex.load(annotated)
 
     if label:
-        idx = find_annotated_line_index(annotated_lines, src_file, start_line)
+        idx = annotated.find(src_file, start_line)
         if idx is None:
             return '', '', '', '', ''
-            # raise RuntimeError(f"在 {annotated_path} 中未能找到 {src_file}:{start_line} 对应行。")
+            # raise RuntimeError(f"在 {annotated} 中未能找到 {src_file}:{start_line} 对应行。")
         if isinstance(idx, list):
             # 取该行内容（去掉 filename:lineno\t 前缀）
-            st_parts = annotated_lines[idx[0]].split('\t', 1)
-            st_content = st_parts[1] if len(st_parts) > 1 else ""
+            st_content = annotated.content(idx[0])
 
-            en_parts = annotated_lines[idx[-1]].split('\t', 1)
-            en_content = en_parts[1] if len(en_parts) > 1 else ""
+            en_content = annotated.content(idx[-1])
 
             # 在该行里找前锚点（从前往后第一个匹配）
             before_span = find_first_span(st_content, token_before)
@@ -403,8 +484,7 @@ def extract_expansion_from_annotated(annotated_path, src_file, full_content, st_
 
             macro_content = []
             for i in idx:
-                fu_parts = annotated_lines[i].split('\t', 1)
-                fu_content = fu_parts[1] if len(fu_parts) > 1 else ""
+                fu_content = annotated.content(i)
                 if fu_content not in macro_content:
                     macro_content.append(fu_content)
 
@@ -417,8 +497,7 @@ def extract_expansion_from_annotated(annotated_path, src_file, full_content, st_
 
         else:
             # 取该行内容（去掉 filename:lineno\t 前缀）
-            parts = annotated_lines[idx].split('\t', 1)
-            content = parts[1] if len(parts) > 1 else ""
+            content = annotated.content(idx)
 
             # 在该行里找前锚点（从前往后第一个匹配）
             before_span = find_first_span(content, token_before)
@@ -443,18 +522,16 @@ def extract_expansion_from_annotated(annotated_path, src_file, full_content, st_
             return extracted, content, before_span, after_span, extracted_lines
     else:
         # return '', '', '', '', ''
-        st_idx = find_annotated_line_index(annotated_lines, src_file, start_line)
-        en_idx = find_annotated_line_index(annotated_lines, src_file, end_line)
+        st_idx = annotated.find(src_file, start_line)
+        en_idx = annotated.find(src_file, end_line)
         if st_idx is None or en_idx is None:
             return '', '', '', '', ''
-            # raise RuntimeError(f"在 {annotated_path} 中未能找到 {src_file}:{start_line} 对应行。")
+            # raise RuntimeError(f"在 {annotated} 中未能找到 {src_file}:{start_line} 对应行。")
 
         # 取该行内容（去掉 filename:lineno\t 前缀）
-        st_parts = annotated_lines[st_idx].split('\t', 1)
-        st_content = st_parts[1] if len(st_parts) > 1 else ""
+        st_content = annotated.content(st_idx)
 
-        en_parts = annotated_lines[en_idx].split('\t', 1)
-        en_content = en_parts[1] if len(en_parts) > 1 else ""
+        en_content = annotated.content(en_idx)
         # 在该行里找前锚点（从前往后第一个匹配）
         before_span = find_first_span(st_content, token_before)
         if token_before is not None and before_span is None:
@@ -476,8 +553,7 @@ def extract_expansion_from_annotated(annotated_path, src_file, full_content, st_
 
         macro_content = []
         for i in range(st_idx, en_idx+1):
-            fu_parts = annotated_lines[i].split('\t', 1)
-            fu_content = fu_parts[1] if len(fu_parts) > 1 else ""
+            fu_content = annotated.content(i)
             macro_content.append(fu_content)
 
         mid_extracted = ' '.join(macro_content[1:-1]).strip()
@@ -487,6 +563,30 @@ def extract_expansion_from_annotated(annotated_path, src_file, full_content, st_
         return extracted, macro_str, before_span, after_span, extracted_lines
 
 # ---------- Worker: 用于第一阶段（collect entities） ----------
+def collect_main_file_macros(tu, main_file):
+    """
+    收集主文件中的宏实例位置，返回 [[file_name, start_line, start_col, end_line, end_col], ...]
+    PARSE_DETAILED_PROCESSING_RECORD 下，预处理记录（MACRO_INSTANTIATION 等）是翻译单元游标的直接子节点，
+    因此只遍历顶层，不进入任何声明（包括所有头文件中的声明）的子树；先比较游标类型再取位置，
+    按 (起止行列) 用集合去重并保持首次出现的顺序
+    """
+    seen = set()
+    local_macros = []
+    for cursor in tu.cursor.get_children():
+        if cursor.kind != CursorKind.MACRO_INSTANTIATION:
+            continue
+        extent = cursor.extent
+        start, end = extent.start, extent.end
+        # 仅收集发生在文件本身的宏实例
+        if start.file is None or start.file.name != main_file:
+            continue
+        key = (start.line, start.column, end.line, end.column)
+        if key in seen:
+            continue
+        seen.add(key)
+        local_macros.append([main_file, *key])
+    return local_macros
+
 def collect_entities_worker(args_entry):
     """
     在子进程中运行 libclang 解析，返回 (filepath, list_of_macro_entries)
@@ -504,95 +604,408 @@ def collect_entities_worker(args_entry):
         # 解析 translation unit
         tu = idx.parse(args_entry['file'], args=clang_args,
                        options=TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD)
-        local_macros = []
-
-        def visitor(cursor):
-            # 仅收集发生在文件本身的宏实例
-            if cursor.kind == CursorKind.MACRO_INSTANTIATION and cursor.location and cursor.location.file and cursor.location.file.name == args_entry['file']:
-                file_name = cursor.location.file.name
-                st_line = cursor.extent.start.line
-                en_line = cursor.extent.end.line
-                st_column = cursor.extent.start.column
-                en_column = cursor.extent.end.column
-                addmacro = [file_name, st_line, st_column, en_line, en_column]
-                # 去重（local list 里）
-                if addmacro not in local_macros:
-                    local_macros.append(addmacro)
-            for c in cursor.get_children():
-                visitor(c)
-
-        visitor(tu.cursor)
+        local_macros = collect_main_file_macros(tu, args_entry['file'])
         return (args_entry['file'], local_macros, None)
     except Exception as e:
         return (args_entry.get('file', None), [], f"ERROR: {e}")
 
+# ---------- 跨 TU 的宏展开结果缓存 ----------
+# 影响预处理结果的参数：搜索路径、宏定义，以及改变预定义宏的优化级别 / 语言标准 / 目标平台 / -f、-m 选项
+# （__OPTIMIZE__、__STDC_VERSION__、架构宏等）
+RELEVANT_FLAGS = (
+    '-D', '-U', '-I', '-isystem', '-iquote', '-idirafter', '-include', '-imacros', '-isysroot', '--sysroot',
+    '-target', '--target', '-x', '-std', '--std'
+)
+RELEVANT_OPTIONS = ('-O', '-std=', '--std=', '--target=', '--sysroot=', '-m', '-f', '-ansi', '-nostdinc', '-pthread', '-undef')
+MACRO_CACHE_VERSION = 3
+# 缓存目录，不设置则不使用缓存
+MACRO_CACHE_DIR = os.getenv('MACRO_CACHE_DIR')
+
+_HEADER_DIGESTS = {}    # 进程内：头文件路径 -> ((mtime_ns, size), 内容哈希)，同一进程处理的所有 TU 共用
+
+def relevant_flags(arguments):
+    """
+    编译参数中影响预处理结果的部分（保持原顺序：搜索路径和宏的覆盖都依赖顺序）
+    RELEVANT_FLAGS 中的参数值可以是下一个参数（-I dir）也可以连写（-Idir）；RELEVANT_OPTIONS 按前缀匹配单个参数
+    """
+    flags = []
+    take_next = False
+    for arg in arguments:
+        if take_next:
+            flags.append(arg)
+            take_next = False
+            continue
+        if arg in RELEVANT_FLAGS:
+            flags.append(arg)
+            take_next = True
+        elif arg.startswith(RELEVANT_FLAGS) or arg.startswith(RELEVANT_OPTIONS):
+            flags.append(arg)
+    return flags
+
+def header_digest(path):
+    """头文件内容哈希；按 (mtime, size) 记忆，每个进程中每个头文件只读取、哈希一次"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _HEADER_DIGESTS.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    _HEADER_DIGESTS[path] = (stamp, digest)
+    return digest
+
+class MacroExpansionCache:
+    """
+    按 TU 存放的宏展开结果缓存（内容寻址）：缓存的是整个 TU 的 save_macro_list，而不是单个头文件的展开结果
+    键：主文件内容哈希 + 编译器名与影响预处理的参数（见 relevant_flags）哈希 + 本 TU 的宏实例位置；
+    条目中另存本 TU 包含的每个头文件的内容哈希，任一头文件变化即失效。
+    只有同一个 TU 在之后的运行中（源码与头文件都未变化）才会命中，命中时整个 TU 不再运行预处理器；
+    冷启动（空缓存）时每个 TU 仍各自预处理一遍，不同 TU 之间共享的头文件展开不会被复用。
+    跨 TU 复用的只有头文件内容哈希（进程内 _HEADER_DIGESTS），使校验开销随不同头文件的数量而不是 TU × 头文件增长。
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, args_entry, macro_infile):
+        h = hashlib.sha1()
+        for part in (
+            str(MACRO_CACHE_VERSION),
+            header_digest(args_entry['file']) or '',
+            args_entry['directory'],
+            json.dumps([os.path.basename(args_entry['arguments'][0]) if args_entry['arguments'] else '']
+                       + relevant_flags(args_entry['arguments'][1:])),
+            json.dumps(macro_infile),
+        ):
+            h.update(part.encode('utf-8', errors='ignore'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def _entry_path(self, source_path):
+        name = hashlib.sha1(os.path.abspath(source_path).encode('utf-8', errors='ignore')).hexdigest()
+        return os.path.join(self.cache_dir, name[:2], name + '.pkl')
+
+    def load(self, args_entry, key):
+        """命中且所有头文件未变化时返回缓存的 save_macro_list，否则返回 None"""
+        try:
+            with open(self._entry_path(args_entry['file']), 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry.get('key') != key:
+            return None
+        for path, digest in entry['headers'].items():
+            if header_digest(path) != digest:
+                return None
+        return entry['result']
+
+    def store(self, args_entry, key, files, result):
+        """files 为 AnnotatedIndex.files（相对路径按编译目录解析，<built-in> 等伪文件忽略）"""
+        headers = {}
+        for name in files:
+            path = os.path.normpath(os.path.join(args_entry['directory'], name))
+            if path != os.path.normpath(args_entry['file']) and os.path.isfile(path):
+                headers[path] = header_digest(path)
+        path = self._entry_path(args_entry['file'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'key': key, 'headers': headers, 'result': result}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
 # ---------- Worker: 用于第二阶段（处理单个文件的预处理 + 抽出） ----------
+# 流式预处理：直接读取预处理器的 stdout，逐行标注、合并进内存索引，不落盘 .i/.anno；设为 0 时退回临时文件方式
+STREAM_PREPROCESS = os.getenv('STREAM_PREPROCESS', '1') != '0'
+
+def stream_annotated_index(args_entry):
+    """预处理输出经管道流式标注、合并，直接构建 AnnotatedIndex"""
+    # pre_process_args 在尾部追加 '-o', '/abs/path/name.i'，去掉后输出到 stdout
+    cmd = pre_process_args(args_entry)[:-2]
+    raw_lines = iter_preprocess(cmd, args_entry["directory"])
+    return AnnotatedIndex(merge_annotated_lines(annotate_lines(raw_lines)))
+
+def file_annotated_index(args_entry):
+    """在临时目录中生成 .i/.anno 后加载为 AnnotatedIndex，退出时自动删除（TemporaryDirectory）"""
+    # 每个 worker 使用独立短生命周期临时目录
+    with tempfile.TemporaryDirectory(prefix="preproc_") as td:
+        bsname = os.path.basename(args_entry['file'])
+        # 生成 annotated 路径 & .i 输出都放到 td
+        annotated_i = os.path.join(td, f"{bsname}.{uuid.uuid4().hex}.anno")
+
+        # 构建预处理命令（先用现有 pre_process_args 得到 cmd，然后把 -o -> td 下文件替换）
+        cmd = pre_process_args(args_entry)
+        # pre_process_args 通常在尾部包含 '-o', '/abs/path/name.i'
+        # 我们要保证输出写到 td 下，避免原来位置出现大量 .i
+        # 找到最后一个以 .i 结尾的参数并替换为 td/xxx.i
+        outi = cmd[-1]
+        cmd[-1] = os.path.join(td, os.path.basename(outi))
+        # 现在 pre_i 指向 td 下的 .i 文件
+        pre_i = cmd[-1]
+
+        # 运行预处理（会在 args_entry["directory"] 下执行，输出 .i 到 td）
+        run_preprocess(cmd, args_entry["directory"])
+
+        # annotate i -> annotated_i（annotate_i 读取 pre_i 写 annotated_i）
+        annotate_i(pre_i, annotated_i)
+        post_prei(annotated_i)
+
+        return AnnotatedIndex.load(annotated_i)
+
+def extract_macro_list(args_entry, macro_infile, annotated):
+    """按宏实例位置从 AnnotatedIndex 中抽出展开内容，返回 save_dict 列表"""
+    save_macro_list_local = []
+    macro_infile = sorted(macro_infile, key=lambda x: (x[1], x[3]))
+
+    with open(args_entry['file'], 'r', encoding='utf-8', errors='replace') as f:
+        lines = f.read().splitlines()
+
+    for sin_macro in macro_infile:
+        src_file, start_line, start_col, end_line, end_col = sin_macro
+        if start_line < 1 or start_line > len(lines):
+            continue
+        src_line = lines[start_line - 1]
+        stp_line = lines[end_line - 1]
+        mid_lines = lines[start_line - 1:end_line]
+        token_before, token_after, macro_text = get_tokens_from_source_line(
+            src_line, stp_line, start_col, end_col, mid_lines
+        )
+
+        expansion, content, before_span, after_span, extracted_lines = extract_expansion_from_annotated(
+            annotated, src_file, lines[start_line - 1:end_line],
+            start_line, end_line, token_before, token_after, start_col, end_col
+        )
+
+        if expansion:
+            location = [start_line, start_col, end_line, end_col]
+            save_dict = {
+                "file": args_entry['file'],
+                "location": location,
+                "name": macro_text,
+                "macro": expansion,
+                "extracted_lines": extracted_lines
+            }
+            save_macro_list_local.append(save_dict)
+    return save_macro_list_local
+
 def process_file_worker(task):
     """
     task: (args_entry, macro_list_for_this_file, temp_dir_base)
-    在临时目录中生成 .i/.anno 并在退出时自动删除（TemporaryDirectory）
+    预处理输出只加载一次为 AnnotatedIndex（STREAM_PREPROCESS 时经管道流式构建，否则经临时 .i/.anno 文件）
+    设置 MACRO_CACHE_DIR 时，主文件、相关参数和所含头文件都未变化的 TU 直接返回缓存结果
     返回: (file, list_of_save_dicts, None, None, maybe_error)
     """
     args_entry, macro_infile, temp_dir_base = task
     try:
-        # 每个 worker 使用独立短生命周期临时目录
-        with tempfile.TemporaryDirectory(prefix="preproc_") as td:
-            bsname = os.path.basename(args_entry['file'])
-            # 生成 annotated 路径 & .i 输出都放到 td
-            annotated_i = os.path.join(td, f"{bsname}.{uuid.uuid4().hex}.anno")
-
-            # 构建预处理命令（先用现有 pre_process_args 得到 cmd，然后把 -o -> td 下文件替换）
-            cmd = pre_process_args(args_entry)
-            # pre_process_args 通常在尾部包含 '-o', '/abs/path/name.i'
-            # 我们要保证输出写到 td 下，避免原来位置出现大量 .i
-            # 找到最后一个以 .i 结尾的参数并替换为 td/xxx.i
-            outi = cmd[-1]
-            cmd[-1] = os.path.join(td, os.path.basename(outi))
-            # 现在 pre_i 指向 td 下的 .i 文件
-            pre_i = cmd[-1]
-
-            # 运行预处理（会在 args_entry["directory"] 下执行，输出 .i 到 td）
-            run_preprocess(cmd, args_entry["directory"])
-
-            # annotate i -> annotated_i（annotate_i 读取 pre_i 写 annotated_i）
-            annotate_i(pre_i, annotated_i)
-            post_prei(annotated_i)
-
-            save_macro_list_local = []
-            macro_infile = sorted(macro_infile, key=lambda x: (x[1], x[3]))
-
-            with open(args_entry['file'], 'r', encoding='utf-8', errors='replace') as f:
-                lines = f.read().splitlines()
-
-            for sin_macro in macro_infile:
-                src_file, start_line, start_col, end_line, end_col = sin_macro
-                if start_line < 1 or start_line > len(lines):
-                    continue
-                src_line = lines[start_line - 1]
-                stp_line = lines[end_line - 1]
-                mid_lines = lines[start_line - 1:end_line]
-                token_before, token_after, macro_text = get_tokens_from_source_line(
-                    src_line, stp_line, start_col, end_col, mid_lines
-                )
-
-                expansion, content, before_span, after_span, extracted_lines = extract_expansion_from_annotated(
-                    annotated_i, src_file, lines[start_line - 1:end_line],
-                    start_line, end_line, token_before, token_after, start_col, end_col
-                )
-
-                if expansion:
-                    location = [start_line, start_col, end_line, end_col]
-                    save_dict = {
-                        "file": args_entry['file'],
-                        "location": location,
-                        "name": macro_text,
-                        "macro": expansion,
-                        "extracted_lines": extracted_lines
-                    }
-                    save_macro_list_local.append(save_dict)
-
-            # 离开 with 块时 TemporaryDirectory 会自动删除 td 及其中的 .i/.anno 文件
-            return (args_entry['file'], save_macro_list_local, None, None, None)
+        cache = MacroExpansionCache(MACRO_CACHE_DIR) if MACRO_CACHE_DIR else None
+        if cache is not None:
+            cache_key = cache.key(args_entry, macro_infile)
+            cached = cache.load(args_entry, cache_key)
+            if cached is not None:
+                return (args_entry['file'], cached, None, None, None)
+
+        # annotated 输出只加载一次，之后每个宏实例按 (文件, 行) 常数时间定位
+        if STREAM_PREPROCESS:
+            annotated = stream_annotated_index(args_entry)
+        else:
+            annotated = file_annotated_index(args_entry)
+
+        save_macro_list_local = extract_macro_list(args_entry, macro_infile, annotated)
+
+        if cache is not None:
+            cache.store(args_entry, cache_key, annotated.files, save_macro_list_local)
+        return (args_entry['file'], save_macro_list_local, None, None, None)
+
+    except Exception as e:
+        return (args_entry.get('file', None), [], None, None, str(e))
+
+
+# ---------- 单次预处理模式：宏实例位置与展开内容来自同一次前端调用 ----------
+# 设为 1 时跳过第一阶段的 libclang 解析：预处理器以 -dD 运行，输出中同时带有宏定义，
+# 宏实例位置由主文件的词法扫描得到，展开内容从同一份输出中抽取
+SINGLE_PASS = os.getenv('SINGLE_PASS', '0') == '1'
+
+define_re = re.compile(r'^#define\s+([A-Za-z_]\w*)(\()?')
+undef_re = re.compile(r'^#undef\s+([A-Za-z_]\w*)')
+source_token_re = re.compile(r"""
+    (?P<comment>/\*.*?\*/|//[^\n]*)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<ident>[A-Za-z_]\w*)
+  | (?P<lparen>\()
+  | (?P<rparen>\))
+  | (?P<other>\S)
+""", re.S | re.X)
+
+def strip_macro_definitions(raw_lines, definitions, active_lines=None):
+    """
+    -dD 输出中的 #define / #undef 行：记录到 definitions 后替换为空行，
+    其余行原样产出（与不带 -dD 时的输出一致，annotate_lines 的行号不受影响）
+    definitions: 宏名 -> ([主文件行号, ...], [定义, ...])，按出现顺序记录每次 #define / #undef：
+      定义为 True（函数式宏）/ False（对象式宏）/ None（#undef）
+      行号为事件在主文件中的位置：主文件中的指令取其所在行，头文件中的取包含它的 #include 行；
+      内建宏和命令行宏（输出开头、首次回到主文件之前的指令）一律为 0，
+      与 linemarker 的起始行号无关（gcc 为 # 0 "file.c"，clang 为 # 1 "file.c"）
+    active_lines: 不为 None 时收集主文件中有输出内容的行号（#if 等条件编译排除的行不会出现）
+    主文件为输出中第一个 linemarker 的文件
+    """
+    main_file = current_file = None
+    current_line = main_line = 0
+    prologue = True     # 仍在内建宏 / 命令行宏部分
+    for line in raw_lines:
+        if line.startswith('#'):
+            m = linemarker_flags_re.match(line)
+            if m:
+                current_line = int(m.group(1))
+                if main_file is None:
+                    main_file = m.group(2)
+                elif prologue and m.group(2) == main_file and current_file != main_file:
+                    prologue = False
+                current_file = m.group(2)
+                if current_file == main_file:
+                    main_line = current_line
+                yield line
+                continue
+            m = define_re.match(line) or undef_re.match(line)
+            if m:
+                value = bool(m.group(2)) if m.re is define_re else None
+                if current_file == main_file:
+                    position = current_line
+                else:
+                    position = 0 if prologue else main_line
+                lines, values = definitions.setdefault(m.group(1), ([], []))
+                lines.append(position)
+                values.append(value)
+                line = '\n'
+        if current_file == main_file:
+            prologue = False
+            if active_lines is not None and line.strip():
+                active_lines.add(current_line)
+            current_line += 1
+            main_line = current_line
+        else:
+            current_line += 1
+        yield line
+
+def definition_at(definitions, name, line):
+    """宏名在主文件第 line 行处是否为函数式宏（见 strip_macro_definitions）；未定义或已 #undef 时返回 None"""
+    events = definitions.get(name)
+    if events is None:
+        return None
+    i = bisect_left(events[0], line)
+    return events[1][i - 1] if i else None
+
+def _directive_lines(lines):
+    """预处理指令所在的行号（1-based，含反斜杠续行）"""
+    directive = set()
+    in_directive = False
+    for no, line in enumerate(lines, 1):
+        if in_directive or line.lstrip().startswith('#'):
+            directive.add(no)
+            in_directive = line.endswith('\\')
+    return directive
+
+def scan_macro_instantiations(main_file, text, definitions, active_lines=None):
+    """
+    在主文件源码中查找宏实例，返回 [[file_name, start_line, start_col, end_line, end_col], ...]
+    （与 collect_main_file_macros 格式一致，end_col 为最后一个字符之后的列）
+    - 跳过注释、字符串和预处理指令行；给出 active_lines 时跳过条件编译排除的行
+      （跨行宏调用的后续行在输出中为空行，但位于已收集调用的实参范围内，仍然扫描）
+    - 只有在该行处已定义（之前没有 #undef）的宏名才算实例
+    - 函数式宏只有后面紧跟 ( 时才算实例，范围到配对的 )；对象式宏的范围只有宏名
+      （与 libclang 一致，即使它展开为函数式宏名，如 #define NIL_P RB_NIL_P）；实参中的宏实例同样收集
+    """
+    lines = text.split('\n')
+    directive = _directive_lines(lines)
+    line_starts = [0]
+    for line in lines[:-1]:
+        line_starts.append(line_starts[-1] + len(line) + 1)
+
+    def position(offset):
+        no = bisect_right(line_starts, offset)
+        return no, offset - line_starts[no - 1] + 1
+
+    def call_end(pos):
+        """pos 之后第一个有效记号为 ( 时返回配对 ) 之后的偏移，否则返回 None"""
+        depth = 0
+        for m in source_token_re.finditer(text, pos):
+            kind = m.lastgroup
+            if kind == 'comment':
+                continue
+            if depth == 0 and kind != 'lparen':
+                return None
+            if kind == 'lparen':
+                depth += 1
+            elif kind == 'rparen':
+                depth -= 1
+                if depth == 0:
+                    return m.end()
+        return None
+
+    seen = set()
+    macros = []
+    covered_until = 0   # 已收集的函数式宏调用的结束偏移：跨行调用的展开整体输出在首行，其余行在输出中为空行
+    for m in source_token_re.finditer(text):
+        if m.lastgroup != 'ident':
+            continue
+        name = m.group('ident')
+        if name not in definitions:
+            continue
+        st_line, st_col = position(m.start())
+        if st_line in directive:
+            continue
+        if active_lines is not None and st_line not in active_lines and m.start() >= covered_until:
+            continue
+        function_like = definition_at(definitions, name, st_line)
+        if function_like is None:
+            continue
+        if function_like:
+            end = call_end(m.end())
+            if end is None:
+                continue    # 函数式宏名后没有实参，不展开
+        else:
+            end = m.end()
+        covered_until = max(covered_until, end)
+        en_line, en_col = position(end)
+        key = (st_line, st_col, en_line, en_col)
+        if key in seen:
+            continue
+        seen.add(key)
+        macros.append([main_file, *key])
+    return macros
+
+def single_pass_worker(args_entry):
+    """
+    单次预处理得到一个 TU 的全部宏展开条目：预处理器（-E -dD）一次运行，
+    输出流中的宏定义用于在主文件中定位宏实例，其余行构建 AnnotatedIndex 用于抽取展开内容
+    返回: (file, list_of_save_dicts, None, None, maybe_error)，与 process_file_worker 一致
+    """
+    try:
+        cache = MacroExpansionCache(MACRO_CACHE_DIR) if MACRO_CACHE_DIR else None
+        if cache is not None:
+            # 宏实例位置由主文件内容、参数和头文件决定，均已在键和头文件哈希中
+            cache_key = cache.key(args_entry, None)
+            cached = cache.load(args_entry, cache_key)
+            if cached is not None:
+                return (args_entry['file'], cached, None, None, None)
+
+        cmd = pre_process_args(args_entry)[:-2]
+        cmd.insert(cmd.index('-E') + 1, '-dD')
+        definitions = {}
+        active_lines = set()
+        raw_lines = strip_macro_definitions(iter_preprocess(cmd, args_entry["directory"]), definitions, active_lines)
+        annotated = AnnotatedIndex(merge_annotated_lines(annotate_lines(raw_lines)))
+
+        with open(args_entry['file'], 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        macro_infile = scan_macro_instantiations(args_entry['file'], text, definitions, active_lines)
+        save_macro_list_local = extract_macro_list(args_entry, macro_infile, annotated)
+
+        if cache is not None:
+            cache.store(args_entry, cache_key, annotated.files, save_macro_list_local)
+        return (args_entry['file'], save_macro_list_local, None, None, None)
 
     except Exception as e:
         return (args_entry.get('file', None), [], None, None, str(e))
@@ -611,8 +1024,10 @@ def main():
     macro_dict_local = {}
     errors = []
     max_workers = min((os.cpu_count() or 4), 8)
+    # 单次预处理模式不需要 libclang 解析：宏实例位置在第二阶段与展开内容一起得到
+    parse_args = [] if SINGLE_PASS else all_args
     with ProcessPoolExecutor(max_workers=max_workers) as ex:
-        futures = { ex.submit(collect_entities_worker, args): args for args in all_args }
+        futures = { ex.submit(collect_entities_worker, args): args for args in parse_args }
         for fut in tqdm(as_completed(futures), total=len(futures), desc="Parsing with libclang (parallel)"):
             args = futures[fut]
             try:
@@ -650,7 +1065,10 @@ def main():
 
     results = []
     with ProcessPoolExecutor(max_workers=max_workers) as ex:
-        futures = { ex.submit(process_file_worker, t): t for t in tasks }
+        if SINGLE_PASS:
+            futures = { ex.submit(single_pass_worker, args): args for args in all_args }
+        else:
+            futures = { ex.submit(process_file_worker, t): t for t in tasks }
         for fut in tqdm(as_completed(futures), total=len(futures), desc="Preprocess+annotate+extract (parallel)"):
             try:
                 file_path, save_macro_list_local, annotated_i, pre_i, err = fut.result()
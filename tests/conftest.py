@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def c_parser():
+    """tree-sitter C 解析器"""
+    tree_sitter = pytest.importorskip("tree_sitter")
+    tsc = pytest.importorskip("tree_sitter_c")
+    return tree_sitter.Parser(tree_sitter.Language(tsc.language()))
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# tests/fixtures/sample.c 中的实体：(ID, 类型, 名称, 作用域)
+SAMPLE_ENTITIES = [
+    (1, "FUNCTION", "work_fn", "global"),
+    (2, "FUNCTION", "dwork_fn", "global"),
+    (3, "FUNCTION", "timer_fn", "global"),
+    (4, "FUNCTION", "irq_handler", "global"),
+    (5, "FUNCTION", "irq_thread", "global"),
+    (6, "FUNCTION", "my_open", "global"),
+    (7, "FUNCTION", "my_release", "global"),
+    (8, "FUNCTION", "dev_cb", "global"),
+    (9, "FUNCTION", "probe", "global"),
+    (20, "VARIABLE", "counter", "global"),
+    (21, "VARIABLE", "my_fops", "global"),
+    (22, "VARIABLE", "fp", "probe"),
+    (23, "PARAMETER", "dev", "probe"),
+    (30, "FIELD", "work", "my_dev"),
+    (31, "FIELD", "dwork", "my_dev"),
+    (32, "FIELD", "timer", "my_dev"),
+    (33, "FIELD", "cb", "my_dev"),
+    (34, "FIELD", "irq", "my_dev"),
+    (35, "FIELD", "open", "file_operations"),
+    (36, "FIELD", "release", "file_operations"),
+]
+
+
+@pytest.fixture(scope="session")
+def sample(c_parser):
+    """
+    sample.c 的解析树与名称映射（与 name2id.pkl 中的格式一致），以及由它们构建的 ExtractionContext
+    baseline 为引入 VisitorEngine 之前的各提取函数在该文件上的输出（sample_baseline.json）
+    """
+    from extract_context import ExtractionContext
+
+    path = os.path.join(FIXTURES, "sample.c")
+    with open(path, "rb") as f:
+        code_bytes = f.read()
+
+    function_id_map, variable_id_map, param_id_map, field_id_map = {}, {}, {}, {}
+    entity_file_map, all_entities = {}, []
+    for entity_id, entity_type, name, scope in SAMPLE_ENTITIES:
+        entity_file_map[entity_id] = path
+        all_entities.append({"id": entity_id, "type": entity_type, "name": name, "scope": scope})
+        if entity_type == "FUNCTION":
+            function_id_map[name] = entity_id
+        elif entity_type == "VARIABLE":
+            variable_id_map[(name, scope)] = entity_id
+        elif entity_type == "PARAMETER":
+            param_id_map[(name, scope)] = entity_id
+        else:
+            field_id_map.setdefault(name, []).append(entity_id)
+    file_visibility = {path: {path}}
+    with open(os.path.join(FIXTURES, "sample_baseline.json"), "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    context = ExtractionContext.build(
+        function_id_map, variable_id_map, param_id_map, field_id_map, {},
+        entity_file_map, file_visibility, [], {}, all_entities,
+        var_param_entities=[e for e in all_entities if e["type"] in ("VARIABLE", "PARAMETER")],
+        field_entities=[e for e in all_entities if e["type"] == "FIELD"],
+        file_to_entities={path: all_entities},
+    )
+    return SimpleNamespace(
+        path=path,
+        code_bytes=code_bytes,
+        tree=c_parser.parse(code_bytes),
+        function_id_map=function_id_map,
+        variable_id_map={**variable_id_map, **param_id_map},
+        field_id_map=field_id_map,
+        entity_file_map=entity_file_map,
+        file_visibility=file_visibility,
+        all_entities=all_entities,
+        context=context,
+        baseline=baseline,
+    )
+
+
+@pytest.fixture(scope="session")
+def c_compiler():
+    """用于 -E -dD 的 C 编译器（gcc 或 clang），都没有时跳过"""
+    for name in ("gcc", "clang", "cc"):
+        path = shutil.which(name)
+        if path:
+            return path
+    pytest.skip("没有可用的 C 编译器")
+
+
+@pytest.fixture(scope="session")
+def libclang_index():
+    """
+    libclang 索引；test_glibc_parallel_new 中配置的库目录没有 libclang.so 时，
+    退回 libclang 轮子自带的库，都没有时跳过
+    """
+    cindex = pytest.importorskip("clang.cindex")
+    try:
+        return cindex.Index.create()
+    except cindex.LibclangError:
+        pass
+    bundled = os.path.join(os.path.dirname(cindex.__file__), "native", "libclang.so")
+    if not os.path.isfile(bundled):
+        pytest.skip("没有可加载的 libclang")
+    cindex.Config.library_file = bundled
+    return cindex.Index.create()
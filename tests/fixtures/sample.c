@@ -0,0 +1,47 @@
+struct work_struct { int pending; };
+struct delayed_work { struct work_struct work; };
+struct timer_list { int expires; };
+struct file_operations { int (*open)(int); int (*release)(int); };
+
+struct my_dev {
+	struct work_struct work;
+	struct delayed_work dwork;
+	struct timer_list timer;
+	void (*cb)(struct my_dev *);
+	int irq;
+};
+
+static int counter;
+
+static void work_fn(struct work_struct *w) { counter++; }
+static void dwork_fn(struct work_struct *w) { work_fn(w); }
+static void timer_fn(struct timer_list *t) { counter = 0; }
+static int irq_handler(int irq, void *data) { return 0; }
+static int irq_thread(int irq, void *data) { return irq_handler(irq, data); }
+static int my_open(int x) { return x; }
+static int my_release(int x) { return my_open(x); }
+static void dev_cb(struct my_dev *d) { }
+
+static const struct file_operations my_fops = {
+	.open = my_open,
+	.release = my_release,
+};
+
+static int probe(struct my_dev *dev)
+{
+	int (*fp)(int) = my_open;
+	INIT_WORK(&dev->work, work_fn);
+	INIT_DELAYED_WORK(&dev->dwork, dwork_fn);
+	timer_setup(&dev->timer, timer_fn, 0);
+	request_threaded_irq(dev->irq, irq_handler, irq_thread, 0, "dev", dev);
+	dev->cb = dev_cb;
+	counter = fp(1);
+	if (counter > 0) {
+		work_fn(&dev->work);
+		counter = my_release(counter) + my_open(counter) + my_open(counter + 1);
+	}
+	if (!dev->irq)
+		printf("probe: no irq %d\n", counter) + 1;
+	fprintf(stderr, "probe: irq %d ready\n", dev->irq);
+	return (((counter)));
+}
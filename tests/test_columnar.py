@@ -0,0 +1,53 @@
+"""列式输出：write_columnar 之后 ColumnarGraph 还原出与写入时相同的实体和关系"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from extract_columnar import ColumnarGraph, deduplicate_relations_vectorized, write_columnar
+
+RELATIONS = [
+    {"type": "CALLS", "resolution_type": "function", "visibility_checked": True},
+    {"type": "MOUNTED_TO", "scope": "probe", "registrar": "INIT_WORK", "visibility_checked": True},
+    {"type": "ALIAS", "kind": "weak"},
+]
+
+
+def round_trip(tmp_path, ids):
+    entities = [{"id": entity_id, "name": f"e{n}", "type": "FUNCTION"} for n, entity_id in enumerate(ids)]
+    relations = [
+        {"head": ids[n % len(ids)], "tail": ids[(n + 1) % len(ids)], **relation}
+        for n, relation in enumerate(RELATIONS)
+    ]
+    meta = write_columnar(str(tmp_path), entities, relations)
+    graph = ColumnarGraph(str(tmp_path))
+    return meta, entities, relations, list(graph.iter_entities()), list(graph.iter_relations())
+
+
+@pytest.mark.parametrize("ids, kind", [
+    (["1", "2", "30"], "int"),
+    (["1", "007", "30"], "str"),
+    (["1", "f:2", "x"], "str"),
+    ([1, 2, 30], "int_id"),
+    ([1, "2", "f:3"], "mixed"),
+    (["1", None, 3], "mixed"),
+])
+def test_ids_keep_their_original_type(tmp_path, ids, kind):
+    meta, entities, relations, decoded_entities, decoded_relations = round_trip(tmp_path, ids)
+    assert meta["node_id_kind"] == kind
+    assert decoded_entities == entities
+    assert decoded_relations == relations
+    for decoded, original in zip(decoded_relations, relations):
+        assert type(decoded["head"]) is type(original["head"])
+
+
+def test_vectorized_dedup_keeps_first_occurrence():
+    relations = [
+        {"head": 1, "tail": 2, "type": "CALLS", "visibility_checked": True},
+        {"head": 1, "tail": 2, "type": "CALLS"},
+        {"head": 2, "tail": 1, "type": "CALLS"},
+        {"head": 1, "tail": 2, "type": "ALIAS", "visibility_checked": True},
+    ]
+    unique, types, checked = deduplicate_relations_vectorized(relations)
+    assert unique == [relations[0], relations[2], relations[3]]
+    assert types == {"CALLS": 2, "ALIAS": 1}
+    assert checked == 2
@@ -0,0 +1,106 @@
+"""ExtractionContext：运行级只读上下文，各处理器共用 FileContext 时与独立提取的结果一致"""
+import pytest
+
+from extract_context import ExtractionContext, FileContext
+from extract_visibility import FileVisibility
+from extract_visitor import VisitorEngine
+from extract_relation_calls import make_calls_handler, extract_calls_relations
+from extract_relation_assignedto import make_assigned_to_handler, extract_assigned_to_relations
+from extract_symbol_index import FUNCTION, VARIABLE
+
+
+def test_context_is_read_only(sample):
+    context = sample.context
+    with pytest.raises(AttributeError):
+        context.symbol_index = None
+    with pytest.raises(AttributeError):
+        del context.function_id_map
+    assert context.get("cache") is None
+    assert isinstance(context.extern_functions, frozenset)
+
+
+def test_derived_indexes(sample):
+    context = sample.context
+    index = context.symbol_index
+    # 参数与变量合并在同一命名空间
+    assert index.entity(index.candidates(VARIABLE, ("dev", "probe"))[0]) == 23
+    assert index.entity(index.candidates(FUNCTION, "my_open")[0]) == 6
+
+    file_context = context.file_context(sample.path)
+    assert isinstance(file_context, FileContext)
+    assert file_context.file_id == index.file_id(sample.path)
+    assert file_context.file_id in file_context.visible_files
+
+
+def test_shared_file_context_matches_standalone_extraction(sample):
+    """同一 FileContext 供 CALLS 与 ASSIGNED_TO 共用，结果与各自独立提取（由名称映射临时构建索引）及原实现一致"""
+    context = sample.context
+    file_context = context.file_context(sample.path)
+    args = (sample.code_bytes, context.symbol_index, sample.path, context.file_visibility, context.extern_functions)
+    engine = VisitorEngine(sample.code_bytes)
+    calls = engine.register(make_calls_handler(*args, file_context=file_context))
+    assigned = engine.register(make_assigned_to_handler(*args, file_context=file_context))
+    engine.run(sample.tree.root_node)
+
+    maps = (sample.function_id_map, sample.variable_id_map, sample.field_id_map, sample.path,
+            sample.file_visibility, sample.entity_file_map, [])
+    standalone_calls = extract_calls_relations(sample.tree.root_node, sample.code_bytes, *maps,
+                                               all_entities=sample.all_entities)
+    standalone_assigned = extract_assigned_to_relations(sample.tree.root_node, sample.code_bytes, *maps)
+
+    assert list(calls.results) == standalone_calls == sample.baseline["CALLS"]
+    assert list(assigned.results) == standalone_assigned == sample.baseline["ASSIGNED_TO"]
+    # 两个处理器的名称解析共用一个缓存
+    assert file_context.resolution_cache.hits > 0
+
+
+def test_bitmap_visibility_gives_same_relations(sample):
+    """可见性为位图格式时，上下文与旧格式集合得到相同的关系"""
+    context = ExtractionContext.build(
+        sample.function_id_map, sample.variable_id_map, {}, sample.field_id_map, {},
+        sample.entity_file_map, FileVisibility.from_sets(sample.file_visibility), [], {}, sample.all_entities,
+        var_param_entities=[], field_entities=[], file_to_entities={},
+    )
+    handler = make_calls_handler(
+        sample.code_bytes, context.symbol_index, sample.path, context.file_visibility,
+        context.extern_functions, file_context=context.file_context(sample.path)
+    )
+    engine = VisitorEngine(sample.code_bytes)
+    engine.register(handler)
+    engine.run(sample.tree.root_node)
+    assert list(handler.results) == sample.baseline["CALLS"]
+
+
+@pytest.mark.parametrize("as_bitmap", [False, True])
+def test_file_without_visibility_record_sees_itself(sample, as_bitmap):
+    """没有可见性记录的文件只看得到自身：两种格式得到相同的可见集合和关系"""
+    legacy = {"/other/header.h": {"/other/header.h"}}
+    file_visibility = FileVisibility.from_sets(legacy) if as_bitmap else legacy
+    context = ExtractionContext.build(
+        sample.function_id_map, sample.variable_id_map, {}, sample.field_id_map, {},
+        sample.entity_file_map, file_visibility, [], {}, sample.all_entities,
+        var_param_entities=[], field_entities=[], file_to_entities={},
+    )
+    file_context = context.file_context(sample.path)
+    assert file_context.visible_files == frozenset([context.symbol_index.file_id(sample.path)])
+
+    handler = make_calls_handler(
+        sample.code_bytes, context.symbol_index, sample.path, context.file_visibility,
+        context.extern_functions, file_context=file_context
+    )
+    engine = VisitorEngine(sample.code_bytes)
+    engine.register(handler)
+    engine.run(sample.tree.root_node)
+    assert list(handler.results) == sample.baseline["CALLS"]
+
+
+def test_is_visible_matches_visible_sets():
+    legacy = {"a.c": {"a.c", "a.h", "b.h"}, "b.c": {"b.c", "b.h"}, "a.h": {"a.h"}}
+    visibility = FileVisibility.from_sets(legacy)
+    paths = sorted({p for visible in legacy.values() for p in visible} | set(legacy))
+    for path in paths:
+        file_id = visibility.file_id(path)
+        visible = legacy.get(path, {path})
+        for other in paths:
+            assert visibility.is_visible(file_id, visibility.file_id(other)) == (other in visible)
+        assert not visibility.is_visible(file_id, -1)
@@ -0,0 +1,49 @@
+"""FAIL_MESSAGE：查询模式与遍历模式产出相同的模板与实例"""
+import pytest
+
+from extract_fail_message import FailMessages, local_id_counter, make_fail_message_handler
+from extract_visitor import VisitorEngine
+
+CODE = b"""
+int check(int x)
+{
+    printf("bad %d\\n", x) + 1;
+    printf("plain %s\\n", "msg");
+    printf("first %d", x), x++;
+    if (fprintf(stderr, "cond %d\\n", x) < 0)
+        return -1;
+    x = snprintf(buf, sizeof(buf), "sized %lu", x);
+    return x;
+}
+"""
+
+
+def fail_messages(tree, code_bytes, use_query):
+    messages = FailMessages()
+    engine = VisitorEngine(code_bytes, use_query=use_query)
+    engine.register(make_fail_message_handler(code_bytes, "check.c", local_id_counter(), {"check": 1}, messages))
+    engine.run(tree.root_node)
+    return messages
+
+
+def test_query_mode_matches_cursor_mode(c_parser):
+    tree = c_parser.parse(CODE)
+    by_query = fail_messages(tree, CODE, use_query=True)
+    by_cursor = fail_messages(tree, CODE, use_query=False)
+    assert by_query.entities == by_cursor.entities
+    assert by_query.relations == by_cursor.relations
+
+    templates = [e["name"] for e in by_query.entities if e["type"] == "FAIL_TEMPLATE"]
+    assert "bad xxx" in templates
+    assert "plain xxx" in templates
+    instances = [e for e in by_query.entities if e["type"] == "FAIL_MESSAGE"]
+    assert all(e["scope"] == "check" for e in instances)
+    assert sum(r["type"] == "HAS_MESSAGE" for r in by_query.relations) == len(instances)
+
+
+@pytest.mark.parametrize("use_query", [True, False])
+def test_printf_operand_statement(c_parser, use_query):
+    """以 printf 调用开头的非调用语句不会中断整个文件的提取"""
+    code = b'void f(int x) { printf("bad %d\\n", x) + 1; }\n'
+    messages = fail_messages(c_parser.parse(code), code, use_query)
+    assert [e["name"] for e in messages.entities] == ["bad xxx", 'printf("bad %d\\n", x)']
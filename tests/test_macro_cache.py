@@ -0,0 +1,98 @@
+"""宏展开子提取缓存：按展开文本跨文件共享，只有当前文件的解析结果与记录一致时才复用提取结果"""
+import pytest
+
+import extract_relation_calls
+from extract_context import ExtractionContext
+from extract_macro_index import MacroIndex, MacroRelationCache
+from extract_relation_calls import make_calls_handler
+from extract_visitor import VisitorEngine
+
+HEADER = "/src/list.h"
+FILES = ["/src/a.c", "/src/b.c", "/src/c.c"]
+SOURCE = b"void f(void) { WALK(x); }\n"
+EXPANSION = "gp = head_ptr; gp->val = node_ctor;"
+
+# (ID, 类型, 名称, 作用域, 文件)：c.c 中定义了与头文件中同名的函数 node_ctor，解析时优先当前文件
+ENTITIES = [
+    (1, "FUNCTION", "f", "global", FILES[0]),
+    (2, "FUNCTION", "f", "global", FILES[1]),
+    (3, "FUNCTION", "f", "global", FILES[2]),
+    (100, "VARIABLE", "gp", "global", HEADER),
+    (101, "VARIABLE", "head_ptr", "global", HEADER),
+    (102, "FUNCTION", "node_ctor", "global", HEADER),
+    (103, "FIELD", "val", "node", HEADER),
+    (104, "FUNCTION", "node_ctor", "global", FILES[2]),
+]
+
+
+@pytest.fixture
+def context():
+    function_id_map, variable_id_map, field_id_map, entity_file_map = {}, {}, {}, {}
+    for entity_id, entity_type, name, scope, path in ENTITIES:
+        entity_file_map[entity_id] = path
+        if entity_type == "FUNCTION":
+            function_id_map.setdefault(name, []).append(entity_id)
+        elif entity_type == "VARIABLE":
+            variable_id_map.setdefault((name, scope), []).append(entity_id)
+        else:
+            field_id_map.setdefault(name, []).append(entity_id)
+    start = SOURCE.index(b"WALK") + 1
+    entry = {
+        "range": ((1, start), (1, start + len("WALK(x)"))),
+        "expanded": "list_walk(x)",
+        "original": "WALK",
+        "extracted_lines": EXPANSION,
+    }
+    return ExtractionContext.build(
+        function_id_map, variable_id_map, {}, field_id_map, {}, entity_file_map,
+        {path: {path, HEADER} for path in FILES}, [], {path: MacroIndex([dict(entry)]) for path in FILES},
+        [], var_param_entities=[], field_entities=[], file_to_entities={},
+    )
+
+
+def extract(context, c_parser, path):
+    handler = make_calls_handler(
+        SOURCE, context.symbol_index, path, context.file_visibility, context.extern_functions,
+        context.macro_lookup_map, path, flag=True, file_context=context.file_context(path)
+    )
+    engine = VisitorEngine(SOURCE)
+    engine.register(handler)
+    engine.run(c_parser.parse(SOURCE).root_node)
+    return list(handler.results)
+
+
+def test_reuse_across_files_only_when_resolution_matches(context, c_parser, monkeypatch):
+    # 每个文件都用空缓存提取一次作为对照
+    expected = {}
+    for path in FILES:
+        monkeypatch.setattr(extract_relation_calls, "macro_relation_cache", MacroRelationCache())
+        expected[path] = extract(context, c_parser, path)
+    assert {r["tail"] for r in expected[FILES[0]]} == {101, 102}
+    assert {r["tail"] for r in expected[FILES[2]]} == {101, 104}
+
+    cache = MacroRelationCache()
+    monkeypatch.setattr(extract_relation_calls, "macro_relation_cache", cache)
+    for path in FILES + [FILES[0]]:
+        assert extract(context, c_parser, path) == expected[path]
+
+    # a.c 未命中；b.c 复用 a.c 的结果；c.c 的 node_ctor 解析不同，只复用语法树；a.c 再次命中自己的变体
+    assert cache.stats() == {
+        "hits": 2, "cross_file_hits": 1, "tree_hits": 1, "misses": 1, "hit_rate": 0.5
+    }
+    assert len(cache.table) == 1
+    (entry,) = cache.table.values()
+    assert [path for _, _, path in entry.variants] == [FILES[0], FILES[2]]
+
+
+def test_variants_are_bounded():
+    cache = MacroRelationCache(maxsize=1, max_variants=2)
+    key = cache.make_key("calls", EXPANSION)
+    for n in range(3):
+        cache.put(key, None, {("name", "counter", "global"): n}, [{"n": n}], f"/src/{n}.c")
+    (entry,) = cache.table.values()
+    assert [relations for _, relations, _ in entry.variants] == [[{"n": 2}], [{"n": 1}]]
+
+    relations, tree = cache.get(key, lambda trace: trace[("name", "counter", "global")] == 1, "/src/x.c")
+    assert relations == [{"n": 1}] and cache.cross_file_hits == 1
+    cache.put(cache.make_key("calls", "other"), None, {}, [], None)
+    assert list(cache.table) == [cache.make_key("calls", "other")]
@@ -0,0 +1,68 @@
+"""MOUNTED_TO：注册表驱动的回调挂载与原 DELAYED_WORK 行为、查询/遍历两种模式一致"""
+import pytest
+
+from extract_mount import REGISTRATIONS, extract_mount_to_relations, make_mount_to_handler
+from extract_visitor import VisitorEngine
+
+EXPECTED = [
+    # (挂载点, 回调, 作用域, 注册者)
+    (35, 6, "global", "file_operations"),
+    (36, 7, "global", "file_operations"),
+    (30, 1, "probe", "INIT_WORK"),
+    (31, 2, "probe", "INIT_DELAYED_WORK"),
+    (32, 3, "probe", "timer_setup"),
+    (34, 4, "probe", "request_threaded_irq"),
+    (34, 5, "probe", "request_threaded_irq"),
+]
+
+
+def mount_relations(sample, use_query=True, **tables):
+    context = sample.context
+    engine = VisitorEngine(sample.code_bytes, use_query=use_query)
+    engine.register(make_mount_to_handler(
+        sample.code_bytes, context.symbol_index, sample.path, context.file_visibility,
+        context.extern_functions, file_context=context.file_context(sample.path), **tables
+    ))
+    engine.run(sample.tree.root_node)
+    return engine.collect()
+
+
+def summary(relations):
+    return [(r["head"], r["tail"], r["scope"], r["registrar"]) for r in relations]
+
+
+@pytest.mark.parametrize("use_query", [True, False])
+def test_default_registrations(sample, use_query):
+    relations = mount_relations(sample, use_query=use_query)
+    assert summary(relations) == EXPECTED
+    assert all(r["type"] == "MOUNTED_TO" and r["visibility_checked"] for r in relations)
+
+
+def test_superset_of_delayed_work_baseline(sample):
+    relations = mount_relations(sample)
+    without_registrar = [{k: v for k, v in r.items() if k != "registrar"} for r in relations]
+    for relation in sample.baseline["MOUNTED_TO"]:
+        assert relation in without_registrar
+
+
+def test_standalone_wrapper_matches_engine(sample):
+    relations = extract_mount_to_relations(
+        sample.tree.root_node, sample.code_bytes, sample.function_id_map, sample.variable_id_map,
+        sample.field_id_map, sample.path, sample.file_visibility, sample.entity_file_map
+    )
+    assert relations == mount_relations(sample)
+
+
+@pytest.mark.parametrize("use_query", [True, False])
+def test_custom_tables(sample, use_query):
+    registrations = {"INIT_WORK": REGISTRATIONS["INIT_WORK"], "timer_setup": REGISTRATIONS["timer_setup"]}
+    relations = mount_relations(
+        sample, use_query=use_query, registrations=registrations, callback_structs=frozenset()
+    )
+    assert summary(relations) == [(30, 1, "probe", "INIT_WORK"), (32, 3, "probe", "timer_setup")]
+
+
+@pytest.mark.parametrize("use_query", [True, False])
+def test_empty_registrations_keeps_callback_structs(sample, use_query):
+    relations = mount_relations(sample, use_query=use_query, registrations={})
+    assert summary(relations) == EXPECTED[:2]
@@ -0,0 +1,70 @@
+"""RelationSink：按关系字典整体去重，结果与原先列表上的 `if relation not in relations` 一致"""
+import random
+
+from extract_visitor import RelationSink, VisitorEngine
+from extract_relation_calls import make_calls_handler, extract_calls_relations
+
+
+def list_dedup(relations):
+    """原实现：列表线性扫描去重"""
+    result = []
+    for relation in relations:
+        if relation not in result:
+            result.append(relation)
+    return result
+
+
+def test_matches_list_dedup():
+    rng = random.Random(0)
+    stream = []
+    for _ in range(500):
+        relation = {"head": rng.randint(0, 9), "tail": rng.randint(0, 9), "type": rng.choice(["CALLS", "ASSIGNED_TO"])}
+        if rng.random() < 0.3:
+            relation["scope"] = rng.choice(["global", "probe"])
+        # 键的插入顺序不影响相等判断
+        items = list(relation.items())
+        rng.shuffle(items)
+        stream.append(dict(items))
+
+    sink = RelationSink(stream)
+    expected = list_dedup(stream)
+    assert list(sink) == expected
+    assert len(sink) == len(expected)
+    assert sink.duplicates == len(stream) - len(expected)
+    assert sum(sink.type_counts.values()) == len(expected)
+    assert all(relation in sink for relation in stream)
+
+
+def test_multiplicity():
+    a = {"head": 1, "tail": 2, "type": "CALLS"}
+    b = {"head": 1, "tail": 3, "type": "CALLS"}
+    sink = RelationSink(multiplicity=True)
+    assert sink.add(a)
+    assert not sink.add(dict(a))
+    assert sink.add(b)
+    assert sink.count(a) == 2
+    assert sink.count(b) == 1
+    assert sink.count({"head": 9, "tail": 9, "type": "CALLS"}) == 0
+    assert sink.type_counts == {"CALLS": 2}
+
+
+def test_calls_handler_matches_baseline(sample):
+    """sample.c 中 probe 两次调用 my_open：只保留一条关系，整体输出与原实现一致"""
+    context = sample.context
+    handler = make_calls_handler(
+        sample.code_bytes, context.symbol_index, sample.path, context.file_visibility,
+        context.extern_functions, file_context=context.file_context(sample.path)
+    )
+    relations = extract_calls_relations(
+        sample.tree.root_node, sample.code_bytes, sample.function_id_map, sample.variable_id_map,
+        sample.field_id_map, sample.path, sample.file_visibility, sample.entity_file_map, [],
+        all_entities=sample.all_entities
+    )
+    assert relations == sample.baseline["CALLS"]
+
+    engine = VisitorEngine(sample.code_bytes)
+    engine.register(handler)
+    engine.run(sample.tree.root_node)
+    assert isinstance(handler.results, RelationSink)
+    assert list(handler.results) == sample.baseline["CALLS"]
+    assert handler.results.duplicates == 1
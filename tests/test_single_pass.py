@@ -0,0 +1,169 @@
+"""单次预处理模式：-dD 输出中的宏定义跟踪与主文件宏实例扫描"""
+import subprocess
+
+import pytest
+
+gp = pytest.importorskip("test_glibc_parallel_new")
+
+HEADER = """\
+#define HMAC(x) ((x)+1)
+#define memcpy(a,b,n) __builtin_memcpy(a,b,n)
+"""
+
+MAIN = """\
+#include "a.h"
+#define SQ(x) ((x)*(x))
+void *__builtin_memcpy(void*, const void*, unsigned long);
+int f(char *a, char *b)
+{
+	memcpy(a, b, 3);
+#undef memcpy
+	memcpy(a, b, 3);
+#if 0
+	SQ(5);
+#endif
+#ifdef NOPE
+	SQ(6);
+	SQ(6);
+	SQ(6);
+	SQ(6);
+	SQ(6);
+	SQ(6);
+	SQ(6);
+	SQ(6);
+	SQ(6);
+	SQ(6);
+#else
+	return SQ(2) + HMAC(1);
+#endif
+}
+#define memcpy(a,b,n) __builtin_memcpy(a,b,n)
+int g(char *a) { memcpy(a, a, 1); return SQ(3); }
+#undef SQ
+int SQ;
+int h(int v)
+{
+	return HMAC(
+		SQ2(v));
+}
+"""
+
+
+@pytest.fixture
+def tu(tmp_path):
+    (tmp_path / "a.h").write_text(HEADER)
+    main = tmp_path / "m.c"
+    main.write_text(MAIN.replace("int h(int v)", "#define SQ2(x) ((x)*(x))\nint h(int v)"))
+    return main
+
+
+def single_pass(compiler, main):
+    out = subprocess.run(
+        [compiler, "-E", "-dD", main.name], cwd=main.parent, capture_output=True, text=True, check=True
+    ).stdout.splitlines(True)
+    definitions, active_lines = {}, set()
+    annotated = gp.AnnotatedIndex(gp.merge_annotated_lines(gp.annotate_lines(
+        gp.strip_macro_definitions(out, definitions, active_lines)
+    )))
+    macros = gp.scan_macro_instantiations(str(main), main.read_text(), definitions, active_lines)
+    return macros, definitions, annotated
+
+
+def test_definitions_follow_undef(c_compiler, tu):
+    _, definitions, _ = single_pass(c_compiler, tu)
+    # a.h 中的定义记在 #include 所在的第 1 行
+    assert definitions["memcpy"] == ([1, 7, 27], [True, None, True])
+    assert gp.definition_at(definitions, "memcpy", 6) is True
+    assert gp.definition_at(definitions, "memcpy", 8) is None
+    assert gp.definition_at(definitions, "SQ", 31) is None
+    assert gp.definition_at(definitions, "not_a_macro", 6) is None
+
+
+def test_undef_and_inactive_regions_are_skipped(c_compiler, tu):
+    macros, _, _ = single_pass(c_compiler, tu)
+    positions = [m[1:] for m in macros]
+    assert positions == [
+        [6, 2, 6, 17],      # #undef 之前的 memcpy
+        [24, 9, 24, 14],    # #else 分支
+        [24, 17, 24, 24],
+        [28, 18, 28, 33],   # 重新 #define 之后
+        [28, 42, 28, 47],
+        [34, 9, 35, 10],    # 跨行调用
+        [35, 3, 35, 9],     # 跨行调用中后续行的实参（输出中为空行）
+    ]
+
+
+def test_stripped_output_keeps_line_numbers(c_compiler, tu):
+    """去掉 #define / #undef 后的 annotated 内容与不带 -dD 的预处理输出一致"""
+    _, _, annotated = single_pass(c_compiler, tu)
+    plain = subprocess.run(
+        [c_compiler, "-E", tu.name], cwd=tu.parent, capture_output=True, text=True, check=True
+    ).stdout.splitlines(True)
+    expected = gp.AnnotatedIndex(gp.merge_annotated_lines(gp.annotate_lines(plain)))
+    assert annotated.first == expected.first
+    assert annotated.contents == expected.contents
+
+
+def test_matches_libclang_collection(c_compiler, libclang_index, tu):
+    """与 libclang 路径（collect_main_file_macros）的宏实例位置和抽取结果一致"""
+    from clang.cindex import TranslationUnit
+
+    macros, _, annotated = single_pass(c_compiler, tu)
+    parsed = libclang_index.parse(str(tu), args=[], options=TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD)
+    collected = gp.collect_main_file_macros(parsed, str(tu))
+    assert sorted(macros) == sorted(collected)
+
+    entry = {"file": str(tu)}
+    assert gp.extract_macro_list(entry, macros, annotated) == gp.extract_macro_list(entry, collected, annotated)
+
+
+# 同一 TU 的 -dD 输出：gcc 的 linemarker 从 0 开始，clang 的从 1 开始
+GCC_STREAM = """\
+# 0 "t.c"
+# 0 "<built-in>"
+#define __STDC__ 1
+#define __has_feature(x) 0
+# 0 "<command-line>"
+#define FOO 2
+# 1 "t.c"
+# 1 "a.h" 1
+#define HMAC(x) x
+# 2 "t.c" 2
+int x = FOO + HMAC(1) + __STDC__;
+#undef FOO
+"""
+
+CLANG_STREAM = """\
+# 1 "t.c"
+# 1 "<built-in>" 1
+# 1 "<built-in>" 3
+#define __STDC__ 1
+#define __has_feature(x) 0
+# 1 "<command line>" 1
+#define FOO 2
+# 1 "<built-in>" 2
+# 1 "t.c" 2
+# 1 "a.h" 1
+#define HMAC(x) x
+# 2 "t.c" 2
+int x = FOO + HMAC(1) + __STDC__;
+#undef FOO
+"""
+
+
+@pytest.mark.parametrize("stream", [GCC_STREAM, CLANG_STREAM], ids=["gcc", "clang"])
+def test_builtin_definitions_start_at_zero(stream):
+    definitions, active_lines = {}, set()
+    out = list(gp.strip_macro_definitions(stream.splitlines(True), definitions, active_lines))
+    assert definitions == {
+        "__STDC__": ([0], [False]),
+        "__has_feature": ([0], [True]),
+        "FOO": ([0, 3], [False, None]),
+        "HMAC": ([1], [True]),
+    }
+    assert active_lines == {2}
+    # 内建宏和命令行宏在主文件第 1 行就已定义
+    assert gp.definition_at(definitions, "__STDC__", 1) is False
+    assert gp.definition_at(definitions, "FOO", 2) is False
+    assert gp.definition_at(definitions, "FOO", 4) is None
+    assert [line for line in out if not line.startswith("#")][-2:] == ["int x = FOO + HMAC(1) + __STDC__;\n", "\n"]
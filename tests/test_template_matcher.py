@@ -0,0 +1,53 @@
+"""日志行 -> FAIL_TEMPLATE：整块规范化与逐行一致，索引匹配与逐个模板校验的结果一致"""
+import sys
+import random
+
+import pytest
+
+import extract_template_matcher as tm
+from extract_fail_message import extract_template_regex
+
+
+def test_chunk_spaces_cover_str_isspace():
+    spaces = {chr(c) for c in range(sys.maxunicode + 1) if chr(c).isspace()}
+    assert set(tm._LINE_SPACES) == spaces - {'\n', ' '}
+
+
+def test_normalize_chunk_matches_normalize_line():
+    rng = random.Random(1)
+    alphabet = ['a', 'b', '[', ']', '1', '.', '2', ' ', '  ', '\t', '"', '\\', '\r', '\x0b', '\x85',
+                '\u3000', '\xa0', '\u2028', '0.5', ' [1.5] ', '\n']
+    for _ in range(5000):
+        lines = [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 8))) for _ in range(rng.randint(1, 4))]
+        assert tm.normalize_chunk(lines) == [tm.normalize_line(line) for line in lines]
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = random.Random(0)
+    vocabulary = tm._synthetic_vocabulary(rng, size=300)
+    formats = {}
+    while len(formats) < 400:
+        fmt = tm._synthetic_format(rng, vocabulary)
+        template = extract_template_regex(fmt)
+        if template and template not in formats:
+            formats[template] = fmt
+    matcher = tm.TemplateMatcher([(str(i), template) for i, template in enumerate(formats)])
+    fmts = list(formats.values())
+    lines = [tm._render(rng.choice(fmts), rng) for _ in range(1500)]
+    lines += [' '.join(f"zz{rng.getrandbits(32):x}" for _ in range(6)) for _ in range(100)]
+    return matcher, tm.normalize_chunk(lines)
+
+
+@pytest.mark.parametrize("scan_limit", [0, 1 << 30])
+def test_index_matches_exhaustive_scan(corpus, scan_limit, monkeypatch):
+    """片段模板无论走自动机（scan_limit=0）还是逐个子串检查，都取到得分最高的可匹配模板"""
+    matcher, normalized = corpus
+    monkeypatch.setattr(matcher, "FRAGMENT_SCAN_LIMIT", scan_limit)
+    assert any(not required for required in matcher.required)
+    for line, got in zip(normalized, matcher.match_normalized_chunk(normalized)):
+        best = max((matcher.scores[t] for t, pattern in enumerate(matcher.patterns) if pattern.search(line)), default=0)
+        if got is None:
+            assert best == 0, line
+        else:
+            assert matcher.patterns[got].search(line) and matcher.scores[got] == best, line
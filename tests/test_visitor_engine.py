@@ -0,0 +1,103 @@
+"""VisitorEngine：查询模式（tree-sitter 查询定位候选）与遍历模式（TreeCursor）分发结果一致"""
+import pytest
+
+from extract_visitor import Handler, VisitorEngine, find_first, run_handler
+from extract_relation_calls import make_calls_handler
+from extract_relation_assignedto import make_assigned_to_handler
+from extract_mount import make_mount_to_handler
+from extract_fail_message import FailMessages, local_id_counter, make_fail_message_handler
+
+NESTED = b"""
+int outer(void)
+{
+    f(g(h(1)), k(2));
+    return m(n(3));
+}
+int global_init = p(q(4));
+void inner(void) { f(r(5)); }
+"""
+
+
+def fused_relations(sample, use_query):
+    context = sample.context
+    file_context = context.file_context(sample.path)
+    engine = VisitorEngine(sample.code_bytes, use_query=use_query)
+    for make_handler in (make_calls_handler, make_assigned_to_handler, make_mount_to_handler):
+        engine.register(make_handler(
+            sample.code_bytes, context.symbol_index, sample.path, context.file_visibility,
+            context.extern_functions, file_context=file_context
+        ))
+    messages = FailMessages()
+    engine.register(make_fail_message_handler(
+        sample.code_bytes, sample.path, local_id_counter(), {"probe": 9}, messages
+    ))
+    engine.register(Handler("FILE", on_file=lambda root: [{"head": root.type, "tail": None, "type": "FILE"}]))
+    engine.run(sample.tree.root_node)
+    return engine.collect(), messages
+
+
+def test_query_mode_matches_cursor_mode(sample):
+    by_query, query_messages = fused_relations(sample, use_query=True)
+    by_cursor, cursor_messages = fused_relations(sample, use_query=False)
+    assert by_query == by_cursor
+    assert query_messages.entities == cursor_messages.entities
+    assert query_messages.relations == cursor_messages.relations
+    # 包括不是调用本身、但以 printf 调用开头的语句 printf(...) + 1;
+    assert [e["name"] for e in query_messages.entities if e["type"] == "FAIL_TEMPLATE"] == [
+        "probe: no irq xxx", "probe: irq xxx ready"
+    ]
+    assert [r["head"] for r in query_messages.relations if r["type"] == "HAS_MESSAGE"] == [9, 9]
+
+    def of_type(relation_type):
+        return [r for r in by_query if r["type"] == relation_type]
+    # 与引入引擎之前逐个提取函数的输出一致
+    assert of_type("CALLS") == sample.baseline["CALLS"]
+    assert of_type("ASSIGNED_TO") == sample.baseline["ASSIGNED_TO"]
+    assert of_type("FILE") == [{"head": "translation_unit", "tail": None, "type": "FILE"}]
+
+
+def recording_handler(code_bytes, name, skip=()):
+    """记录 (被调用名, 作用域)；被调用名在 skip 中时跳过该调用的子树"""
+    seen = []
+
+    def visit(node, scope):
+        callee = node.child_by_field_name("function")
+        text = code_bytes[callee.start_byte:callee.end_byte].decode()
+        seen.append((text, scope))
+        return text in skip
+
+    return Handler(name, ("call_expression",), visit=visit, results=seen)
+
+
+@pytest.mark.parametrize("use_query", [True, False])
+def test_scope_and_per_handler_skip(c_parser, use_query):
+    tree = c_parser.parse(NESTED)
+    engine = VisitorEngine(NESTED, use_query=use_query)
+    skipping = engine.register(recording_handler(NESTED, "skipping", skip={"f", "m"}))
+    full = engine.register(recording_handler(NESTED, "full"))
+    engine.run(tree.root_node)
+
+    # 跳过只对返回 True 的处理器生效
+    assert skipping.results == [("f", "outer"), ("m", "outer"), ("p", None), ("q", None), ("f", "inner")]
+    assert full.results == [
+        ("f", "outer"), ("g", "outer"), ("h", "outer"), ("k", "outer"),
+        ("m", "outer"), ("n", "outer"), ("p", None), ("q", None), ("f", "inner"), ("r", "inner"),
+    ]
+
+
+def test_deep_nesting_does_not_recurse(c_parser):
+    depth = 3000
+    code = b"int deep(void) { return " + b"(" * depth + b"x(1)" + b")" * depth + b"; }\n"
+    tree = c_parser.parse(code)
+    assert find_first(tree.root_node, ("call_expression",)) is not None
+    for use_query in (True, False):
+        engine = VisitorEngine(code, use_query=use_query)
+        handler = engine.register(recording_handler(code, "calls"))
+        engine.run(tree.root_node)
+        assert handler.results == [("x", "deep")]
+
+
+def test_run_handler_uses_single_handler(c_parser):
+    tree = c_parser.parse(NESTED)
+    results = run_handler(tree.root_node, NESTED, recording_handler(NESTED, "calls", skip={"f"}))
+    assert [name for name, _ in results] == ["f", "m", "n", "p", "q", "f"]